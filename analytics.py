@@ -0,0 +1,565 @@
+"""
+Backends de agregación para las funciones create_* de data_processing.
+
+Las visualizaciones solo piden unas pocas agregaciones sobre el subconjunto
+filtrado: totales de defunciones por una o varias columnas (opcionalmente
+de una familia de causas), rankings top-K, el total y el periodo que cubren
+los datos. Un backend entrega para cada combinación de filtros una vista con
+esas operaciones:
+
+    pandas   CubeView sobre el cubo de conteos en memoria (el subconjunto
+             lo da el motor de consultas, ver query_engine.py)
+    duckdb   DuckDBView: SQL con DuckDB embebido directamente sobre los
+             Parquet del almacén multianual (ingest.py) o, sin almacén, la
+             caché Parquet de Anexo1
+
+Con DuckDB cada consulta lee solo las columnas que usa y solo los archivos
+de los años y departamentos filtrados; los group-by corren en varios hilos
+(DUCKDB_THREADS) y, pasado DUCKDB_MEMORY_MB, se apoyan en disco
+(Data/cache/duckdb/), así que dibujar los gráficos no exige tener los
+registros ni el cubo en la memoria del worker. ANALYTICS_BACKEND=duckdb lo
+activa en app.py; si DuckDB no se puede usar (paquete no instalado, sin
+Parquet de registros) la carga falla en vez de volver a pandas en silencio.
+
+Las dos vistas deben dar exactamente los mismos resultados. La comprobación
+corre sobre los datos reales, con varias combinaciones de filtros y todas
+las figuras:
+
+    python analytics.py [--filtros '{"departamento": [5]}' ...]
+
+tests/test_analytics.py repite la de agregaciones y rankings sobre un
+almacén sintético (synthetic_data.py), sin los archivos reales.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+
+from data_cache import CACHE_DIR, DIVIPOLA_FILE, MORTALITY_FILE, cache_path, is_cache_fresh, read_excel_cached
+from icd10 import FAMILY_COLUMN, cause_families
+from ranking import DEFAULT_TIES, TIE_MODES, rank_groups
+
+try:
+    import duckdb
+    DUCKDB_DISPONIBLE = True
+except ImportError:
+    DUCKDB_DISPONIBLE = False
+
+BACKENDS = ('pandas', 'duckdb')
+DEFAULT_BACKEND = 'pandas'
+DUCKDB_TEMP_DIR = os.path.join(CACHE_DIR, 'duckdb')
+
+# Mismos nombres que data_processing.YEAR_COLUMN y DEFAULT_PERIOD (no se importa aquí: ese módulo importa este)
+YEAR_COLUMN = 'AÑO'
+DEFAULT_PERIOD = '2019'
+RECORD_COLUMNS = ['COD_DEPARTAMENTO', 'COD_MUNICIPIO', 'MES', 'SEXO', 'GRUPO_EDAD1', 'COD_MUERTE']
+NAME_COLUMNS = ['DEPARTAMENTO', 'MUNICIPIO']
+RATES_COLUMNS = ['COD_DEPARTAMENTO', 'COD_MUNICIPIO', 'SEXO', 'GRUPO_EDAD1', 'DEPARTAMENTO', 'MUNICIPIO']
+
+# Filtro del motor de consultas -> expresión SQL sobre los registros (alias r)
+FILTER_EXPRESSIONS = {
+    'anio': f'r."{YEAR_COLUMN}"',
+    'departamento': 'r.COD_DEPARTAMENTO',
+    'municipio': 'CAST(r.COD_DEPARTAMENTO AS INTEGER) * 1000 + r.COD_MUNICIPIO',
+    'mes': 'r.MES',
+    'sexo': 'r.SEXO',
+    'grupo_edad': 'r.GRUPO_EDAD1'
+}
+
+
+def backend_name():
+    name = os.environ.get('ANALYTICS_BACKEND', DEFAULT_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"ANALYTICS_BACKEND desconocido: {name!r} (use {BACKENDS})")
+    return name
+
+
+class CubeView:
+    """Agregaciones sobre un cubo de conteos (o un subconjunto) en memoria.
+
+    `filters` son los que produjeron el subconjunto y `years` los años de
+    todos los datos: las tasas los usan para la población en riesgo. Sin
+    ellos se trata el cubo como el conjunto completo.
+    """
+
+    def __init__(self, cube, filters=None, years=None):
+        self.cube = cube
+        self.filters = filters or {}
+        self._years = years
+
+    def _family_mask(self, family):
+        return None if family is None else (self.cube[FAMILY_COLUMN] == family).to_numpy()
+
+    def total(self, family=None):
+        """Total de defunciones (de una familia de causas, si se indica)"""
+        counts = self.cube['TOTAL_MUERTES'].to_numpy()
+        if family is not None:
+            counts = counts[self._family_mask(family)]
+        return int(counts.sum())
+
+    def totals(self, by, family=None, dropna=True):
+        """DataFrame [*by, TOTAL_MUERTES] ordenado por `by`"""
+        cube = self.cube if family is None else self.cube[self._family_mask(family)]
+        return cube.groupby(list(by), observed=True, dropna=dropna)['TOTAL_MUERTES'].sum().reset_index()
+
+    def rank(self, by, k, largest=True, ties=DEFAULT_TIES, family=None, min_total=None, name=None):
+        """Los K grupos de `by` de mayor (o menor) total, como ranking.rank_groups"""
+        return rank_groups(self.cube, by, k, largest, ties, mask=self._family_mask(family),
+                           min_total=min_total, name=name)
+
+    def period(self):
+        from data_processing import period_label
+
+        return period_label(self.cube)
+
+    def rates_cube(self):
+        """Cubo con las columnas que usa rates.RatesEngine"""
+        return self.cube
+
+    def data_years(self):
+        """Años de todos los datos (no solo del subconjunto); None si no se conocen"""
+        return self._years
+
+
+def as_view(data):
+    """Vista de agregación de un cubo; las vistas se devuelven tal cual"""
+    return data if hasattr(data, 'totals') else CubeView(data)
+
+
+class PandasBackend:
+    """Vistas sobre el cubo en memoria, filtrado por el motor de consultas"""
+
+    name = 'pandas'
+
+    def __init__(self, query_engine):
+        self.query_engine = query_engine
+        cube = query_engine.cube
+        self.years = sorted(int(year) for year in cube[YEAR_COLUMN].dropna().unique()) if YEAR_COLUMN in cube.columns else None
+
+    def view(self, filters):
+        return CubeView(self.query_engine.filtered_cube(filters), filters, self.years)
+
+
+def _sql_list(values):
+    # Los valores de todos los filtros son numéricos; int() impide inyectar SQL
+    return ', '.join(str(int(value)) for value in values)
+
+
+def _quote(path):
+    return "'" + path.replace("'", "''") + "'"
+
+
+def record_sources():
+    """Archivos Parquet de registros [(ruta, (año, departamento) o None)] y si tienen columna AÑO.
+
+    Con el almacén de ingest.py cada archivo es una partición (año,
+    departamento); si no, se usa la caché Parquet de Anexo1.
+    """
+    import pyarrow.parquet as pq
+    from ingest import iter_partitions, store_years
+
+    if store_years():
+        return [(path, (year, department)) for year, department, path in iter_partitions()], True
+    if not is_cache_fresh(MORTALITY_FILE):
+        raise FileNotFoundError(f"No hay almacén multianual ni caché Parquet vigente de {MORTALITY_FILE}")
+    path = cache_path(MORTALITY_FILE)
+    columns = pq.read_schema(path).names
+    missing = [column for column in RECORD_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"La caché de Anexo1 no tiene las columnas {missing}")
+    return [(path, None)], YEAR_COLUMN in columns
+
+
+class DuckDBBackend:
+    """Consultas SQL de DuckDB sobre los Parquet de registros.
+
+    Las tablas pequeñas de apoyo (nombres de divipola; familia y capítulo
+    CIE-10 de cada código presente) se cargan una vez en la base en memoria;
+    los registros nunca: cada consulta los lee de los Parquet.
+    """
+
+    name = 'duckdb'
+
+    def __init__(self, death_codes=None, divipola=None, threads=None, memory_mb=None):
+        if not DUCKDB_DISPONIBLE:
+            raise ImportError("El paquete duckdb no está instalado")
+        self.files, self.has_year = record_sources()
+        self.connection = duckdb.connect()
+        self._lock = threading.Lock()
+        self._data_years = None
+
+        # GLOBAL: los cursores de cada consulta son sesiones propias
+        threads = threads or int(os.environ.get('DUCKDB_THREADS', 0))
+        memory_mb = memory_mb or int(os.environ.get('DUCKDB_MEMORY_MB', 0))
+        if threads:
+            self.connection.execute(f"SET GLOBAL threads = {int(threads)}")
+        if memory_mb:
+            self.connection.execute(f"SET GLOBAL memory_limit = '{int(memory_mb)}MB'")
+        os.makedirs(DUCKDB_TEMP_DIR, exist_ok=True)
+        self.connection.execute(f"SET GLOBAL temp_directory = {_quote(os.path.abspath(DUCKDB_TEMP_DIR))}")
+        # Los metadatos de cada Parquet se leen una vez y no en cada consulta
+        # (el parámetro no existe en todas las versiones de DuckDB, p. ej. 1.1)
+        try:
+            self.connection.execute("SET GLOBAL parquet_metadata_cache = true")
+        except duckdb.Error:
+            pass
+
+        if divipola is None:
+            divipola = read_excel_cached(DIVIPOLA_FILE)
+        places = divipola[['COD_DEPARTAMENTO', 'COD_MUNICIPIO'] + NAME_COLUMNS].drop_duplicates(
+            ['COD_DEPARTAMENTO', 'COD_MUNICIPIO'])
+        self._create_table('lugares', places)
+        self._create_table('causas', self._cause_table(death_codes))
+
+    def _create_table(self, name, frame):
+        self.connection.register('_tabla', frame)
+        try:
+            self.connection.execute(f"CREATE OR REPLACE TABLE {name} AS SELECT * FROM _tabla")
+        finally:
+            self.connection.unregister('_tabla')
+
+    def _cause_table(self, death_codes):
+        """Familia y capítulo de cada código presente (se clasifican una vez, no por consulta)"""
+        from query_engine import cause_chapters
+
+        codes = self.connection.execute(
+            f"SELECT DISTINCT COD_MUERTE FROM {self._source(None)} r WHERE COD_MUERTE IS NOT NULL"
+        ).df()['COD_MUERTE'].astype(object)
+        return pd.DataFrame({
+            'COD_MUERTE': codes,
+            FAMILY_COLUMN: pd.Series(cause_families(codes)).astype(object),
+            'CAPITULO': cause_chapters(codes, death_codes).to_numpy(dtype='float64')
+        })
+
+    def _source(self, filters):
+        """read_parquet de los archivos que pueden tener filas para los filtros de año y departamento"""
+        filters = filters or {}
+
+        def selected(name):
+            values = filters.get(name)
+            if values is None or values == []:
+                return None
+            return {int(value) for value in (values if isinstance(values, (list, tuple, set)) else [values])}
+
+        years, departments = selected('anio'), selected('departamento')
+        municipalities = selected('municipio')
+        if municipalities is not None:
+            by_municipality = {code // 1000 for code in municipalities}
+            departments = by_municipality if departments is None else departments & by_municipality
+
+        paths = [
+            path for path, partition in self.files
+            if partition is None or (
+                (years is None or partition[0] in years) and (departments is None or partition[1] in departments))
+        ]
+        # Sin archivos que coincidan basta uno: las condiciones del WHERE no dejan pasar filas
+        paths = paths or [self.files[0][0]]
+        return f"read_parquet([{', '.join(_quote(path) for path in paths)}], hive_partitioning = false)"
+
+    def _where(self, filters, family=None, not_null=()):
+        from query_engine import FILTERS
+
+        conditions, params = [], []
+        for name, selected in (filters or {}).items():
+            if name not in FILTERS:
+                raise ValueError(f"Filtro desconocido: {name}")
+            if selected is None or selected == []:
+                continue
+            if not isinstance(selected, (list, tuple, set)):
+                selected = [selected]
+            if name == 'capitulo':
+                conditions.append(f"r.COD_MUERTE IN (SELECT COD_MUERTE FROM causas WHERE CAPITULO IN ({_sql_list(selected)}))")
+            elif name == 'anio' and not self.has_year:
+                # Como el motor de consultas: sin columna de año ningún año coincide
+                conditions.append('FALSE')
+            else:
+                conditions.append(f"{FILTER_EXPRESSIONS[name]} IN ({_sql_list(selected)})")
+        if family is not None:
+            conditions.append(f"r.COD_MUERTE IN (SELECT COD_MUERTE FROM causas WHERE {FAMILY_COLUMN} = ?)")
+            params.append(family)
+        conditions.extend(f"{expression} IS NOT NULL" for expression in not_null)
+        return (' WHERE ' + ' AND '.join(conditions)) if conditions else '', params
+
+    def query(self, sql, params=()):
+        """DataFrame con el resultado; cada llamada usa su propio cursor (DuckDB no comparte uno entre hilos)"""
+        with self._lock:
+            cursor = self.connection.cursor()
+        try:
+            return cursor.execute(sql, list(params)).df()
+        finally:
+            cursor.close()
+
+    def _column(self, column):
+        if column in NAME_COLUMNS:
+            return f'l.{column}'
+        if column == YEAR_COLUMN:
+            return f'r."{YEAR_COLUMN}"'
+        return f'r.{column}'
+
+    def totals(self, filters, by, family=None, dropna=True):
+        expressions = [self._column(column) for column in by]
+        join = ''
+        if any(column in NAME_COLUMNS for column in by):
+            join = ' LEFT JOIN lugares l ON l.COD_DEPARTAMENTO = r.COD_DEPARTAMENTO AND l.COD_MUNICIPIO = r.COD_MUNICIPIO'
+        where, params = self._where(filters, family, expressions if dropna else ())
+        keys = ', '.join(f'{expression} AS "{column}"' for expression, column in zip(expressions, by))
+        positions = ', '.join(str(i + 1) for i in range(len(by)))
+        return self.query(
+            f"SELECT {keys}, COUNT(*) AS TOTAL_MUERTES FROM {self._source(filters)} r{join}{where} "
+            f"GROUP BY {positions} ORDER BY {', '.join(f'{i + 1} NULLS LAST' for i in range(len(by)))}",
+            params
+        )
+
+    def total(self, filters, family=None):
+        where, params = self._where(filters, family)
+        return int(self.query(f"SELECT COUNT(*) AS TOTAL FROM {self._source(filters)} r{where}", params)['TOTAL'].iloc[0])
+
+    def years(self, filters):
+        """(primer año, último año) del subconjunto, o None"""
+        if not self.has_year:
+            return None
+        year = f'r."{YEAR_COLUMN}"'
+        where, params = self._where(filters, not_null=[year])
+        row = self.query(f"SELECT MIN({year}) AS PRIMERO, MAX({year}) AS ULTIMO FROM {self._source(filters)} r{where}", params)
+        if row.empty or pd.isna(row['PRIMERO'].iloc[0]):
+            return None
+        return int(row['PRIMERO'].iloc[0]), int(row['ULTIMO'].iloc[0])
+
+    def data_years(self):
+        """Años presentes en los registros (se consultan una vez); None sin columna de año"""
+        if not self.has_year:
+            return None
+        if self._data_years is None:
+            year = f'r."{YEAR_COLUMN}"'
+            rows = self.query(f"SELECT DISTINCT {year} AS ANIO FROM {self._source({})} r WHERE {year} IS NOT NULL ORDER BY 1")
+            self._data_years = [int(value) for value in rows['ANIO']]
+        return self._data_years
+
+    def view(self, filters):
+        return DuckDBView(self, filters)
+
+
+class DuckDBView:
+    """Las operaciones de CubeView resueltas con SQL para unos filtros"""
+
+    def __init__(self, backend, filters):
+        self.backend = backend
+        self.filters = filters
+
+    def total(self, family=None):
+        return self.backend.total(self.filters, family)
+
+    def totals(self, by, family=None, dropna=True):
+        return self.backend.totals(self.filters, list(by), family, dropna)
+
+    def rank(self, by, k, largest=True, ties=DEFAULT_TIES, family=None, min_total=None, name=None):
+        # SQL solo agrega (unos miles de grupos a lo sumo); la selección top-K y
+        # los empates son los de ranking.py, con los grupos en el orden de las
+        # categorías del cubo (alfabético)
+        totals = self.totals([by], family)
+        totals[by] = totals[by].astype('category')
+        return rank_groups(totals, by, k, largest, ties, min_total=min_total, name=name)
+
+    def period(self):
+        years = self.backend.years(self.filters)
+        if years is None:
+            return DEFAULT_PERIOD
+        first, last = years
+        return str(first) if first == last else f"{first}-{last}"
+
+    def rates_cube(self):
+        columns = ([YEAR_COLUMN] if self.backend.has_year else []) + RATES_COLUMNS
+        return self.totals(columns, dropna=False)
+
+    def data_years(self):
+        return self.backend.data_years()
+
+
+def load_backend(query_engine, death_codes=None, divipola=None, name=None):
+    """Backend de ANALYTICS_BACKEND.
+
+    Si se pidió DuckDB y no se puede armar, el error se propaga: un backend
+    roto no debe quedar oculto detrás de pandas.
+    """
+    name = name or backend_name()
+    if name == 'duckdb':
+        try:
+            backend = DuckDBBackend(death_codes, divipola)
+        except Exception as e:
+            raise RuntimeError(f"ANALYTICS_BACKEND=duckdb pero el backend DuckDB no se pudo armar: {e}") from e
+        print(f"Backend de análisis: DuckDB sobre {len(backend.files)} archivos Parquet")
+        return backend
+    return PandasBackend(query_engine)
+
+
+# Agregaciones y rankings que piden las funciones create_* y los indicadores
+CHECK_TOTALS = [
+    (['COD_DEPARTAMENTO'], None),
+    (['COD_DEPARTAMENTO', 'COD_MUNICIPIO', 'MUNICIPIO'], None),
+    (['MES'], None),
+    (['DEPARTAMENTO', 'SEXO'], None),
+    (['GRUPO_EDAD1'], None),
+    (['MUNICIPIO'], 'homicidio')
+]
+CHECK_RANKINGS = [
+    ('MUNICIPIO', True, 'homicidio', None),
+    ('MUNICIPIO', False, None, 100),
+    ('COD_MUERTE', True, None, None),
+    ('DEPARTAMENTO', True, None, None)
+]
+CHECK_SIZES = [1, 5, 10, 15]
+
+
+def default_check_filters(cube):
+    """Combinaciones de filtros de la comprobación, a partir de los datos presentes"""
+    counts = cube['TOTAL_MUERTES']
+    department = int(cube.groupby('COD_DEPARTAMENTO', observed=True)['TOTAL_MUERTES'].sum().idxmax())
+    municipality = cube.groupby(['COD_DEPARTAMENTO', 'COD_MUNICIPIO'], observed=True)['TOTAL_MUERTES'].sum().idxmax()
+    checks = [
+        {},
+        {'departamento': [department]},
+        {'municipio': [int(municipality[0]) * 1000 + int(municipality[1])]},
+        {'sexo': [2], 'grupo_edad': list(range(14, 20))},
+        {'mes': [1, 2, 3], 'capitulo': [20]},
+        {'departamento': [department], 'capitulo': [2, 9]},
+        {'departamento': [99]}
+    ]
+    if YEAR_COLUMN in cube.columns and counts.sum():
+        years = sorted(int(year) for year in cube[YEAR_COLUMN].dropna().unique())
+        checks.append({'anio': years[:1]})
+        checks.append({'anio': years[-2:], 'departamento': [department], 'sexo': [1]})
+    return checks
+
+
+def _normalized(frame):
+    """Copia comparable: sin índice y categóricas como objetos"""
+    frame = frame.reset_index(drop=True)
+    return frame.astype({column: object for column in frame.columns if isinstance(frame[column].dtype, pd.CategoricalDtype)})
+
+
+def _first_difference(expected, actual, path=''):
+    """Primera ruta (p. ej. data[0].y[3]) en que difieren dos figuras serializadas, o None"""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in sorted(set(expected) | set(actual)):
+            found = _first_difference(expected.get(key), actual.get(key), f"{path}.{key}" if path else key)
+            if found:
+                return found
+        return None
+    if isinstance(expected, list) and isinstance(actual, list) and len(expected) == len(actual):
+        for i, (left, right) in enumerate(zip(expected, actual)):
+            found = _first_difference(left, right, f"{path}[{i}]")
+            if found:
+                return found
+        return None
+    if expected != actual:
+        return f"{path}: {str(expected)[:80]} != {str(actual)[:80]}"
+    return None
+
+
+def _compare(label, expected, actual, differences):
+    if isinstance(expected, pd.DataFrame):
+        try:
+            pd.testing.assert_frame_equal(_normalized(expected), _normalized(actual), check_dtype=False,
+                                          check_index_type=False, check_column_type=False)
+        except AssertionError as e:
+            differences.append(f"{label}: {str(e).splitlines()[0]}")
+    elif isinstance(expected, dict):
+        difference = _first_difference(expected, actual)
+        if difference:
+            differences.append(f"{label}: {difference}")
+    elif expected != actual:
+        differences.append(f"{label}: {expected!r} != {actual!r}")
+
+
+def _figure_results(view, death_codes):
+    """Figuras (como dict) y tabla de causas construidas desde una vista"""
+    import data_processing
+    from figure_bundle import summary_stats
+
+    builders = {
+        'mapa': data_processing.create_mortality_map,
+        'mapa-municipios': data_processing.create_municipality_map,
+        'mensual': data_processing.create_monthly_timeline,
+        'ciudades-violentas': data_processing.create_violent_cities_chart,
+        'ciudades-seguras': data_processing.create_safest_cities_chart,
+        'sexo-departamento': data_processing.create_gender_by_department_chart,
+        'grupos-edad': data_processing.create_age_groups_histogram
+    }
+    # Las funciones create_* imprimen sus tablas intermedias; aquí sobran
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = {name: json.loads(builder(view).to_json()) for name, builder in builders.items()}
+        results['tabla-causas'] = data_processing.create_death_causes_table(view, death_codes)
+        results['indicadores'] = summary_stats(view)
+    return results
+
+
+def check_parity(pandas_backend, duckdb_backend, filters, death_codes=None, figures=True):
+    """Diferencias entre los dos backends para unos filtros, y el tiempo de cada uno
+
+    Con figures=False sólo se comparan las agregaciones (CHECK_TOTALS,
+    CHECK_RANKINGS, total y periodo), sin armar las figuras del tablero.
+    """
+    differences = []
+    results, timings = {}, {}
+    for backend in (pandas_backend, duckdb_backend):
+        start = time.perf_counter()
+        view = backend.view(filters)
+        outcome = {
+            'total': view.total(),
+            'homicidios': view.total('homicidio'),
+            'periodo': view.period()
+        }
+        for by, family in CHECK_TOTALS:
+            outcome[f"totales {by} {family or ''}"] = view.totals(by, family)
+        for by, largest, family, min_total in CHECK_RANKINGS:
+            for k in CHECK_SIZES:
+                for ties in TIE_MODES:
+                    outcome[f"ranking {by} k={k} {ties} {'mayores' if largest else 'menores'} {family or ''}"] = view.rank(
+                        by, k, largest, ties, family, min_total)
+        if figures:
+            outcome.update(_figure_results(view, death_codes))
+        timings[backend.name] = time.perf_counter() - start
+        results[backend.name] = outcome
+
+    for label, expected in results['pandas'].items():
+        _compare(label, expected, results['duckdb'][label], differences)
+    return differences, timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara los resultados del backend DuckDB con los de pandas")
+    parser.add_argument('--filtros', action='append', type=json.loads, default=None,
+                        help="Filtros en JSON, p. ej. '{\"departamento\": [5], \"sexo\": [1]}' (se puede repetir)")
+    args = parser.parse_args()
+
+    if not DUCKDB_DISPONIBLE:
+        raise SystemExit("El paquete duckdb no está instalado (pip install duckdb)")
+
+    from query_engine import MortalityQueryEngine
+    from shared_dataset import load_shared_cube
+
+    mortality_cube, death_codes, divipola = load_shared_cube()
+    pandas_backend = PandasBackend(MortalityQueryEngine(mortality_cube, death_codes))
+    duckdb_backend = DuckDBBackend(death_codes, divipola)
+    print(f"DuckDB sobre {len(duckdb_backend.files)} archivos Parquet; pandas sobre {len(mortality_cube):,} celdas")
+
+    failures = 0
+    for filters in args.filtros or default_check_filters(mortality_cube):
+        differences, timings = check_parity(pandas_backend, duckdb_backend, filters, death_codes)
+        status = 'OK   ' if not differences else 'FALLA'
+        print(f"{status} {json.dumps(filters, ensure_ascii=False)}  "
+              f"pandas {1000 * timings['pandas']:.0f} ms, duckdb {1000 * timings['duckdb']:.0f} ms")
+        for difference in differences:
+            print(f"      {difference}")
+        failures += bool(differences)
+
+    if failures:
+        print(f"{failures} combinaciones de filtros con diferencias")
+        sys.exit(1)
+    print("Los dos backends coinciden")
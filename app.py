@@ -1,56 +1,185 @@
 import dash
-from dash import dcc, html, dash_table
+from dash import dcc, html, dash_table, ctx, Input, Output, State, no_update
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
-import pandas as pd
-
-from data_processing import (
-	load_and_process_data,
-	create_mortality_map,
-	create_monthly_timeline,
-	create_violent_cities_chart,
-	create_safest_cities_chart,
-	create_death_causes_table,
-	create_gender_by_department_chart,
-	create_age_groups_histogram
-)
+import math
+import os
+import threading
+
+from figure_bundle import BUNDLE_FORMAT, filter_options, load_bundle, summary_stats
+from export_service import DATA_TARGET, FAILED, PENDING, READY, ExportService, register_routes as register_export_routes
+from http_cache import StaticFigures, install as install_http_cache
+from geometry import DEFAULT_LEVEL, MUNICIPALITIES_GEOJSON_FILE, level_for_zoom
+from instrumentation import add_collector, figure_cache_collector, instrument
+from warmup import Warmup, warmup_enabled
 
 # Inicializar la aplicación
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
-app.title = "Análisis de Mortalidad en Colombia 2019"
 server = app.server  # Para despliegue en PaaS
 
 # Cargar datos
 print("Iniciando aplicación...")
-print("Cargando datos...")
-
-try:
-	mortality_data, death_codes, divipola = load_and_process_data()
-
-	# Generar todas las visualizaciones
-	print("Generando visualizaciones...")
-	map_fig = create_mortality_map(mortality_data)
-	timeline_fig = create_monthly_timeline(mortality_data)
-	violent_cities_fig = create_violent_cities_chart(mortality_data)
-	safest_cities_fig = create_safest_cities_chart(mortality_data)
-	death_causes_df = create_death_causes_table(mortality_data, death_codes)
-	gender_dept_fig = create_gender_by_department_chart(mortality_data)
-	age_groups_fig = create_age_groups_histogram(mortality_data)
-
-	print("Aplicación lista!")
-
-except Exception as e:
-	print(f"Error: {e}")
-	# Crear figuras vacías en caso de error
-	map_fig = timeline_fig = violent_cities_fig = safest_cities_fig = {}
-	gender_dept_fig = age_groups_fig = {}
-	death_causes_df = pd.DataFrame([
-		{'CODIGO': 'Error', 'TOTAL_CASOS': 0, 'DESCRIPCION': 'Error cargando datos'}
-	])
-	mortality_data = pd.DataFrame({
-		'COD_DEPARTAMENTO': [0],
-		'DEPARTAMENTO': ['Error'],
-		'MUNICIPIO': ['Error']
-	})
+
+# Figuras precalculadas en el build (python figure_bundle.py); no requiere pandas.
+# Sin paquete no se calcula nada aquí: cada gráfico se construye (y queda en
+# la caché de figuras) la primera vez que se muestra, y las opciones de los
+# filtros salen del cubo cuando la precarga lo carga.
+bundle = load_bundle()
+
+if bundle is None:
+	print("Paquete de figuras no disponible, las visualizaciones se calcularán bajo demanda")
+	bundle = {
+		'figures': {},
+		'death_causes': [],
+		'death_causes_pages': 1,
+		'stats': ['…', '…', '…', '…'],
+		'options': {}
+	}
+
+figures = bundle['figures']
+death_causes_records = bundle['death_causes']
+total_deaths_text, total_departments_text, total_municipalities_text, total_homicides_text = bundle['stats']
+filter_opts = bundle['options']
+# Figuras del paquete como JSON estático con URL versionada (ver http_cache.py)
+static_figures = StaticFigures(figures, bundle['data_version']) if figures else None
+# Filas por página de la tabla de causas (causes_table.DEFAULT_PAGE_SIZE, sin importar pandas aquí)
+CAUSES_PAGE_SIZE = 10
+# Opciones de K de los rankings; sin elegir, cada gráfico usa su K por defecto
+RANKING_SIZES = [5, 10, 15, 20, 25]
+# Gráficos que se pueden exportar como imagen (identificador -> nombre)
+EXPORT_CHARTS = {
+	'mapa': 'Mapa por departamento',
+	'mensual': 'Evolución mensual',
+	'ciudades-violentas': 'Ciudades más violentas',
+	'ciudades-seguras': 'Ciudades con menor mortalidad',
+	'sexo-departamento': 'Muertes por sexo en departamentos',
+	'grupos-edad': 'Distribución por grupos de edad'
+}
+EXPORT_OPTIONS = [
+	{'label': 'Datos filtrados (CSV)', 'value': f'{DATA_TARGET}:csv'},
+	{'label': 'Datos filtrados (Parquet)', 'value': f'{DATA_TARGET}:parquet'}
+] + [
+	{'label': f"{name} ({fmt.upper()})", 'value': f'{chart_id}:{fmt}'}
+	for chart_id, name in EXPORT_CHARTS.items() for fmt in ('png', 'svg')
+]
+
+
+
+def data_period(options):
+	"""Periodo de los datos: 2019 o el rango de años del almacén de ingest.py"""
+	years = [option['value'] for option in options.get('anio', [])]
+	return f"{years[0]}-{years[-1]}" if len(years) > 1 else str(years[0]) if years else "2019"
+
+
+def period_texts(period):
+	"""Título, descripción y pie de página con el periodo de los datos"""
+	return (
+		f"Análisis de Mortalidad en Colombia {period}",
+		f"Dashboard interactivo para el análisis de datos de mortalidad en Colombia durante {period}. "
+		"Basado en datos oficiales del DANE (Departamento Administrativo Nacional de Estadística).",
+		f" | Estadísticas Vitales {period}"
+	)
+
+
+PERIOD = data_period(filter_opts)
+app.title = period_texts(PERIOD)[0]
+
+print("Aplicación lista!")
+
+# El cubo y el motor de consultas los carga la precarga en segundo plano (ver
+# el final del módulo) o, si está desactivada, el primer filtro que se use
+_dashboard_data = {}
+_dashboard_data_lock = threading.Lock()
+
+
+def get_dashboard_data():
+	"""Carga perezosa del cubo, el motor de consultas y la caché de figuras"""
+	with _dashboard_data_lock:
+		if not _dashboard_data:
+			from analytics import load_backend
+			from causes_table import CauseTable
+			from data_cache import CACHE_DIR, data_version
+			from figure_cache import FigureCache
+			from icd10 import load_icd10_index
+			from shared_dataset import load_shared_cube
+			from query_engine import MortalityQueryEngine
+
+			mortality_cube, death_codes, divipola = load_shared_cube()
+			data = {'death_codes': death_codes}
+			# Índices por dimensión para responder los filtros sin recorrer el cubo
+			data['query_engine'] = MortalityQueryEngine(mortality_cube, death_codes)
+			# Agregaciones de los gráficos: cubo en memoria o, con ANALYTICS_BACKEND=duckdb, SQL sobre los Parquet
+			data['analytics'] = load_backend(data['query_engine'], death_codes, divipola)
+			# Ranking completo de causas por filtros, paginado en el servidor
+			data['cause_table'] = CauseTable(data['query_engine'], load_icd10_index(death_codes))
+			# Figuras de las vistas filtradas; FIGURE_CACHE_DISK=1 comparte un nivel en disco entre workers
+			data['figure_cache'] = FigureCache(
+				max_bytes=int(os.environ.get('FIGURE_CACHE_MB', 64)) * 1024 * 1024,
+				disk_dir=os.path.join(CACHE_DIR, 'figuras') if os.environ.get('FIGURE_CACHE_DISK') == '1' else None,
+				namespace=f"{data_version()}-f{BUNDLE_FORMAT}"
+			)
+			# Sin paquete, opciones de los filtros (y periodo del título) a partir del cubo
+			data['options'] = filter_opts or filter_options(mortality_cube, death_codes, divipola)
+			# Solo se publica completo: si un paso falla, la próxima llamada vuelve a intentarlo
+			_dashboard_data.update(data)
+			app.title = period_texts(data_period(data['options']))[0]
+	return _dashboard_data
+
+
+def current_filter_options():
+	"""Opciones de los filtros: las del paquete o, sin paquete, las calculadas al cargar el cubo"""
+	return filter_opts or get_dashboard_data()['options']
+
+
+def municipality_options(all_options, departments=None):
+	options = all_options.get('municipio', [])
+	if departments:
+		options = [option for option in options if option['departamento'] in departments]
+	return [{'label': option['label'], 'value': option['value']} for option in options]
+
+
+# Figura vacía que ocupa el lugar del gráfico hasta que su callback lo llena;
+# 'meta' le indica a assets/lazy_graphs.js que aún no tiene figura real
+PLACEHOLDER_FIGURE = {
+	'data': [],
+	'layout': {
+		'meta': 'provisional',
+		'xaxis': {'visible': False},
+		'yaxis': {'visible': False},
+		'annotations': [{'text': 'Cargando...', 'showarrow': False, 'font': {'size': 16, 'color': '#6c757d'}}],
+		'height': 400
+	}
+}
+
+
+def lazy_graph(graph_id, chart_id, style=None):
+	"""Gráfico con figura provisional que se llena al entrar en pantalla.
+
+	assets/lazy_graphs.js marca el Store `<graph_id>-visible` cuando el
+	contenedor es visible y eso dispara el callback del gráfico. Si la figura
+	está en el paquete, el navegador la descarga de `data-figura` (cacheable
+	y precomprimida) y el Store queda en 'estatico' para que el callback no
+	la envíe otra vez.
+	"""
+	attributes = {'data-store': f'{graph_id}-visible', 'data-grafico': graph_id}
+	if static_figures is not None and chart_id in static_figures:
+		attributes['data-figura'] = static_figures.url(chart_id)
+	return html.Div([
+		dcc.Store(id=f'{graph_id}-visible', data=False),
+		dcc.Loading(dcc.Graph(id=graph_id, figure=PLACEHOLDER_FIGURE, style=style), type='circle')
+	], className='grafico-diferido', **attributes)
+
+
+def served_statically(graph_id, visible, filters):
+	"""True si el navegador ya descarga la figura sin filtros desde /figuras"""
+	return visible == 'estatico' and ctx.triggered_id == f'{graph_id}-visible' and not any(filters.values())
+
+
+def filter_dropdown(component_id, label, options, md=4):
+	return dbc.Col([
+		html.Label(label, className="fw-bold small mb-1"),
+		dcc.Dropdown(id=component_id, options=options, multi=True, placeholder="Todos")
+	], md=md, className="mb-2")
 
 # Layout de la aplicación
 app.layout = dbc.Container([
@@ -58,16 +187,19 @@ app.layout = dbc.Container([
 	dbc.Row([
 		dbc.Col([
 			html.H1(
-				"Análisis de Mortalidad en Colombia 2019",
+				period_texts(PERIOD)[0],
+				id='titulo-periodo',
 				className="text-center mb-4",
 				style={'color': '#2c3e50', 'fontWeight': 'bold'}
 			),
 			html.P(
-				"Dashboard interactivo para el análisis de datos de mortalidad en Colombia durante el año 2019. "
-				"Basado en datos oficiales del DANE (Departamento Administrativo Nacional de Estadística).",
+				period_texts(PERIOD)[1],
+				id='descripcion-periodo',
 				className="text-center text-muted mb-5"
 			),
-			html.Hr()
+			html.Hr(),
+			# Dispara la carga de las opciones de los filtros cuando no vienen en el paquete
+			dcc.Store(id='opciones-filtros')
 		])
 	]),
 
@@ -112,12 +244,47 @@ app.layout = dbc.Container([
 		], md=12)
 	]),
 
+	# Filtros
+	dbc.Row([
+		dbc.Col([
+			dbc.Card([
+				dbc.CardHeader("Filtros"),
+				dbc.CardBody([
+					dbc.Row([
+						filter_dropdown('filtro-anio', "Año", filter_opts.get('anio', [])),
+						filter_dropdown('filtro-departamento', "Departamento", filter_opts.get('departamento', [])),
+						filter_dropdown('filtro-municipio', "Municipio", municipality_options(filter_opts)),
+						filter_dropdown('filtro-mes', "Mes", filter_opts.get('mes', []), md=3),
+						filter_dropdown('filtro-sexo', "Sexo", filter_opts.get('sexo', []), md=3),
+						filter_dropdown('filtro-grupo-edad', "Grupo de edad", filter_opts.get('grupo_edad', []), md=3),
+						filter_dropdown('filtro-capitulo', "Capítulo CIE-10", filter_opts.get('capitulo', []), md=3)
+					]),
+					# K y empates de los rankings de ciudades, departamentos y causas (ver ranking.py)
+					dbc.Row([
+						dbc.Col([
+							html.Label("Tamaño de los rankings", className="fw-bold small mb-1"),
+							dcc.Dropdown(id='ranking-k', options=[{'label': f"Top {k}", 'value': k} for k in RANKING_SIZES], placeholder="Predeterminado")
+						], md=3, className="mb-2"),
+						dbc.Col([
+							dbc.Checklist(
+								id='ranking-empates',
+								options=[{'label': 'Incluir los empatados con el último puesto', 'value': 'todos'}],
+								value=[],
+								className="small mt-md-4"
+							)
+						], md=5, className="mb-2")
+					])
+				])
+			], className="mb-4 shadow-sm")
+		], md=12)
+	]),
+
 	# Estadísticas generales
 	dbc.Row([
 		dbc.Col([
 			dbc.Card([
 				dbc.CardBody([
-					html.H4(f"{len(mortality_data):,}", className="card-title text-center"),
+					html.H4(total_deaths_text, id='kpi-defunciones', className="card-title text-center"),
 					html.P("Total de Defunciones", className="card-text text-center text-muted")
 				])
 			], color="danger", outline=True)
@@ -125,7 +292,7 @@ app.layout = dbc.Container([
 		dbc.Col([
 			dbc.Card([
 				dbc.CardBody([
-					html.H4(f"{mortality_data['DEPARTAMENTO'].nunique()}", className="card-title text-center"),
+					html.H4(total_departments_text, id='kpi-departamentos', className="card-title text-center"),
 					html.P("Departamentos", className="card-text text-center text-muted")
 				])
 			], color="warning", outline=True)
@@ -133,7 +300,7 @@ app.layout = dbc.Container([
 		dbc.Col([
 			dbc.Card([
 				dbc.CardBody([
-					html.H4(f"{mortality_data['MUNICIPIO'].nunique()}", className="card-title text-center"),
+					html.H4(total_municipalities_text, id='kpi-municipios', className="card-title text-center"),
 					html.P("Municipios", className="card-text text-center text-muted")
 				])
 			], color="info", outline=True)
@@ -141,10 +308,7 @@ app.layout = dbc.Container([
 		dbc.Col([
 			dbc.Card([
 				dbc.CardBody([
-					html.H4(
-						f"{len(mortality_data[mortality_data['COD_MUERTE'].str.contains('X95', na=False)])}",
-						className="card-title text-center"
-					),
+					html.H4(total_homicides_text, id='kpi-homicidios', className="card-title text-center"),
 					html.P("Homicidios", className="card-text text-center text-muted")
 				])
 			], color="dark", outline=True)
@@ -157,7 +321,19 @@ app.layout = dbc.Container([
 			dbc.Card([
 				dbc.CardHeader("Mapa de Mortalidad por Departamento"),
 				dbc.CardBody([
-					dcc.Graph(figure=map_fig, style={'height': '70vh'})
+					dbc.RadioItems(
+						id='mapa-detalle',
+						options=[
+							{'label': 'Departamentos', 'value': 'departamento'},
+							# Las geometrías municipales son opcionales (ver geometry.py)
+							{'label': 'Municipios', 'value': 'municipio', 'disabled': not os.path.exists(MUNICIPALITIES_GEOJSON_FILE)}
+						],
+						value='departamento',
+						inline=True,
+						className="mb-2"
+					),
+					lazy_graph('grafico-mapa', 'mapa', style={'height': '70vh'}),
+					dcc.Store(id='mapa-vista', data={'nivel': DEFAULT_LEVEL, 'zoom': None, 'bbox': None})
 				])
 			])
 		], md=12)
@@ -169,7 +345,7 @@ app.layout = dbc.Container([
 			dbc.Card([
 				dbc.CardHeader("Evolución Temporal por Mes"),
 				dbc.CardBody([
-					dcc.Graph(figure=timeline_fig)
+					lazy_graph('grafico-mensual', 'mensual')
 				])
 			])
 		], md=12)
@@ -181,7 +357,7 @@ app.layout = dbc.Container([
 			dbc.Card([
 				dbc.CardHeader("Ciudades Más Violentas (Homicidios)"),
 				dbc.CardBody([
-					dcc.Graph(figure=violent_cities_fig)
+					lazy_graph('grafico-ciudades-violentas', 'ciudades-violentas')
 				])
 			])
 		], md=6),
@@ -189,7 +365,7 @@ app.layout = dbc.Container([
 			dbc.Card([
 				dbc.CardHeader("Ciudades con Menor Mortalidad"),
 				dbc.CardBody([
-					dcc.Graph(figure=safest_cities_fig)
+					lazy_graph('grafico-ciudades-seguras', 'ciudades-seguras')
 				])
 			])
 		], md=6)
@@ -199,21 +375,34 @@ app.layout = dbc.Container([
 	dbc.Row([
 		dbc.Col([
 			dbc.Card([
-				dbc.CardHeader("Principales Causas de Muerte"),
+				dbc.CardHeader("Causas de Muerte"),
 				dbc.CardBody([
+					# Paginación, orden y filtro en el servidor (ver causes_table.py): solo viaja la página visible
 					dash_table.DataTable(
-						data=death_causes_df.to_dict('records'),
+						id='tabla-causas',
+						data=death_causes_records,
 						columns=[
+							{"name": "Puesto", "id": "PUESTO", "type": "numeric"},
 							{"name": "Código", "id": "CODIGO"},
 							{"name": "Total de Casos", "id": "TOTAL_CASOS", "type": "numeric", "format": {"specifier": ","}},
+							{"name": "%", "id": "PORCENTAJE", "type": "numeric", "format": {"specifier": ".2f"}},
 							{"name": "Descripción", "id": "DESCRIPCION"}
 						],
+						page_action='custom',
+						page_current=0,
+						page_size=CAUSES_PAGE_SIZE,
+						page_count=bundle['death_causes_pages'],
+						sort_action='custom',
+						sort_mode='multi',
+						sort_by=[],
+						filter_action='custom',
+						filter_query='',
 						style_cell={'textAlign': 'left', 'padding': '10px'},
 						style_header={'backgroundColor': 'rgb(230, 230, 230)', 'fontWeight': 'bold'},
 						style_data={'backgroundColor': 'rgb(248, 248, 248)'},
 						style_data_conditional=[
 							{
-								'if': {'row_index': 0},
+								'if': {'filter_query': '{PUESTO} = 1'},
 								'backgroundColor': '#ffebee',
 								'color': 'black'
 							}
@@ -230,7 +419,7 @@ app.layout = dbc.Container([
 			dbc.Card([
 				dbc.CardHeader("Muertes por Sexo en Departamentos"),
 				dbc.CardBody([
-					dcc.Graph(figure=gender_dept_fig)
+					lazy_graph('grafico-sexo-departamento', 'sexo-departamento')
 				])
 			])
 		], md=7),
@@ -238,12 +427,37 @@ app.layout = dbc.Container([
 			dbc.Card([
 				dbc.CardHeader("Distribución por Grupos de Edad"),
 				dbc.CardBody([
-					dcc.Graph(figure=age_groups_fig)
+					lazy_graph('grafico-grupos-edad', 'grupos-edad')
 				])
 			])
 		], md=5)
 	], className="mb-4"),
 
+	# Sección 6: Exportaciones (se generan en segundo plano, ver export_service.py)
+	dbc.Row([
+		dbc.Col([
+			dbc.Card([
+				dbc.CardHeader("Exportar"),
+				dbc.CardBody([
+					dbc.Row([
+						dbc.Col([
+							html.Label("Contenido (con los filtros actuales)", className="fw-bold small mb-1"),
+							dcc.Dropdown(id='exportar-seleccion', options=EXPORT_OPTIONS, value=f'{DATA_TARGET}:csv', clearable=False)
+						], md=6),
+						dbc.Col([
+							dbc.Button("Generar", id='exportar-boton', color='primary', className="mt-4")
+						], md=2),
+						dbc.Col([
+							html.Div(id='exportar-estado', className="mt-4 small")
+						], md=4)
+					]),
+					dcc.Store(id='exportar-trabajo'),
+					dcc.Interval(id='exportar-intervalo', interval=1000, disabled=True)
+				])
+			])
+		])
+	], className="mb-4"),
+
 	# Footer
 	dbc.Row([
 		dbc.Col([
@@ -251,7 +465,7 @@ app.layout = dbc.Container([
 			html.P([
 				"Trabajo académico - Maestría IA | ",
 				html.A("Fuentes: DANE", href="https://www.dane.gov.co/", target="_blank"),
-				" | Estadísticas Vitales 2019"
+				html.Span(period_texts(PERIOD)[2], id='pie-periodo')
 			], className="text-center text-muted small"),
 			html.P(
 				"Universidad de La Salle · Aplicaciones I · Cohorte 2025-II",
@@ -262,8 +476,428 @@ app.layout = dbc.Container([
 
 ], fluid=True)
 
-# Callback para interactividad si se requiere en el futuro
-# Actualmente todas las visualizaciones son estáticas
+
+@app.callback(
+	Output('filtro-anio', 'options'),
+	Output('filtro-departamento', 'options'),
+	Output('filtro-mes', 'options'),
+	Output('filtro-sexo', 'options'),
+	Output('filtro-grupo-edad', 'options'),
+	Output('filtro-capitulo', 'options'),
+	Output('titulo-periodo', 'children'),
+	Output('descripcion-periodo', 'children'),
+	Output('pie-periodo', 'children'),
+	Input('opciones-filtros', 'data')
+)
+def load_filter_options(_):
+	"""Sin paquete, opciones de los filtros y periodo a partir del cubo cargado por la precarga"""
+	# Con paquete ya vienen en el layout
+	if filter_opts:
+		raise PreventUpdate
+	try:
+		options = current_filter_options()
+	except Exception as e:
+		print(f"Error cargando datos para filtros: {e}")
+		raise PreventUpdate
+	return (
+		options.get('anio', []),
+		options.get('departamento', []),
+		options.get('mes', []),
+		options.get('sexo', []),
+		options.get('grupo_edad', []),
+		options.get('capitulo', []),
+		*period_texts(data_period(options))
+	)
+
+
+@app.callback(
+	Output('filtro-municipio', 'options'),
+	Input('filtro-departamento', 'value')
+)
+def update_municipality_options(departments):
+	# Con paquete las opciones iniciales ya vienen en el layout
+	if ctx.triggered_id is None and filter_opts and not departments:
+		raise PreventUpdate
+	try:
+		options = current_filter_options()
+	except Exception as e:
+		print(f"Error cargando datos para filtros: {e}")
+		return no_update
+	return municipality_options(options, departments)
+
+
+FILTER_INPUTS = [
+	Input('filtro-anio', 'value'),
+	Input('filtro-departamento', 'value'),
+	Input('filtro-municipio', 'value'),
+	Input('filtro-mes', 'value'),
+	Input('filtro-sexo', 'value'),
+	Input('filtro-grupo-edad', 'value'),
+	Input('filtro-capitulo', 'value')
+]
+
+
+RANKING_INPUTS = [
+	Input('ranking-k', 'value'),
+	Input('ranking-empates', 'value')
+]
+
+
+def ranking_options(k, ties):
+	"""Argumentos k y ties de las funciones create_* ({} con los valores por defecto de cada gráfico)"""
+	options = {}
+	if k:
+		options['k'] = int(k)
+	if ties:
+		options['ties'] = 'todos'
+	return options
+
+
+def ranking_chart_id(chart_id, ranking):
+	"""Identificador de caché de un ranking con K o empates distintos de los por defecto"""
+	return chart_id + ''.join(f"-{key}{value}" for key, value in sorted(ranking.items()))
+
+
+def build_filters(years, departments, municipalities, months, sexes, age_groups, chapters):
+	"""Filtros del motor de consultas a partir de los valores de los desplegables"""
+	age_codes = [code for name in (age_groups or []) for code in current_filter_options()['grupo_edad_codigos'][name]]
+	return {
+		'anio': years,
+		'departamento': departments,
+		'municipio': municipalities,
+		'mes': months,
+		'sexo': sexes,
+		'grupo_edad': age_codes,
+		'capitulo': chapters
+	}
+
+
+def cached_renderer(filters):
+	"""Función que sirve figuras desde la caché para unos filtros.
+
+	La vista de agregación (ver analytics.py) solo se arma si alguna figura
+	no está en caché.
+	"""
+	data = get_dashboard_data()
+	filtered = []
+
+	def view():
+		if not filtered:
+			filtered.append(data['analytics'].view(filters))
+		return filtered[0]
+
+	def cached(chart_id, builder):
+		return data['figure_cache'].get_or_build(chart_id, filters, lambda: builder(view()))
+
+	return cached
+
+
+def map_view(relayout_data, current_view):
+	"""Nivel de geometría y caja visible a partir del relayoutData del mapa.
+
+	La caja se expande a grados enteros para que vistas parecidas compartan
+	entrada en la caché de figuras.
+	"""
+	view = dict(current_view or {'nivel': DEFAULT_LEVEL, 'zoom': None, 'bbox': None})
+	relayout_data = relayout_data or {}
+	if 'mapbox.zoom' in relayout_data:
+		view['zoom'] = relayout_data['mapbox.zoom']
+	view['nivel'] = level_for_zoom(view['zoom'])
+
+	corners = (relayout_data.get('mapbox._derived') or {}).get('coordinates')
+	if corners:
+		lons = [corner[0] for corner in corners]
+		lats = [corner[1] for corner in corners]
+		view['bbox'] = [math.floor(min(lons)), math.floor(min(lats)), math.ceil(max(lons)), math.ceil(max(lats))]
+	# Solo al acercarse vale la pena recortar las geometrías a la vista
+	if view['nivel'] == DEFAULT_LEVEL:
+		view['bbox'] = None
+	return view
+
+
+@app.callback(
+	Output('grafico-mapa', 'figure'),
+	Output('mapa-vista', 'data'),
+	Input('grafico-mapa-visible', 'data'),
+	*FILTER_INPUTS,
+	Input('mapa-detalle', 'value'),
+	Input('grafico-mapa', 'relayoutData'),
+	State('mapa-vista', 'data')
+)
+def update_map(visible, years, departments, municipalities, months, sexes, age_groups, chapters, detail, relayout_data, current_view):
+	"""Mapa por departamento o municipio, con el nivel de detalle adecuado al zoom y recortado a la vista"""
+	if not visible:
+		raise PreventUpdate
+
+	view = map_view(relayout_data, current_view)
+	if ctx.triggered_id == 'grafico-mapa' and view['nivel'] == current_view['nivel'] and view['bbox'] == current_view['bbox']:
+		return no_update, view
+
+	filters = build_filters(years, departments, municipalities, months, sexes, age_groups, chapters)
+	# Vista inicial sin filtros: la figura ya está en el paquete
+	if not any(filters.values()) and detail == 'departamento' and view['bbox'] is None and view['nivel'] == DEFAULT_LEVEL and 'mapa' in figures:
+		if served_statically('grafico-mapa', visible, filters):
+			return no_update, view
+		return figures['mapa'], view
+
+	try:
+		cached = cached_renderer(filters)
+	except Exception as e:
+		print(f"Error cargando datos para filtros: {e}")
+		return no_update, no_update
+
+	from data_processing import create_mortality_map, create_municipality_map
+
+	create_map = create_municipality_map if detail == 'municipio' else create_mortality_map
+	chart_id = f"mapa-{detail}-{view['nivel']}-{view['bbox']}"
+	return cached(chart_id, lambda source: create_map(source, level=view['nivel'], bbox=view['bbox'])), view
+
+
+# Gráfico -> (identificador en el paquete y en la caché, función de data_processing)
+LAZY_CHARTS = {
+	'grafico-mensual': ('mensual', 'create_monthly_timeline'),
+	'grafico-ciudades-violentas': ('ciudades-violentas', 'create_violent_cities_chart'),
+	'grafico-ciudades-seguras': ('ciudades-seguras', 'create_safest_cities_chart'),
+	'grafico-sexo-departamento': ('sexo-departamento', 'create_gender_by_department_chart'),
+	'grafico-grupos-edad': ('grupos-edad', 'create_age_groups_histogram')
+}
+
+# Gráficos que son rankings: reciben K y el modo de empates
+RANKED_CHARTS = {'ciudades-violentas', 'ciudades-seguras', 'sexo-departamento'}
+
+
+def render_chart(chart_id, builder_name, filters, ranking=None):
+	"""Figura del paquete si no hay filtros; si no, desde la caché de figuras"""
+	ranking = ranking or {}
+	if not any(filters.values()) and not ranking and chart_id in figures:
+		return figures[chart_id]
+
+	try:
+		cached = cached_renderer(filters)
+	except Exception as e:
+		print(f"Error cargando datos para filtros: {e}")
+		return no_update
+
+	import data_processing
+
+	builder = getattr(data_processing, builder_name)
+	return cached(ranking_chart_id(chart_id, ranking), lambda source: builder(source, **ranking))
+
+
+def register_lazy_chart(graph_id, chart_id, builder_name):
+	"""Callback propio por gráfico: cada uno se calcula y llega por separado"""
+	ranked = chart_id in RANKED_CHARTS
+
+	@app.callback(
+		Output(graph_id, 'figure'),
+		Input(f'{graph_id}-visible', 'data'),
+		*FILTER_INPUTS,
+		*(RANKING_INPUTS if ranked else [])
+	)
+	def update_chart(visible, years, departments, municipalities, months, sexes, age_groups, chapters, *ranking_values):
+		# Los filtros no recalculan gráficos que aún no se han mostrado
+		if not visible:
+			raise PreventUpdate
+		filters = build_filters(years, departments, municipalities, months, sexes, age_groups, chapters)
+		ranking = ranking_options(*ranking_values) if ranked else {}
+		if chart_id in figures and not ranking and served_statically(graph_id, visible, filters):
+			raise PreventUpdate
+		return render_chart(chart_id, builder_name, filters, ranking)
+
+
+for lazy_graph_id, (lazy_chart_id, lazy_builder_name) in LAZY_CHARTS.items():
+	register_lazy_chart(lazy_graph_id, lazy_chart_id, lazy_builder_name)
+
+
+@app.callback(
+	Output('kpi-defunciones', 'children'),
+	Output('kpi-departamentos', 'children'),
+	Output('kpi-municipios', 'children'),
+	Output('kpi-homicidios', 'children'),
+	*FILTER_INPUTS
+)
+def update_summary(years, departments, municipalities, months, sexes, age_groups, chapters):
+	"""Indicadores sobre el subconjunto filtrado del cubo"""
+	filters = build_filters(years, departments, municipalities, months, sexes, age_groups, chapters)
+	if not any(filters.values()) and bundle['figures']:
+		# Ya vienen en el layout desde el paquete; solo se restauran al limpiar filtros
+		if ctx.triggered_id is None:
+			raise PreventUpdate
+		return tuple(bundle['stats'])
+
+	try:
+		cached = cached_renderer(filters)
+	except Exception as e:
+		print(f"Error cargando datos para filtros: {e}")
+		return [no_update] * 4
+
+	return tuple(cached('indicadores', summary_stats))
+
+
+@app.callback(
+	Output('tabla-causas', 'data'),
+	Output('tabla-causas', 'page_count'),
+	Output('tabla-causas', 'page_current'),
+	*FILTER_INPUTS,
+	Input('tabla-causas', 'page_current'),
+	Input('tabla-causas', 'page_size'),
+	Input('tabla-causas', 'sort_by'),
+	Input('tabla-causas', 'filter_query')
+)
+def update_causes_table(years, departments, municipalities, months, sexes, age_groups, chapters, page_current, page_size, sort_by, filter_query):
+	"""Página visible del ranking completo de causas, ordenada y filtrada en el servidor"""
+	filters = build_filters(years, departments, municipalities, months, sexes, age_groups, chapters)
+	# Un cambio de filtros, orden o búsqueda vuelve a la primera página
+	if ctx.triggered_id != 'tabla-causas' or ctx.triggered_prop_ids.get('tabla-causas.page_current') is None:
+		page_current = 0
+	first_page = not any(filters.values()) and not page_current and not sort_by and not filter_query and page_size == CAUSES_PAGE_SIZE
+	if first_page and death_causes_records:
+		# La primera página sin filtros ya viene en el layout desde el paquete
+		if ctx.triggered_id is None:
+			raise PreventUpdate
+		return death_causes_records, bundle['death_causes_pages'], 0
+
+	try:
+		records, page_count = get_dashboard_data()['cause_table'].page(filters, page_current, page_size, sort_by, filter_query)
+	except Exception as e:
+		print(f"Error cargando datos para filtros: {e}")
+		return no_update, no_update, no_update
+	return records, page_count, min(page_current, page_count - 1)
+
+
+_export_service = []
+_export_service_lock = threading.Lock()
+
+
+def get_export_service():
+	"""Servicio de exportaciones del worker, creado con el primer pedido"""
+	with _export_service_lock:
+		if not _export_service:
+			from data_cache import data_version
+
+			_export_service.append(ExportService(
+				cube_for=lambda filters: get_dashboard_data()['query_engine'].filtered_cube(filters),
+				figure_for=export_figure,
+				version=bundle.get('data_version') or data_version(),
+				targets=EXPORT_CHARTS
+			))
+	return _export_service[0]
+
+
+def export_figure(chart_id, filters, ranking):
+	"""Figura a exportar: la misma que muestra el dashboard (el mapa, en su vista inicial)"""
+	if chart_id == 'mapa':
+		if not any(filters.values()) and 'mapa' in figures:
+			return figures['mapa']
+		from data_processing import create_mortality_map
+
+		return cached_renderer(filters)(f"mapa-departamento-{DEFAULT_LEVEL}-None", lambda source: create_mortality_map(source, level=DEFAULT_LEVEL))
+
+	builder_name = next(builder for chart, builder in LAZY_CHARTS.values() if chart == chart_id)
+	figure = render_chart(chart_id, builder_name, filters, ranking)
+	if figure is no_update:
+		raise RuntimeError(f"No se pudo calcular el gráfico {chart_id!r}")
+	return figure
+
+
+def export_status(job):
+	"""Texto o enlace de descarga para el estado de una exportación"""
+	if job['estado'] == READY:
+		return html.A("Descargar", href=job['url'], className="btn btn-success btn-sm")
+	if job['estado'] == PENDING:
+		return html.Span([dbc.Spinner(size='sm'), " Generando..."], className="text-muted")
+	return dbc.Alert(job.get('error', 'No se pudo generar la exportación'), color='danger' if job['estado'] == FAILED else 'warning',
+		className="py-1 mb-0")
+
+
+@app.callback(
+	Output('exportar-trabajo', 'data'),
+	Output('exportar-intervalo', 'disabled'),
+	Output('exportar-estado', 'children'),
+	Input('exportar-boton', 'n_clicks'),
+	State('exportar-seleccion', 'value'),
+	*[State(item.component_id, item.component_property) for item in FILTER_INPUTS + RANKING_INPUTS],
+	prevent_initial_call=True
+)
+def start_export(n_clicks, selection, years, departments, municipalities, months, sexes, age_groups, chapters, ranking_k, ranking_ties):
+	"""Encola la exportación; el callback responde enseguida y el intervalo consulta el estado"""
+	if not selection:
+		raise PreventUpdate
+	target, fmt = selection.split(':')
+	filters = build_filters(years, departments, municipalities, months, sexes, age_groups, chapters)
+	ranking = ranking_options(ranking_k, ranking_ties) if target in RANKED_CHARTS else {}
+	try:
+		job = get_export_service().submit(target, fmt, filters, ranking)
+	except ValueError as e:
+		return None, True, export_status({'estado': FAILED, 'error': str(e)})
+	# El pedido viaja con el trabajo por si el intervalo llega a otro worker
+	job['pedido'] = [target, fmt, filters, ranking]
+	return job, job['estado'] != PENDING, export_status(job)
+
+
+@app.callback(
+	Output('exportar-trabajo', 'data', allow_duplicate=True),
+	Output('exportar-intervalo', 'disabled', allow_duplicate=True),
+	Output('exportar-estado', 'children', allow_duplicate=True),
+	Input('exportar-intervalo', 'n_intervals'),
+	State('exportar-trabajo', 'data'),
+	prevent_initial_call=True
+)
+def poll_export(n_intervals, job):
+	"""Estado de la exportación en curso; al terminar muestra el enlace y detiene el intervalo"""
+	if not job or job['estado'] != PENDING:
+		return no_update, True, no_update
+	service = get_export_service()
+	status = service.status(job['clave'], job['formato'])
+	if status['estado'] == PENDING and not status['local']:
+		# Otro worker la recibió; si no está en disco se vuelve a pedir aquí
+		status = service.submit(*job['pedido'])
+	status['pedido'] = job['pedido']
+	return status, status['estado'] != PENDING, export_status(status)
+
+
+def load_data_step():
+	"""Precarga: cubo compartido, índices del motor de consultas y caché de figuras"""
+	from data_cache import data_version
+
+	get_dashboard_data()
+	warmup.data_version = bundle.get('data_version') or data_version()
+
+
+def warm_figures_step():
+	"""Precarga: figuras sin filtros que no vienen en el paquete"""
+	from data_processing import create_mortality_map
+
+	if figures:
+		return
+	# Mismos identificadores de caché que usan los callbacks sin filtros
+	cached = cached_renderer({})
+	cached(f"mapa-departamento-{DEFAULT_LEVEL}-None", lambda source: create_mortality_map(source, level=DEFAULT_LEVEL))
+	for chart_id, builder_name in LAZY_CHARTS.values():
+		render_chart(chart_id, builder_name, {})
+	get_dashboard_data()['cause_table'].ranking({})
+	cached('indicadores', summary_stats)
+
+
+# Carga y agregación en un hilo al arrancar el worker; /readyz indica cuándo termina
+warmup = Warmup(
+	[('datos', load_data_step), ('figuras', warm_figures_step)],
+	data_version=bundle.get('data_version')
+).register_routes(server)
+
+if warmup_enabled():
+	warmup.start()
+
+# Latencias por ruta y callback en /metrics, logs JSON y perfilado (ver instrumentation.py)
+instrument(server)
+add_collector(figure_cache_collector(lambda: _dashboard_data.get('figure_cache')))
+# Después de instrument: gzip/brotli y ETag del layout; las métricas ven los bytes comprimidos
+install_http_cache(server, bundle.get('data_version') or 'sin-paquete')
+if static_figures is not None:
+	static_figures.register_routes(server)
+# Descarga de exportaciones desde Data/cache/exportaciones (de cualquier worker)
+register_export_routes(server)
+
 
 if __name__ == '__main__':
     import os
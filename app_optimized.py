@@ -2,28 +2,37 @@
 Aplicación web optimizada para análisis de mortalidad en Colombia 2019
 """
 import dash
-from dash import dcc, html, dash_table
+from dash import dcc, html, dash_table, Input, Output, no_update
 import dash_bootstrap_components as dbc
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
 
+from data_cache import read_excel_cached, data_version, MORTALITY_FILE, DIVIPOLA_FILE
+from data_processing import build_mortality_cube
+from icd10 import load_icd10_index
+from ranking import rank_groups
+from rates import load_rates_engine, lowest_rates
+from http_cache import install as install_http_cache
+from instrumentation import instrument, timed_figure_batch
+from warmup import Warmup, warmup_enabled
+
 # Inicializar la aplicación Dash
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 app.title = "Análisis de Mortalidad en Colombia 2019"
 server = app.server  # Para despliegue en PaaS
 
 def load_data_optimized():
-    """Carga optimizada de datos"""
+    """Carga optimizada de datos (usa la caché Parquet de data_cache)"""
     print("📊 Cargando datos de mortalidad...")
     
     # Cargar datos principales
-    mortality_data = pd.read_excel('Data/Anexo1.NoFetal2019_CE_15-03-23.xlsx')
+    mortality_data = read_excel_cached(MORTALITY_FILE)
     print(f"✅ Datos de mortalidad cargados: {len(mortality_data):,} registros")
     
     # Cargar división política
-    divipola = pd.read_excel('Data/Divipola_CE_.xlsx')
+    divipola = read_excel_cached(DIVIPOLA_FILE)
     print(f"✅ Divipola cargada: {len(divipola)} municipios")
     
     # Merge optimizado
@@ -36,14 +45,14 @@ def load_data_optimized():
     
     return mortality_with_geo
 
-def create_visualizations(df):
-    """Crea todas las visualizaciones necesarias"""
+@timed_figure_batch
+def create_visualizations(cube):
+    """Crea todas las visualizaciones a partir del cubo de conteos"""
     
     print("📈 Generando visualizaciones...")
     
     # 1. Mapa de mortalidad por departamento
-    dept_deaths = df.groupby('DEPARTAMENTO').size().reset_index(name='TOTAL_MUERTES')
-    dept_deaths = dept_deaths.sort_values('TOTAL_MUERTES', ascending=False).head(15)
+    dept_deaths = rank_groups(cube, 'DEPARTAMENTO', 15)
     
     map_fig = px.bar(
         dept_deaths, 
@@ -57,7 +66,7 @@ def create_visualizations(df):
     map_fig.update_layout(height=600, yaxis={'categoryorder': 'total ascending'})
     
     # 2. Línea temporal por mes
-    monthly_deaths = df.groupby('MES').size().reset_index(name='TOTAL_MUERTES')
+    monthly_deaths = cube.groupby('MES')['TOTAL_MUERTES'].sum().reset_index()
     meses = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
     monthly_deaths['MES_NOMBRE'] = monthly_deaths['MES'].apply(lambda x: meses[x-1])
     
@@ -71,9 +80,7 @@ def create_visualizations(df):
     timeline_fig.update_layout(height=400)
     
     # 3. Ciudades más violentas
-    homicides = df[df['COD_MUERTE'].str.contains('X95', na=False)]
-    violent_cities = homicides.groupby('MUNICIPIO').size().reset_index(name='HOMICIDIOS')
-    violent_cities = violent_cities.sort_values('HOMICIDIOS', ascending=False).head(5)
+    violent_cities = rank_groups(cube, 'MUNICIPIO', 5, mask=(cube['FAMILIA_CAUSA'] == 'homicidio').to_numpy(), name='HOMICIDIOS')
     
     violent_fig = px.bar(
         violent_cities, 
@@ -85,45 +92,50 @@ def create_visualizations(df):
     )
     violent_fig.update_layout(height=400, xaxis_tickangle=-45)
     
-    # 4. Ciudades con menor mortalidad
-    safe_cities = df.groupby('MUNICIPIO').size().reset_index(name='TOTAL_MUERTES')
-    safe_cities = safe_cities[safe_cities['TOTAL_MUERTES'] >= 50]  # Filtro mínimo
-    safe_cities = safe_cities.sort_values('TOTAL_MUERTES', ascending=True).head(10)
-    
-    safe_fig = px.pie(
-        safe_cities, 
-        values='TOTAL_MUERTES', 
-        names='MUNICIPIO',
-        title='10 Ciudades con Menor Mortalidad'
-    )
+    # 4. Ciudades con menor mortalidad: tasa ajustada por edad si hay tabla de población
+    rates_engine = load_rates_engine()
+    if rates_engine is not None:
+        safe_cities = lowest_rates(cube, rates_engine)
+        safe_fig = px.bar(
+            safe_cities,
+            x='TASA_AJUSTADA',
+            y='MUNICIPIO',
+            orientation='h',
+            error_x=safe_cities['TASA_AJUSTADA_SUP'] - safe_cities['TASA_AJUSTADA'],
+            error_x_minus=safe_cities['TASA_AJUSTADA'] - safe_cities['TASA_AJUSTADA_INF'],
+            title='10 Ciudades con Menor Tasa de Mortalidad (ajustada por edad)',
+            labels={'TASA_AJUSTADA': 'Defunciones por 100.000 habitantes', 'MUNICIPIO': 'Ciudad'}
+        )
+        safe_fig.update_layout(height=400, yaxis={'autorange': 'reversed'})
+    else:
+        safe_cities = rank_groups(cube, 'MUNICIPIO', 10, largest=False, min_total=50)  # Filtro mínimo
+        
+        safe_fig = px.pie(
+            safe_cities, 
+            values='TOTAL_MUERTES', 
+            names='MUNICIPIO',
+            title='10 Ciudades con Menor Mortalidad'
+        )
     
     # 5. Principales causas de muerte
-    top_causes = df['COD_MUERTE'].value_counts().head(10).reset_index()
+    top_causes = rank_groups(cube, 'COD_MUERTE', 10)
     top_causes.columns = ['CODIGO', 'TOTAL_CASOS']
     
-    # Agregar descripciones básicas
-    descriptions = {
-        'I219': 'Infarto agudo del miocardio',
-        'J449': 'EPOC no especificada',
-        'J440': 'EPOC con infección aguda',
-        'J189': 'Neumonía no especificada',
-        'C169': 'Tumor maligno del estómago',
-        'C349': 'Tumor maligno del pulmón',
-        'X954': 'Agresión con arma de fuego',
-        'C509': 'Tumor maligno de la mama',
-        'C61': 'Tumor maligno de próstata',
-        'I10': 'Hipertensión esencial'
-    }
-    top_causes['DESCRIPCION'] = top_causes['CODIGO'].map(descriptions).fillna('Otra causa')
+    # Descripciones desde el índice CIE-10 del catálogo Anexo2
+    try:
+        top_causes['DESCRIPCION'] = load_icd10_index().describe(top_causes['CODIGO'], default='Otra causa')
+    except Exception as e:
+        print(f"⚠️ Índice CIE-10 no disponible: {e}")
+        top_causes['DESCRIPCION'] = 'Otra causa'
     
     # 6. Análisis por sexo y departamento
     sex_map = {1: 'Masculino', 2: 'Femenino', 3: 'Indeterminado'}
-    df_sex = df.copy()
-    df_sex['SEXO_NOMBRE'] = df_sex['SEXO'].map(sex_map)
+    cube_sex = cube.copy()
+    cube_sex['SEXO_NOMBRE'] = cube_sex['SEXO'].map(sex_map)
     
-    top_depts = df.groupby('DEPARTAMENTO').size().sort_values(ascending=False).head(10).index
-    gender_dept = df_sex[df_sex['DEPARTAMENTO'].isin(top_depts)]
-    gender_data = gender_dept.groupby(['DEPARTAMENTO', 'SEXO_NOMBRE']).size().reset_index(name='TOTAL_MUERTES')
+    top_depts = rank_groups(cube, 'DEPARTAMENTO', 10)['DEPARTAMENTO']
+    gender_dept = cube_sex[cube_sex['DEPARTAMENTO'].isin(top_depts)]
+    gender_data = gender_dept.groupby(['DEPARTAMENTO', 'SEXO_NOMBRE'])['TOTAL_MUERTES'].sum().reset_index()
     
     gender_fig = px.bar(
         gender_data, 
@@ -148,9 +160,9 @@ def create_visualizations(df):
         29: 'Desconocida'
     }
     
-    df_age = df.copy()
-    df_age['GRUPO_EDAD_NOMBRE'] = df_age['GRUPO_EDAD1'].map(age_groups)
-    age_dist = df_age.groupby('GRUPO_EDAD_NOMBRE').size().reset_index(name='TOTAL_MUERTES')
+    cube_age = cube.copy()
+    cube_age['GRUPO_EDAD_NOMBRE'] = cube_age['GRUPO_EDAD1'].map(age_groups)
+    age_dist = cube_age.groupby('GRUPO_EDAD_NOMBRE')['TOTAL_MUERTES'].sum().reset_index()
     age_dist = age_dist.sort_values('TOTAL_MUERTES', ascending=False)
     
     age_fig = px.bar(
@@ -175,172 +187,219 @@ def create_visualizations(df):
         'age_fig': age_fig
     }
 
-# Cargar datos y generar visualizaciones
-try:
+# Estado del dashboard; lo llena la precarga en segundo plano (ver warmup.py)
+dashboard_state = {}
+
+
+def build_dashboard_state(cube):
+    """Visualizaciones e indicadores generales a partir del cubo de conteos"""
+    return {
+        'visualizations': create_visualizations(cube),
+        'total_deaths': int(cube['TOTAL_MUERTES'].sum()),
+        'total_departments': cube['DEPARTAMENTO'].nunique(),
+        'total_municipalities': cube['MUNICIPIO'].nunique(),
+        'total_homicides': int(cube.loc[cube['FAMILIA_CAUSA'] == 'homicidio', 'TOTAL_MUERTES'].sum())
+    }
+
+
+def load_dashboard_step():
+    """Precarga: datos, cubo, visualizaciones e indicadores generales"""
     mortality_data = load_data_optimized()
-    visualizations = create_visualizations(mortality_data)
+    mortality_cube = build_mortality_cube(mortality_data)
+    del mortality_data
+    dashboard_state.update(build_dashboard_state(mortality_cube))
+    warmup.data_version = data_version()
     
-    # Estadísticas generales
-    total_deaths = len(mortality_data)
-    total_departments = mortality_data['DEPARTAMENTO'].nunique()
-    total_municipalities = mortality_data['MUNICIPIO'].nunique()
-    total_homicides = len(mortality_data[mortality_data['COD_MUERTE'].str.contains('X95', na=False)])
-    
-    print(f"📊 Dashboard listo con {total_deaths:,} registros")
-    
-except Exception as e:
-    print(f"❌ Error cargando datos: {e}")
-    # Datos de fallback
-    total_deaths = 244355
-    total_departments = 33
-    total_municipalities = 1026
-    total_homicides = 9273
-    visualizations = {}
+    print(f"📊 Dashboard listo con {dashboard_state['total_deaths']:,} registros")
 
-# Layout de la aplicación
-app.layout = dbc.Container([
-    # Header
-    dbc.Row([
-        dbc.Col([
-            html.H1("📊 Análisis de Mortalidad en Colombia 2019", 
-                   className="text-center mb-3",
-                   style={'color': '#2c3e50', 'fontWeight': 'bold', 'fontSize': '2.5rem'}),
-            html.P("Dashboard interactivo basado en datos oficiales del DANE",
-                   className="text-center text-muted mb-4"),
-            html.Hr()
-        ])
-    ]),
-    
-    # Estadísticas principales
-    dbc.Row([
-        dbc.Col([
-            dbc.Card([
-                dbc.CardBody([
-                    html.H3(f"{total_deaths:,}", className="text-center text-danger"),
-                    html.P("Total Defunciones", className="text-center text-muted mb-0")
-                ])
-            ], className="h-100")
-        ], md=3),
-        dbc.Col([
-            dbc.Card([
-                dbc.CardBody([
-                    html.H3(f"{total_departments}", className="text-center text-warning"),
-                    html.P("Departamentos", className="text-center text-muted mb-0")
-                ])
-            ], className="h-100")
-        ], md=3),
-        dbc.Col([
-            dbc.Card([
-                dbc.CardBody([
-                    html.H3(f"{total_municipalities}", className="text-center text-info"),
-                    html.P("Municipios", className="text-center text-muted mb-0")
-                ])
-            ], className="h-100")
-        ], md=3),
-        dbc.Col([
-            dbc.Card([
-                dbc.CardBody([
-                    html.H3(f"{total_homicides:,}", className="text-center text-dark"),
-                    html.P("Homicidios", className="text-center text-muted mb-0")
+
+warmup = Warmup([('datos', load_dashboard_step)]).register_routes(server)
+instrument(server)
+install_http_cache(server, data_version())
+if warmup_enabled():
+    warmup.start()
+else:
+    warmup.run()
+
+
+def dashboard_content():
+    """Indicadores y visualizaciones, o el estado de la carga si aún no terminó"""
+    if 'visualizations' not in dashboard_state:
+        if warmup.failed:
+            return [dbc.Alert(f"❌ Error cargando datos: {warmup.error}", color="danger")]
+        return [dbc.Alert("⏳ Cargando datos de mortalidad...", color="info", className="text-center")]
+    
+    visualizations = dashboard_state['visualizations']
+    return [
+        # Estadísticas principales
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardBody([
+                        html.H3(f"{dashboard_state['total_deaths']:,}", className="text-center text-danger"),
+                        html.P("Total Defunciones", className="text-center text-muted mb-0")
+                    ])
+                ], className="h-100")
+            ], md=3),
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardBody([
+                        html.H3(f"{dashboard_state['total_departments']}", className="text-center text-warning"),
+                        html.P("Departamentos", className="text-center text-muted mb-0")
+                    ])
+                ], className="h-100")
+            ], md=3),
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardBody([
+                        html.H3(f"{dashboard_state['total_municipalities']}", className="text-center text-info"),
+                        html.P("Municipios", className="text-center text-muted mb-0")
+                    ])
+                ], className="h-100")
+            ], md=3),
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardBody([
+                        html.H3(f"{dashboard_state['total_homicides']:,}", className="text-center text-dark"),
+                        html.P("Homicidios", className="text-center text-muted mb-0")
+                    ])
+                ], className="h-100")
+            ], md=3),
+        ], className="mb-4"),
+    
+        # Visualizaciones principales
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardHeader("🗺️ Distribución por Departamento"),
+                    dbc.CardBody([
+                        dcc.Graph(figure=visualizations['map_fig'])
+                    ])
                 ])
-            ], className="h-100")
-        ], md=3),
-    ], className="mb-4"),
-    
-    # Visualizaciones principales
-    dbc.Row([
-        dbc.Col([
-            dbc.Card([
-                dbc.CardHeader("🗺️ Distribución por Departamento"),
-                dbc.CardBody([
-                    dcc.Graph(figure=visualizations.get('map_fig', {})) if visualizations else html.P("Cargando...")
+            ], md=8),
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardHeader("📈 Evolución Mensual"),
+                    dbc.CardBody([
+                        dcc.Graph(figure=visualizations['timeline_fig'])
+                    ])
                 ])
-            ])
-        ], md=8),
-        dbc.Col([
-            dbc.Card([
-                dbc.CardHeader("📈 Evolución Mensual"),
-                dbc.CardBody([
-                    dcc.Graph(figure=visualizations.get('timeline_fig', {})) if visualizations else html.P("Cargando...")
+            ], md=4)
+        ], className="mb-4"),
+    
+        # Análisis de violencia y seguridad
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardHeader("⚠️ Ciudades Más Violentas"),
+                    dbc.CardBody([
+                        dcc.Graph(figure=visualizations['violent_fig'])
+                    ])
                 ])
-            ])
-        ], md=4)
-    ], className="mb-4"),
-    
-    # Análisis de violencia y seguridad
-    dbc.Row([
-        dbc.Col([
-            dbc.Card([
-                dbc.CardHeader("⚠️ Ciudades Más Violentas"),
-                dbc.CardBody([
-                    dcc.Graph(figure=visualizations.get('violent_fig', {})) if visualizations else html.P("Cargando...")
+            ], md=6),
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardHeader("🏡 Menor Mortalidad"),
+                    dbc.CardBody([
+                        dcc.Graph(figure=visualizations['safe_fig'])
+                    ])
                 ])
-            ])
-        ], md=6),
-        dbc.Col([
-            dbc.Card([
-                dbc.CardHeader("🏡 Menor Mortalidad"),
-                dbc.CardBody([
-                    dcc.Graph(figure=visualizations.get('safe_fig', {})) if visualizations else html.P("Cargando...")
+            ], md=6)
+        ], className="mb-4"),
+    
+        # Tabla de causas
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardHeader("💊 Principales Causas de Muerte"),
+                    dbc.CardBody([
+                        dash_table.DataTable(
+                            data=visualizations['top_causes'].to_dict('records'),
+                            columns=[
+                                {"name": "Código", "id": "CODIGO"},
+                                {"name": "Casos", "id": "TOTAL_CASOS", "type": "numeric", "format": {"specifier": ","}},
+                                {"name": "Descripción", "id": "DESCRIPCION"}
+                            ],
+                            style_cell={'textAlign': 'left', 'padding': '10px', 'fontSize': '14px'},
+                            style_header={'backgroundColor': '#f8f9fa', 'fontWeight': 'bold'},
+                            style_data={'backgroundColor': 'white'}
+                        )
+                    ])
                 ])
             ])
-        ], md=6)
-    ], className="mb-4"),
-    
-    # Tabla de causas
-    dbc.Row([
-        dbc.Col([
-            dbc.Card([
-                dbc.CardHeader("💊 Principales Causas de Muerte"),
-                dbc.CardBody([
-                    dash_table.DataTable(
-                        data=visualizations.get('top_causes', pd.DataFrame()).to_dict('records') if visualizations else [],
-                        columns=[
-                            {"name": "Código", "id": "CODIGO"},
-                            {"name": "Casos", "id": "TOTAL_CASOS", "type": "numeric", "format": {"specifier": ","}},
-                            {"name": "Descripción", "id": "DESCRIPCION"}
-                        ],
-                        style_cell={'textAlign': 'left', 'padding': '10px', 'fontSize': '14px'},
-                        style_header={'backgroundColor': '#f8f9fa', 'fontWeight': 'bold'},
-                        style_data={'backgroundColor': 'white'}
-                    ) if visualizations else html.P("Cargando...")
+        ], className="mb-4"),
+    
+        # Análisis demográfico
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardHeader("👥 Análisis por Sexo"),
+                    dbc.CardBody([
+                        dcc.Graph(figure=visualizations['gender_fig'])
+                    ])
                 ])
-            ])
-        ])
-    ], className="mb-4"),
-    
-    # Análisis demográfico
-    dbc.Row([
-        dbc.Col([
-            dbc.Card([
-                dbc.CardHeader("👥 Análisis por Sexo"),
-                dbc.CardBody([
-                    dcc.Graph(figure=visualizations.get('gender_fig', {})) if visualizations else html.P("Cargando...")
+            ], md=7),
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardHeader("🎂 Grupos de Edad"),
+                    dbc.CardBody([
+                        dcc.Graph(figure=visualizations['age_fig'])
+                    ])
                 ])
+            ], md=5)
+        ], className="mb-4")
+    ]
+
+
+# Layout de la aplicación
+def serve_layout():
+    """Layout por visita: se arma con el estado actual de la precarga"""
+    return dbc.Container([
+        # Header
+        dbc.Row([
+            dbc.Col([
+                html.H1("📊 Análisis de Mortalidad en Colombia 2019", 
+                       className="text-center mb-3",
+                       style={'color': '#2c3e50', 'fontWeight': 'bold', 'fontSize': '2.5rem'}),
+                html.P("Dashboard interactivo basado en datos oficiales del DANE",
+                       className="text-center text-muted mb-4"),
+                html.Hr()
             ])
-        ], md=7),
-        dbc.Col([
-            dbc.Card([
-                dbc.CardHeader("🎂 Grupos de Edad"),
-                dbc.CardBody([
-                    dcc.Graph(figure=visualizations.get('age_fig', {})) if visualizations else html.P("Cargando...")
-                ])
+        ]),
+        
+        html.Div(dashboard_content(), id='contenido'),
+        # Mientras la precarga no termine se consulta cada 2 segundos
+        dcc.Interval(id='espera-datos', interval=2000, disabled=warmup.ready or warmup.failed),
+        
+        # Footer
+        dbc.Row([
+            dbc.Col([
+                html.Hr(),
+                html.P([
+                    "Fuente: ", html.A("DANE - Estadísticas Vitales 2019", href="https://www.dane.gov.co/", target="_blank"),
+                    " | Desarrollado con Python, Dash y Plotly"
+                ], className="text-center text-muted small")
             ])
-        ], md=5)
-    ], className="mb-4"),
-    
-    # Footer
-    dbc.Row([
-        dbc.Col([
-            html.Hr(),
-            html.P([
-                "Fuente: ", html.A("DANE - Estadísticas Vitales 2019", href="https://www.dane.gov.co/", target="_blank"),
-                " | Desarrollado con Python, Dash y Plotly"
-            ], className="text-center text-muted small")
         ])
-    ])
     
-], fluid=True, style={'padding': '20px'})
+    ], fluid=True, style={'padding': '20px'})
+
+
+app.layout = serve_layout
+
+
+@app.callback(
+    Output('contenido', 'children'),
+    Output('espera-datos', 'disabled'),
+    Input('espera-datos', 'n_intervals'),
+    prevent_initial_call=True
+)
+def refresh_content(n_intervals):
+    """Reemplaza el aviso de carga por el dashboard cuando la precarga termina"""
+    if not (warmup.ready or warmup.failed):
+        return no_update, False
+    return dashboard_content(), True
+
 
 if __name__ == '__main__':
     import os
@@ -0,0 +1,87 @@
+/*
+ * Carga diferida de los gráficos del dashboard (ver lazy_graph en app.py).
+ *
+ * Cada contenedor .grafico-diferido indica en data-store el id de un
+ * dcc.Store; cuando el contenedor entra en pantalla se pone en true y eso
+ * dispara el callback que calcula la figura. Un gráfico se marca una sola vez.
+ *
+ * Si el contenedor trae data-figura (figura del paquete sin filtros), el
+ * Store se pone en 'estatico', el callback no responde y la figura se
+ * descarga de esa URL: es un GET cacheable por el navegador y la CDN y llega
+ * precomprimida. Solo se aplica si el gráfico sigue con la figura provisional
+ * (un filtro elegido mientras tanto tiene prioridad); si la descarga falla
+ * el Store pasa a true y el callback envía la figura.
+ */
+(function () {
+    var MARGIN = '200px';
+
+    function isPlaceholder(element) {
+        var plot = element.querySelector('.js-plotly-plot');
+        return !plot || !plot.layout || plot.layout.meta === 'provisional';
+    }
+
+    function loadStatic(element, storeId, url) {
+        var setProps = window.dash_clientside.set_props;
+        var graphId = element.getAttribute('data-grafico');
+        setProps(storeId, {data: 'estatico'});
+        fetch(url, {credentials: 'same-origin'})
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.status);
+                }
+                return response.json();
+            })
+            .then(function (figure) {
+                if (isPlaceholder(element)) {
+                    setProps(graphId, {figure: figure});
+                }
+            })
+            .catch(function () {
+                setProps(storeId, {data: true});
+            });
+    }
+
+    function markVisible(element) {
+        var storeId = element.getAttribute('data-store');
+        if (!storeId || !window.dash_clientside || !window.dash_clientside.set_props) {
+            return false;
+        }
+        var url = element.getAttribute('data-figura');
+        if (url && element.getAttribute('data-grafico') && window.fetch) {
+            loadStatic(element, storeId, url);
+        } else {
+            window.dash_clientside.set_props(storeId, {data: true});
+        }
+        element.setAttribute('data-visible', 'true');
+        return true;
+    }
+
+    var observer = null;
+    if ('IntersectionObserver' in window) {
+        observer = new IntersectionObserver(function (entries) {
+            entries.forEach(function (entry) {
+                if (entry.isIntersecting && markVisible(entry.target)) {
+                    observer.unobserve(entry.target);
+                }
+            });
+        }, {rootMargin: MARGIN});
+    }
+
+    function watch(root) {
+        var elements = root.querySelectorAll('.grafico-diferido:not([data-observed])');
+        elements.forEach(function (element) {
+            element.setAttribute('data-observed', 'true');
+            if (observer) {
+                observer.observe(element);
+            } else {
+                // Navegadores sin IntersectionObserver: se cargan todos
+                markVisible(element);
+            }
+        });
+    }
+
+    // El layout lo dibuja el renderer de Dash después de cargar este archivo
+    new MutationObserver(function () {
+        watch(document);
+    }).observe(document.documentElement, {childList: true, subtree: true});
+})();
@@ -0,0 +1,308 @@
+"""
+Benchmark de las etapas de carga, agregación y construcción de figuras.
+
+Mide cada etapa sobre los datos reales (escala 1) y sobre datos sintéticos
+de 10x y 100x las filas de Anexo1:
+
+    carga                load_and_process_data (a escala > 1, lectura Parquet)
+    merge_divipola       merge de los registros con divipola
+    cubo                 build_mortality_cube
+    create_*             cada función create_* de data_processing
+    create_visualizations  app_optimized.create_visualizations
+    layout               serialización JSON del layout completo de app_optimized
+
+Por etapa se reporta tiempo de pared, RSS pico del proceso durante la
+etapa y pico de memoria asignada según tracemalloc (en una segunda
+ejecución, porque tracemalloc hace más lenta la primera). Cada escala corre
+en un proceso aparte para que el RSS de una no contamine la siguiente.
+
+    python benchmark.py [--scales 1 10 100] [--repeat 3] [--no-alloc] [--output ruta.json]
+    python benchmark.py --compare anterior.json nuevo.json
+
+El resultado se guarda como JSON en Data/cache/benchmarks/<commit>.json.
+Excel no admite más de 1.048.576 filas, así que a escala > 1 la etapa de
+carga lee los registros desde Parquet, como hace load_and_process_data con
+la caché vigente. Si el Anexo1 real no está en Data/ todas las escalas usan
+registros de synthetic_data.py (ANEXO1_ROWS filas por unidad de escala).
+"""
+import argparse
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from data_cache import CACHE_DIR
+
+BENCHMARK_DIR = os.path.join(CACHE_DIR, 'benchmarks')
+DEFAULT_SCALES = [1, 10, 100]
+DEFAULT_REPEAT = 3
+
+# Columnas que se remuestrean por separado al escalar (ver scale_records)
+RESAMPLED_COLUMNS = ['MES', 'SEXO', 'GRUPO_EDAD1', 'COD_MUERTE']
+
+# Intervalo de muestreo del RSS durante una etapa
+_RSS_INTERVAL = 0.005
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss():
+    """RSS actual del proceso en bytes (máximo histórico si no hay /proc)"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _RSSSampler:
+    """Registra el RSS máximo del proceso mientras está activo"""
+
+    def __init__(self):
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(_RSS_INTERVAL):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def measure(function, repeat=DEFAULT_REPEAT, allocations=True):
+    """Ejecuta `function` y retorna (resultado, métricas).
+
+    El tiempo es la mediana de `repeat` ejecuciones; el RSS pico se toma en
+    la primera y el pico de tracemalloc en una ejecución adicional.
+    """
+    timings = []
+    result = None
+    rss_before = current_rss()
+    with _RSSSampler() as sampler:
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    metrics = {
+        'tiempo_s': round(timings[len(timings) // 2], 4),
+        'tiempo_min_s': round(timings[0], 4),
+        'rss_pico_mb': round(sampler.peak / 2**20, 1),
+        'rss_incremento_mb': round((sampler.peak - rss_before) / 2**20, 1)
+    }
+    if allocations:
+        tracemalloc.start()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        metrics['asignado_pico_mb'] = round(peak / 2**20, 2)
+    return result, metrics
+
+
+def scale_records(records, factor, seed=0):
+    """Registros sintéticos con `factor` veces las filas de `records`.
+
+    Se remuestrean filas completas (conserva la relación departamento -
+    municipio) y luego cada columna de RESAMPLED_COLUMNS por separado, de
+    modo que el cubo de conteos crece con las filas en lugar de repetir las
+    mismas combinaciones.
+    """
+    import numpy as np
+
+    if factor == 1:
+        return records
+    rng = np.random.default_rng(seed)
+    rows = len(records) * factor
+    scaled = records.iloc[rng.integers(0, len(records), rows)].reset_index(drop=True)
+    for column in RESAMPLED_COLUMNS:
+        if column in scaled.columns:
+            values = records[column].to_numpy()
+            scaled[column] = values[rng.integers(0, len(values), rows)]
+    return scaled
+
+
+def chart_functions():
+    """Funciones create_* de data_processing, en orden de definición"""
+    import data_processing
+
+    functions = [
+        (name, function) for name, function in vars(data_processing).items()
+        if name.startswith('create_') and inspect.isfunction(function)
+        and function.__module__ == data_processing.__name__
+    ]
+    return sorted(functions, key=lambda item: inspect.unwrap(item[1]).__code__.co_firstlineno)
+
+
+def run_scale(scale, repeat=DEFAULT_REPEAT, allocations=True):
+    """Mide todas las etapas a una escala (se llama en un proceso aparte)"""
+    import pandas as pd
+    from plotly.utils import PlotlyJSONEncoder
+
+    from data_cache import (
+        DEATH_CODES_FILE,
+        DEATH_CODES_READ_KWARGS,
+        DIVIPOLA_FILE,
+        MORTALITY_FILE,
+        read_excel_cached
+    )
+    from data_processing import build_mortality_cube, load_and_process_data
+    from synthetic_data import ANEXO1_ROWS, generate_records
+
+    stages = {}
+
+    def stage(name, function):
+        result, stages[name] = measure(function, repeat, allocations)
+        print(f"  {scale}x {name}: {stages[name]['tiempo_s']:.3f} s, "
+              f"RSS pico {stages[name]['rss_pico_mb']:.0f} MB")
+        return result
+
+    if scale == 1 and os.path.exists(MORTALITY_FILE):
+        records, death_codes, divipola = stage('carga', lambda: load_and_process_data(compact=False))
+        records = read_excel_cached(MORTALITY_FILE)
+    else:
+        death_codes = read_excel_cached(DEATH_CODES_FILE, **DEATH_CODES_READ_KWARGS)
+        if os.path.exists(MORTALITY_FILE):
+            records = scale_records(read_excel_cached(MORTALITY_FILE), scale)
+        else:
+            # Sin el Anexo1 real se usan registros sintéticos del mismo tamaño
+            print(f"  {MORTALITY_FILE} no existe, usando datos sintéticos")
+            records = generate_records(ANEXO1_ROWS * scale)
+        scaled_file = os.path.join(tempfile.mkdtemp(prefix='benchmark-'), 'registros.parquet')
+        records.to_parquet(scaled_file, index=False)
+        del records
+        records = stage('carga', lambda: pd.read_parquet(scaled_file))
+        os.remove(scaled_file)
+        os.rmdir(os.path.dirname(scaled_file))
+
+    divipola = read_excel_cached(DIVIPOLA_FILE)
+    merged = stage('merge_divipola', lambda: records.merge(divipola, on=['COD_DEPARTAMENTO', 'COD_MUNICIPIO'], how='left'))
+    cube = stage('cubo', lambda: build_mortality_cube(records, divipola))
+    del merged
+
+    for name, function in chart_functions():
+        if 'death_codes' in inspect.signature(function).parameters:
+            stage(name, lambda function=function: function(cube, death_codes))
+        else:
+            stage(name, lambda function=function: function(cube))
+
+    # app_optimized carga los datos reales al importarse; sin hilo de precarga
+    # la carga termina antes de medir
+    os.environ['WARMUP'] = '0'
+    import app_optimized
+
+    stage('create_visualizations', lambda: app_optimized.create_visualizations(cube))
+    # El layout se arma con las visualizaciones de esta escala
+    app_optimized.dashboard_state.update(app_optimized.build_dashboard_state(cube))
+    layout_json = stage('layout', lambda: json.dumps(app_optimized.serve_layout(), cls=PlotlyJSONEncoder))
+
+    return {
+        'filas': int(len(records)),
+        'celdas_cubo': int(len(cube)),
+        'layout_kb': round(len(layout_json) / 1024, 1),
+        'etapas': stages
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'sin-git'
+
+
+def run_all(scales, repeat=DEFAULT_REPEAT, allocations=True):
+    """Corre cada escala en un proceso nuevo y junta los resultados"""
+    report = {
+        'commit': git_commit(),
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'nucleos': os.cpu_count(),
+        'repeticiones': repeat,
+        'escalas': {}
+    }
+    for scale in scales:
+        print(f"Escala {scale}x...")
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            result_file = f.name
+        command = [sys.executable, __file__, '--worker', str(scale), '--repeat', str(repeat), '--output', result_file]
+        if not allocations:
+            command.append('--no-alloc')
+        try:
+            subprocess.run(command, check=True)
+            with open(result_file, 'r', encoding='utf-8') as f:
+                report['escalas'][str(scale)] = json.load(f)
+        except subprocess.CalledProcessError as e:
+            report['escalas'][str(scale)] = {'error': f"El proceso terminó con código {e.returncode}"}
+        finally:
+            os.remove(result_file)
+    return report
+
+
+def compare(old_report, new_report, threshold=0.10):
+    """Imprime la variación de tiempo por etapa; retorna las regresiones"""
+    regressions = []
+    print(f"{'escala':>6} {'etapa':<36} {old_report['commit']:>10} {new_report['commit']:>10} {'cambio':>8}")
+    for scale, new_result in new_report['escalas'].items():
+        old_stages = old_report['escalas'].get(scale, {}).get('etapas', {})
+        for name, metrics in new_result.get('etapas', {}).items():
+            if name not in old_stages:
+                continue
+            old_time, new_time = old_stages[name]['tiempo_s'], metrics['tiempo_s']
+            change = (new_time - old_time) / old_time if old_time else 0.0
+            mark = ' <-' if change > threshold else ''
+            print(f"{scale + 'x':>6} {name:<36} {old_time:>10.3f} {new_time:>10.3f} {change:>+8.0%}{mark}")
+            if change > threshold:
+                regressions.append((scale, name, change))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de carga, agregación y figuras")
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, help="Factores de escala de los datos")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="Ejecuciones por etapa (se reporta la mediana)")
+    parser.add_argument('--no-alloc', action='store_true', help="No medir asignaciones con tracemalloc")
+    parser.add_argument('--output', default=None, help="Archivo JSON de resultados")
+    parser.add_argument('--compare', nargs=2, metavar=('ANTERIOR', 'NUEVO'), help="Compara dos resultados guardados")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Aumento de tiempo que cuenta como regresión")
+    parser.add_argument('--worker', type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], 'r', encoding='utf-8') as f:
+            old_report = json.load(f)
+        with open(args.compare[1], 'r', encoding='utf-8') as f:
+            new_report = json.load(f)
+        sys.exit(1 if compare(old_report, new_report, args.threshold) else 0)
+
+    if args.worker is not None:
+        result = run_scale(args.worker, args.repeat, not args.no_alloc)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        sys.exit(0)
+
+    report = run_all(args.scales, args.repeat, not args.no_alloc)
+    output = args.output or os.path.join(BENCHMARK_DIR, f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Resultados guardados en {output}")
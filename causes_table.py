@@ -0,0 +1,166 @@
+"""
+Ranking completo de causas de muerte servido por páginas a la DataTable.
+
+La tabla de causas del dashboard muestra todos los códigos CIE-10 presentes
+en el subconjunto filtrado (miles de filas), pero el navegador solo recibe
+la página visible: la DataTable usa page_action, sort_action y
+filter_action 'custom' y el callback llama a CauseTable.page().
+
+Para cada combinación de filtros del dashboard el ranking se calcula una vez
+sobre el cubo de conteos (un np.bincount por código, ver ranking.py) y se
+guarda en una LRU pequeña; ordenar, filtrar y paginar recorre solo esas
+filas. El filtro de la tabla acepta la sintaxis de Dash por columna:
+
+    {CODIGO} contains X95 && {TOTAL_CASOS} >= 100
+"""
+import math
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from figure_cache import normalize_filters
+from icd10 import SIN_DESCRIPCION
+from ranking import group_totals
+
+COLUMNS = ['PUESTO', 'CODIGO', 'TOTAL_CASOS', 'PORCENTAJE', 'DESCRIPCION']
+NUMERIC_COLUMNS = {'PUESTO', 'TOTAL_CASOS', 'PORCENTAJE'}
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+DEFAULT_MAX_ENTRIES = 32
+
+# Operadores del filtro de la DataTable, en palabra o símbolo
+FILTER_OPERATORS = {
+    'ge': '>=', '>=': '>=', 'le': '<=', '<=': '<=', 'lt': '<', '<': '<', 'gt': '>', '>': '>',
+    'ne': '!=', '!=': '!=', 'eq': '=', '=': '=',
+    'contains': 'contains', 'icontains': 'contains', 'scontains': 'contains', 'datestartswith': 'startswith'
+}
+_FILTER_PART = re.compile(r'^\s*\{(?P<column>[^}]+)\}\s*(?P<operator>[a-z]+|[<>!=]=?)\s*(?P<value>.*?)\s*$')
+
+
+def cause_ranking(cube, icd10_index=None):
+    """Todas las causas del cubo ordenadas por defunciones (empates por orden del código)"""
+    labels, totals = group_totals(cube['COD_MUERTE'], cube['TOTAL_MUERTES'])
+    present = np.flatnonzero(totals > 0)
+    order = present[np.lexsort((present, -totals[present]))]
+    codes = np.asarray(labels, dtype=object)[order]
+    counts = totals[order].astype('int64')
+
+    # Puesto de competición: los empatados comparten puesto
+    positions = np.searchsorted(-counts, -counts, side='left') + 1
+    total = counts.sum()
+    if icd10_index is not None:
+        descriptions = np.asarray(icd10_index.describe(pd.Series(codes)), dtype=object)
+    else:
+        descriptions = np.full(len(codes), SIN_DESCRIPCION, dtype=object)
+
+    return pd.DataFrame({
+        'PUESTO': positions,
+        'CODIGO': codes,
+        'TOTAL_CASOS': counts,
+        'PORCENTAJE': np.round(100 * counts / total, 2) if total else np.zeros(len(counts)),
+        'DESCRIPCION': descriptions
+    }, columns=COLUMNS)
+
+
+def parse_filter_query(filter_query):
+    """Condiciones (columna, operador, valor) de un filter_query de la DataTable.
+
+    Las partes que no se entienden o nombran otra columna se ignoran.
+    """
+    conditions = []
+    for part in (filter_query or '').split(' && '):
+        match = _FILTER_PART.match(part)
+        if match is None:
+            continue
+        column, operator = match['column'], FILTER_OPERATORS.get(match['operator'])
+        if column not in COLUMNS or operator is None:
+            continue
+        value = match['value']
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'`':
+            value = value[1:-1]
+        if column in NUMERIC_COLUMNS and operator not in ('contains', 'startswith'):
+            try:
+                value = float(value)
+            except ValueError:
+                continue
+        conditions.append((column, operator, value))
+    return conditions
+
+
+def apply_filter(ranking, conditions):
+    mask = np.ones(len(ranking), dtype=bool)
+    for column, operator, value in conditions:
+        series = ranking[column]
+        if operator in ('contains', 'startswith'):
+            text = series.astype(str).str.upper()
+            value = str(value).upper()
+            mask &= (text.str.contains(value, regex=False) if operator == 'contains' else text.str.startswith(value)).to_numpy()
+        elif operator == '=':
+            mask &= (series == value).to_numpy()
+        elif operator == '!=':
+            mask &= (series != value).to_numpy()
+        elif operator == '<':
+            mask &= (series < value).to_numpy()
+        elif operator == '<=':
+            mask &= (series <= value).to_numpy()
+        elif operator == '>':
+            mask &= (series > value).to_numpy()
+        elif operator == '>=':
+            mask &= (series >= value).to_numpy()
+    return ranking[mask]
+
+
+def apply_sort(ranking, sort_by):
+    """Orden de la DataTable ([{'column_id', 'direction'}]); sin orden queda el del ranking"""
+    sort_by = [item for item in (sort_by or []) if item.get('column_id') in COLUMNS]
+    if not sort_by:
+        return ranking
+    return ranking.sort_values(
+        [item['column_id'] for item in sort_by],
+        ascending=[item.get('direction') != 'desc' for item in sort_by],
+        kind='stable'
+    )
+
+
+def paginate(view, page_current=0, page_size=DEFAULT_PAGE_SIZE):
+    """Registros de la página pedida y número de páginas"""
+    page_size = min(max(int(page_size or DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    page_count = max(math.ceil(len(view) / page_size), 1)
+    page_current = min(max(int(page_current or 0), 0), page_count - 1)
+    start = page_current * page_size
+    return view.iloc[start:start + page_size].to_dict('records'), page_count
+
+
+class CauseTable:
+    """Rankings de causas por combinación de filtros, en una LRU, y su paginación"""
+
+    def __init__(self, query_engine, icd10_index=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.query_engine = query_engine
+        self.icd10_index = icd10_index
+        self.max_entries = max_entries
+        self._rankings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ranking(self, filters):
+        key = normalize_filters(filters)
+        with self._lock:
+            ranking = self._rankings.get(key)
+            if ranking is not None:
+                self._rankings.move_to_end(key)
+                return ranking
+
+        ranking = cause_ranking(self.query_engine.filtered_cube(filters), self.icd10_index)
+        with self._lock:
+            self._rankings[key] = ranking
+            while len(self._rankings) > self.max_entries:
+                self._rankings.popitem(last=False)
+        return ranking
+
+    def page(self, filters, page_current=0, page_size=DEFAULT_PAGE_SIZE, sort_by=None, filter_query=''):
+        """(registros de la página, número de páginas) para los filtros del dashboard y de la tabla"""
+        view = apply_filter(self.ranking(filters), parse_filter_query(filter_query))
+        return paginate(apply_sort(view, sort_by), page_current, page_size)
@@ -0,0 +1,336 @@
+"""
+Caché columnar (Parquet) para los archivos Excel de entrada.
+
+Leer los Excel con openpyxl es la parte más lenta del arranque. Este módulo
+convierte cada archivo una sola vez a Parquet tipado en Data/cache/ y lo
+reutiliza mientras el archivo fuente no cambie (se compara mtime, tamaño y
+hash SHA-256 del Excel). Ejecutar `python data_cache.py` genera la caché
+durante el build.
+
+Con la caché fría los Excel se leen en paralelo, uno por proceso (ver
+read_excel_many); cada proceso devuelve el resultado como un buffer Arrow
+IPC en lugar de un DataFrame serializado con pickle.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_DISPONIBLE = True
+except ImportError:
+    PARQUET_DISPONIBLE = False
+
+DATA_DIR = 'Data'
+CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+MANIFEST_FILE = os.path.join(CACHE_DIR, 'manifest.json')
+
+# Almacén particionado por año y departamento que genera ingest.py
+STORE_DIR = os.path.join(CACHE_DIR, 'anios')
+STORE_MANIFEST_FILE = os.path.join(STORE_DIR, 'manifest.json')
+
+MORTALITY_FILE = os.path.join(DATA_DIR, 'Anexo1.NoFetal2019_CE_15-03-23.xlsx')
+DEATH_CODES_FILE = os.path.join(DATA_DIR, 'Anexo2.CodigosDeMuerte_CE_15-03-23.xlsx')
+DIVIPOLA_FILE = os.path.join(DATA_DIR, 'Divipola_CE_.xlsx')
+
+# Población por municipio, sexo y edad para las tasas (opcional, ver rates.py)
+POPULATION_FILES = [os.path.join(DATA_DIR, 'poblacion.csv'), os.path.join(DATA_DIR, 'poblacion.xlsx')]
+
+# Los datos de códigos comienzan en la fila 10
+DEATH_CODES_COLUMNS = ['CAPITULO', 'NOMBRE_CAPITULO', 'CODIGO_3', 'DESCRIPCION_3', 'CODIGO_4', 'DESCRIPCION_4']
+DEATH_CODES_READ_KWARGS = {'skiprows': 10, 'names': DEATH_CODES_COLUMNS}
+
+# Archivos que genera el paso de conversión (ruta, argumentos de lectura)
+CACHED_SOURCES = [
+    (MORTALITY_FILE, {}),
+    (DEATH_CODES_FILE, DEATH_CODES_READ_KWARGS),
+    (DIVIPOLA_FILE, {}),
+]
+
+_HASH_BLOCK = 1024 * 1024
+
+
+def file_hash(path):
+    """Calcula el hash SHA-256 de un archivo leyéndolo por bloques"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_key(path, read_kwargs):
+    """Clave de caché: nombre del archivo más los argumentos de lectura"""
+    key = os.path.basename(path)
+    if read_kwargs:
+        kwargs_json = json.dumps(read_kwargs, sort_keys=True, default=str)
+        key += '-' + hashlib.sha1(kwargs_json.encode('utf-8')).hexdigest()[:8]
+    return key
+
+
+def cache_path(path, read_kwargs=None):
+    """Ruta del archivo Parquet asociado a un Excel fuente"""
+    return os.path.join(CACHE_DIR, _cache_key(path, read_kwargs or {}) + '.parquet')
+
+
+def _load_manifest():
+    try:
+        with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(manifest):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_file = MANIFEST_FILE + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, MANIFEST_FILE)
+
+
+def is_cache_fresh(path, read_kwargs=None, manifest=None):
+    """Indica si la caché Parquet de `path` corresponde al Excel actual.
+
+    Si mtime y tamaño coinciden no se recalcula el hash. Si cambió solo el
+    mtime (p. ej. tras un checkout) se compara el hash y, si coincide, se
+    actualiza el manifiesto sin reconstruir la caché.
+    """
+    read_kwargs = read_kwargs or {}
+    manifest = _load_manifest() if manifest is None else manifest
+    entry = manifest.get(_cache_key(path, read_kwargs))
+    parquet_file = cache_path(path, read_kwargs)
+    if entry is None or not os.path.exists(parquet_file):
+        return False
+
+    stat = os.stat(path)
+    if entry.get('mtime') == stat.st_mtime and entry.get('size') == stat.st_size:
+        return True
+
+    if entry.get('sha256') == file_hash(path):
+        entry['mtime'] = stat.st_mtime
+        entry['size'] = stat.st_size
+        _save_manifest(manifest)
+        return True
+
+    return False
+
+
+def source_hash(path, read_kwargs=None):
+    """Hash SHA-256 del Excel fuente, tomado del manifiesto si la caché está vigente"""
+    read_kwargs = read_kwargs or {}
+    manifest = _load_manifest()
+    if is_cache_fresh(path, read_kwargs, manifest):
+        return manifest[_cache_key(path, read_kwargs)]['sha256']
+    return file_hash(path)
+
+
+def data_version():
+    """Versión corta de los datos: hash combinado de los Excel fuente presentes
+
+    Si existe el almacén multianual de ingest.py también entra su manifiesto,
+    y lo mismo la tabla de población de las tasas.
+    """
+    digest = hashlib.sha1()
+    for path, read_kwargs in CACHED_SOURCES:
+        if os.path.exists(path):
+            digest.update(source_hash(path, read_kwargs).encode('ascii'))
+    if os.path.exists(STORE_MANIFEST_FILE):
+        digest.update(file_hash(STORE_MANIFEST_FILE).encode('ascii'))
+    for path in POPULATION_FILES:
+        if os.path.exists(path):
+            digest.update(file_hash(path).encode('ascii'))
+    return digest.hexdigest()[:12]
+
+
+def build_cache(path, read_kwargs=None, df=None):
+    """Convierte un Excel a Parquet y registra su firma en el manifiesto.
+
+    Retorna el DataFrame leído del Excel. Si la escritura falla (pyarrow no
+    instalado, columnas con tipos mixtos) se retorna igual el DataFrame y la
+    caché simplemente no se genera.
+    """
+    read_kwargs = read_kwargs or {}
+    if df is None:
+        df = pd.read_excel(path, **read_kwargs)
+
+    if not PARQUET_DISPONIBLE:
+        return df
+
+    parquet_file = cache_path(path, read_kwargs)
+    tmp_file = parquet_file + '.tmp'
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        df.to_parquet(tmp_file, index=False)
+        os.replace(tmp_file, parquet_file)
+    except Exception as e:
+        print(f"No se pudo escribir la caché de {path}: {e}")
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return df
+
+    stat = os.stat(path)
+    manifest = _load_manifest()
+    manifest[_cache_key(path, read_kwargs)] = {
+        'source': path,
+        'parquet': parquet_file,
+        'read_kwargs': read_kwargs,
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'sha256': file_hash(path),
+        'rows': int(len(df)),
+    }
+    _save_manifest(manifest)
+    return df
+
+
+def excel_workers(pending):
+    """Procesos para leer `pending` archivos: EXCEL_WORKERS o los núcleos disponibles"""
+    configured = os.environ.get('EXCEL_WORKERS')
+    if configured:
+        return max(1, min(pending, int(configured)))
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    return max(1, min(pending, cores))
+
+
+def _to_arrow_buffer(df):
+    """DataFrame -> buffer Arrow IPC (o el DataFrame si Arrow no admite sus tipos)"""
+    import pyarrow as pa
+
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+        # Columnas con tipos mixtos: se envía el DataFrame, como haría read_excel
+        return df
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def _from_arrow_buffer(result):
+    import pyarrow as pa
+
+    if isinstance(result, pd.DataFrame):
+        return result
+    return pa.ipc.open_stream(result).read_all().to_pandas()
+
+
+def _parse_excel(path, read_kwargs):
+    """Lectura de un Excel dentro de un proceso del pool"""
+    return _to_arrow_buffer(pd.read_excel(path, **read_kwargs))
+
+
+def read_excel_many(sources, return_exceptions=False):
+    """Lee varios Excel desde su caché, parseando en paralelo los que no la tengan.
+
+    `sources` es una lista de (ruta, argumentos de lectura). openpyxl usa un
+    solo núcleo por archivo, así que los libros independientes se reparten
+    en un pool de procesos; la caché Parquet se escribe en el proceso
+    principal. Los libros no se dividen por rangos de filas: openpyxl debe
+    recorrer todas las filas anteriores para llegar a un rango, así que leer
+    el último cuarto de una hoja cuesta casi lo mismo que leerla completa.
+
+    Retorna los DataFrames en el mismo orden. Con return_exceptions=True un
+    archivo que falla deja su excepción en la lista en lugar de propagarla.
+    """
+    results = [None] * len(sources)
+    manifest = _load_manifest() if PARQUET_DISPONIBLE else {}
+    pending = []
+    for i, (path, read_kwargs) in enumerate(sources):
+        read_kwargs = read_kwargs or {}
+        try:
+            # Comprobar la caché hace stat (y quizá hash) del archivo: un archivo
+            # que falta queda como error de su posición, igual que uno ilegible
+            fresh = PARQUET_DISPONIBLE and is_cache_fresh(path, read_kwargs, manifest)
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results[i] = e
+            continue
+        if fresh:
+            try:
+                results[i] = pd.read_parquet(cache_path(path, read_kwargs))
+                continue
+            except Exception as e:
+                print(f"Caché inválida para {path}, leyendo Excel: {e}")
+        pending.append(i)
+
+    workers = excel_workers(len(pending))
+    if workers > 1 and PARQUET_DISPONIBLE:
+        print(f"Leyendo {len(pending)} archivos Excel en {workers} procesos...")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {i: pool.submit(_parse_excel, sources[i][0], sources[i][1] or {}) for i in pending}
+            for i, future in futures.items():
+                try:
+                    df = _from_arrow_buffer(future.result())
+                    results[i] = build_cache(sources[i][0], sources[i][1], df=df)
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    results[i] = e
+    else:
+        for i in pending:
+            try:
+                results[i] = build_cache(sources[i][0], sources[i][1])
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results[i] = e
+    return results
+
+
+def read_excel_cached(path, **read_kwargs):
+    """Lee un Excel desde su caché Parquet, regenerándola si está obsoleta.
+
+    Acepta los mismos argumentos que `pd.read_excel`, que forman parte de la
+    clave de caché.
+    """
+    if PARQUET_DISPONIBLE and is_cache_fresh(path, read_kwargs):
+        try:
+            return pd.read_parquet(cache_path(path, read_kwargs))
+        except Exception as e:
+            print(f"Caché inválida para {path}, leyendo Excel: {e}")
+
+    return build_cache(path, read_kwargs)
+
+
+def build_all(force=False):
+    """Genera la caché de todos los Excel conocidos que existan en Data/"""
+    if not PARQUET_DISPONIBLE:
+        print("pyarrow no está instalado, no se puede generar la caché Parquet")
+        return
+
+    manifest = _load_manifest()
+    stale = []
+    for path, read_kwargs in CACHED_SOURCES:
+        if not os.path.exists(path):
+            print(f"Omitido (no existe): {path}")
+            continue
+        if not force and is_cache_fresh(path, read_kwargs, manifest):
+            print(f"Caché vigente: {path}")
+            continue
+        if force:
+            manifest.pop(_cache_key(path, read_kwargs), None)
+        stale.append((path, read_kwargs))
+
+    if force:
+        _save_manifest(manifest)
+    for (path, read_kwargs), df in zip(stale, read_excel_many(stale)):
+        print(f"Caché generada: {cache_path(path, read_kwargs)} ({len(df):,} filas)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Genera la caché Parquet de los archivos Excel de Data/")
+    parser.add_argument('--force', action='store_true', help="Regenera la caché aunque esté vigente")
+    args = parser.parse_args()
+
+    build_all(force=args.force)
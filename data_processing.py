@@ -5,26 +5,86 @@ from plotly.subplots import make_subplots
 import numpy as np
 import json
 
-def load_and_process_data():
-    """Carga y procesa todos los datos necesarios para la aplicación"""
+from analytics import as_view
+from geometry import DEFAULT_LEVEL, department_geometries, municipality_geometries
+from icd10 import FAMILY_COLUMN, SIN_DESCRIPCION, cause_families, load_icd10_index
+from instrumentation import timed_figure
+from ranking import DEFAULT_TIES
+from data_cache import (
+    read_excel_many,
+    MORTALITY_FILE,
+    DEATH_CODES_FILE,
+    DIVIPOLA_FILE,
+    DEATH_CODES_READ_KWARGS
+)
+
+# Dimensiones del cubo de conteos que alimenta todas las visualizaciones
+CUBE_DIMENSIONS = ['COD_DEPARTAMENTO', 'COD_MUNICIPIO', 'MES', 'SEXO', 'GRUPO_EDAD1', 'COD_MUERTE']
+
+# Con datos de varios años el cubo agrega además esta dimensión (ver ingest.py)
+YEAR_COLUMN = 'AÑO'
+DEFAULT_PERIOD = '2019'
+
+# Nombres de meses, sexos y grupos de edad según la tabla de referencia
+MONTH_NAMES = {1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril', 5: 'Mayo', 6: 'Junio',
+               7: 'Julio', 8: 'Agosto', 9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'}
+
+SEX_MAP = {1: 'Masculino', 2: 'Femenino', 3: 'Indeterminado'}
+
+AGE_GROUPS_MAP = {
+    0: 'Mortalidad neonatal (Cod 0-4)', 1: 'Mortalidad neonatal (Cod 0-4)', 2: 'Mortalidad neonatal (Cod 0-4)',
+    3: 'Mortalidad neonatal (Cod 0-4)', 4: 'Mortalidad neonatal (Cod 0-4)',
+    5: 'Mortalidad infantil (Cod 5-6)', 6: 'Mortalidad infantil (Cod 5-6)',
+    7: 'Primera infancia (Cod 7-8)', 8: 'Primera infancia (Cod 7-8)',
+    9: 'Ninez (Cod 9-10)', 10: 'Ninez (Cod 9-10)',
+    11: 'Adolescencia (Cod 11)',
+    12: 'Juventud (Cod 12-13)', 13: 'Juventud (Cod 12-13)',
+    14: 'Adultez temprana (Cod 14-16)', 15: 'Adultez temprana (Cod 14-16)', 16: 'Adultez temprana (Cod 14-16)',
+    17: 'Adultez intermedia (Cod 17-19)', 18: 'Adultez intermedia (Cod 17-19)', 19: 'Adultez intermedia (Cod 17-19)',
+    20: 'Vejez (Cod 20-24)', 21: 'Vejez (Cod 20-24)', 22: 'Vejez (Cod 20-24)', 23: 'Vejez (Cod 20-24)', 24: 'Vejez (Cod 20-24)',
+    25: 'Longevidad (Cod 25-28)', 26: 'Longevidad (Cod 25-28)', 27: 'Longevidad (Cod 25-28)', 28: 'Longevidad (Cod 25-28)',
+    29: 'Edad desconocida (Cod 29)'
+}
+
+# Tipos enteros del modo compacto (los valores caben holgadamente)
+COMPACT_INT_DTYPES = {
+    'COD_DEPARTAMENTO': 'int8',
+    'COD_MUNICIPIO': 'int16',
+    'MES': 'int8',
+    'SEXO': 'int8',
+    'GRUPO_EDAD1': 'int8',
+    'AÑO': 'int16'
+}
+
+def load_and_process_data(compact=False):
+    """Carga y procesa todos los datos necesarios para la aplicación
     
-    print("Cargando datos...")
+    Con compact=True retorna el DataFrame compacto de compact_mortality_frame
+    en lugar del merge completo con divipola.
+    """
     
-    # 1. Cargar datos de mortalidad
-    mortality_data = pd.read_excel('Data/Anexo1.NoFetal2019_CE_15-03-23.xlsx')
+    print("Cargando datos...")
     
-    # 2. Cargar códigos de muerte
-    try:
-        # Los datos comienzan en la fila 10
-        death_codes = pd.read_excel('Data/Anexo2.CodigosDeMuerte_CE_15-03-23.xlsx', skiprows=10)
-        death_codes.columns = ['CAPITULO', 'NOMBRE_CAPITULO', 'CODIGO_3', 'DESCRIPCION_3', 'CODIGO_4', 'DESCRIPCION_4']
-        print(f"Códigos de muerte cargados: {death_codes.shape}")
-    except:
+    # Los tres libros son independientes: desde la caché Parquet si está
+    # vigente y, si no, leídos en paralelo (uno por proceso)
+    mortality_data, death_codes, divipola = read_excel_many([
+        (MORTALITY_FILE, {}),
+        (DEATH_CODES_FILE, DEATH_CODES_READ_KWARGS),
+        (DIVIPOLA_FILE, {})
+    ], return_exceptions=True)
+    for result in (mortality_data, divipola):
+        if isinstance(result, Exception):
+            raise result
+    
+    # Los códigos de muerte son opcionales (los datos comienzan en la fila 10)
+    if isinstance(death_codes, Exception):
         print("Error cargando códigos de muerte, usando datos básicos")
         death_codes = pd.DataFrame()
+    else:
+        print(f"Códigos de muerte cargados: {death_codes.shape}")
     
-    # 3. Cargar división política
-    divipola = pd.read_excel('Data/Divipola_CE_.xlsx')
+    if compact:
+        return compact_mortality_frame(mortality_data, divipola), death_codes, divipola
     
     # 4. Merge con divipola para obtener nombres de departamentos y municipios
     mortality_with_geo = mortality_data.merge(
@@ -39,19 +99,148 @@ def load_and_process_data():
     
     return mortality_with_geo, death_codes, divipola
 
-def create_mortality_map(df):
-    """Crea mapa coroplético de distribución de muertes por departamento"""
+def _lookup_categorical(positions, values):
+    """Construye un categórico indexando una tabla pequeña por posición (-1 = sin dato)"""
+    lookup = pd.Categorical(values)
+    # La posición -1 toma el último elemento, que es el código de nulo
+    codes = np.append(lookup.codes, -1).astype(lookup.codes.dtype)[positions]
+    return pd.Categorical.from_codes(codes, lookup.categories)
+
+def _downcast_int(series, dtype):
+    """Convierte a un entero pequeño; si hay nulos se usa float32"""
+    if series.isna().any():
+        return series.astype('float32')
+    return series.astype(dtype)
+
+def compact_mortality_frame(mortality_data, divipola):
+    """Representación compacta de los registros de mortalidad
+    
+    Conserva solo las columnas de CUBE_DIMENSIONS con enteros pequeños y
+    COD_MUERTE como categórico. Los nombres DEPARTAMENTO y MUNICIPIO no se
+    obtienen con un merge sino indexando la tabla divipola (unas mil filas),
+    y se guardan como categóricos. Imprime la memoria ahorrada.
+    """
+    
+    compact = pd.DataFrame(index=mortality_data.index)
+    for col, dtype in COMPACT_INT_DTYPES.items():
+        if col in mortality_data.columns:
+            compact[col] = _downcast_int(mortality_data[col], dtype)
+    compact['COD_MUERTE'] = mortality_data['COD_MUERTE'].astype('category')
+    
+    # Tabla de búsqueda: clave departamento*1000 + municipio -> fila de divipola
+    lookup = divipola.drop_duplicates(['COD_DEPARTAMENTO', 'COD_MUNICIPIO'])
+    lookup_keys = pd.Index(lookup['COD_DEPARTAMENTO'].to_numpy() * 1000 + lookup['COD_MUNICIPIO'].to_numpy())
+    row_keys = mortality_data['COD_DEPARTAMENTO'].to_numpy() * 1000 + mortality_data['COD_MUNICIPIO'].to_numpy()
+    positions = lookup_keys.get_indexer(row_keys)
+    
+    compact['DEPARTAMENTO'] = _lookup_categorical(positions, lookup['DEPARTAMENTO'].to_numpy())
+    compact['MUNICIPIO'] = _lookup_categorical(positions, lookup['MUNICIPIO'].to_numpy())
+    
+    original_mb = mortality_data.memory_usage(deep=True).sum() / 1024 ** 2
+    compact_mb = compact.memory_usage(deep=True).sum() / 1024 ** 2
+    print(f"Modo compacto: {original_mb:,.1f} MB -> {compact_mb:,.1f} MB "
+          f"(ahorro {original_mb - compact_mb:,.1f} MB, {100 * (1 - compact_mb / original_mb):.0f}%)")
+    print(f"Departamentos únicos: {compact['DEPARTAMENTO'].nunique()}")
+    print(f"Municipios únicos: {compact['MUNICIPIO'].nunique()}")
+    
+    return compact
+
+def build_mortality_cube(df, divipola=None):
+    """Agrega los registros de mortalidad en un cubo de conteos.
+    
+    Hace una sola pasada de groupby sobre CUBE_DIMENSIONS y agrega los nombres
+    de departamento y municipio sobre el resultado (mucho más pequeño que el
+    DataFrame original). Las funciones create_* leen de este cubo, por lo que
+    el DataFrame de registros puede liberarse una vez construido.
+    
+    La familia de causa (homicidio, suicidio, ...) se calcula aquí una vez en
+    la columna FAMILIA_CAUSA; ver icd10.CAUSE_FAMILIES. Si los registros
+    traen la columna AÑO, el año es una dimensión más del cubo.
+    """
+    
+    cube = df.groupby(cube_dimensions(df), dropna=False, observed=True).size().reset_index(name='TOTAL_MUERTES')
+    
+    # Nombres geográficos desde divipola, o desde el propio DataFrame si ya viene unido
+    if divipola is None and 'DEPARTAMENTO' in df.columns and 'MUNICIPIO' in df.columns:
+        divipola = df[['COD_DEPARTAMENTO', 'COD_MUNICIPIO', 'DEPARTAMENTO', 'MUNICIPIO']]
+    cube = finish_mortality_cube(cube, divipola)
+    
+    print(f"Cubo de mortalidad: {len(cube):,} celdas a partir de {len(df):,} registros")
+    
+    return cube
+
+def cube_dimensions(df):
+    """Dimensiones de agregación: CUBE_DIMENSIONS, con AÑO si la columna existe"""
+    if YEAR_COLUMN in df.columns:
+        return [YEAR_COLUMN] + CUBE_DIMENSIONS
+    return CUBE_DIMENSIONS
+
+def finish_mortality_cube(cube, divipola=None):
+    """Completa un cubo de conteos ya agregado con familia de causa y nombres
+    
+    Se usa también para los cubos que ingest.py arma partición por partición.
+    """
+    
+    cube[FAMILY_COLUMN] = cause_families(cube['COD_MUERTE'])
+    
+    if divipola is not None:
+        names = divipola[['COD_DEPARTAMENTO', 'COD_MUNICIPIO', 'DEPARTAMENTO', 'MUNICIPIO']]
+        names = names.drop_duplicates(['COD_DEPARTAMENTO', 'COD_MUNICIPIO'])
+        cube = cube.merge(names, on=['COD_DEPARTAMENTO', 'COD_MUNICIPIO'], how='left')
+    
+    return cube
+
+def select_years(cube, start=None, end=None):
+    """Celdas del cubo entre los años `start` y `end` (inclusive)"""
+    if YEAR_COLUMN not in cube.columns or (start is None and end is None):
+        return cube
+    years = cube[YEAR_COLUMN]
+    mask = np.ones(len(cube), dtype=bool)
+    if start is not None:
+        mask &= (years >= start).to_numpy()
+    if end is not None:
+        mask &= (years <= end).to_numpy()
+    return cube[mask]
+
+def period_label(cube):
+    """Periodo que cubren los datos para los títulos ('2019' o '2015-2023')"""
+    if YEAR_COLUMN not in cube.columns or cube.empty:
+        return DEFAULT_PERIOD
+    years = cube[YEAR_COLUMN].dropna()
+    if years.empty:
+        return DEFAULT_PERIOD
+    first, last = int(years.min()), int(years.max())
+    return str(first) if first == last else f"{first}-{last}"
+
+def _as_cube(df):
+    """Retorna el cubo de conteos, construyéndolo si se recibe el DataFrame de registros"""
+    if 'TOTAL_MUERTES' in df.columns:
+        return df
+    return build_mortality_cube(df)
+
+def _as_view(df):
+    """Vista de agregación (ver analytics.py): la recibida, o la del cubo de `df`"""
+    if hasattr(df, 'totals'):
+        return df
+    return as_view(_as_cube(df))
+
+@timed_figure
+def create_mortality_map(df, level=DEFAULT_LEVEL, bbox=None):
+    """Crea mapa coroplético de distribución de muertes por departamento
     
-    # Cargar GeoJSON
-    with open('Data/map.geojson', 'r', encoding='utf-8') as f:
-        colombia_geojson = json.load(f)
+    `level` es el nivel de simplificación de geometry.LEVELS (ver
+    level_for_zoom) y `bbox` opcionalmente limita las geometrías enviadas a
+    las que cruzan la vista (min_lon, min_lat, max_lon, max_lat).
+    """
     
-    # Extraer códigos disponibles en el GeoJSON
-    codigos_geojson = set([feature['properties']['codigo'] for feature in colombia_geojson['features']])
-    print(f"Códigos en GeoJSON: {len(codigos_geojson)} departamentos")
+    # Geometrías simplificadas, leídas e indexadas por código una sola vez por proceso
+    geometries = department_geometries()
+    codigos_geojson = geometries.codes
+    colombia_geojson = geometries.collection(level, geometries.codes_in_bbox(bbox) if bbox else None)
     
     # Agrupar por código de departamento
-    dept_deaths = df.groupby('COD_DEPARTAMENTO').size().reset_index(name='TOTAL_MUERTES')
+    view = _as_view(df)
+    dept_deaths = view.totals(['COD_DEPARTAMENTO'])
     
     # Convertir COD_DEPARTAMENTO a string con formato de 2 dígitos
     dept_deaths['codigo'] = dept_deaths['COD_DEPARTAMENTO'].astype(int).astype(str).str.zfill(2)
@@ -84,26 +273,88 @@ def create_mortality_map(df):
     ))
     
     fig.update_layout(
+        # Conserva el zoom y la posición del usuario al actualizar la figura
+        uirevision='mapa',
         mapbox_style="carto-positron",
         mapbox_zoom=4.5,
         mapbox_center={"lat": 4.5709, "lon": -74.2973},
         height=700,
         margin={"r":0,"t":50,"l":0,"b":0},
-        title_text='Mapa de Mortalidad por Departamento - Colombia 2019',
+        title_text=f'Mapa de Mortalidad por Departamento - Colombia {view.period()}',
         title_x=0.5
     )
     
     return fig
 
+@timed_figure
+def create_municipality_map(df, level=DEFAULT_LEVEL, bbox=None):
+    """Crea mapa coroplético de distribución de muertes por municipio
+    
+    Usa las geometrías de Data/municipios.geojson; si no existen retorna el
+    mapa por departamento. Con `bbox` solo se envían los municipios cuya caja
+    cruza la vista, consultados en el R-tree del índice de geometrías.
+    """
+    
+    geometries = municipality_geometries()
+    if geometries is None:
+        print("Sin geometrías municipales, se usa el mapa por departamento")
+        return create_mortality_map(df, level=level, bbox=bbox)
+    
+    visible_codes = geometries.codes_in_bbox(bbox) if bbox else geometries.codes
+    municipios_geojson = geometries.collection(level, visible_codes if bbox else None)
+    
+    # Agrupar por código DANE de cinco dígitos (departamento * 1000 + municipio)
+    view = _as_view(df)
+    mun_deaths = view.totals(['COD_DEPARTAMENTO', 'COD_MUNICIPIO', 'MUNICIPIO'])
+    dane_codes = mun_deaths['COD_DEPARTAMENTO'].astype(int) * 1000 + mun_deaths['COD_MUNICIPIO'].astype(int)
+    mun_deaths['codigo'] = dane_codes.astype(str).str.zfill(5)
+    
+    # La escala de color se fija con todos los municipios para que no cambie al desplazarse
+    zmax = mun_deaths.loc[mun_deaths['codigo'].isin(geometries.codes), 'TOTAL_MUERTES'].max()
+    mun_deaths_mapa = mun_deaths[mun_deaths['codigo'].isin(set(visible_codes))]
+    
+    print(f"Municipios en datos: {len(mun_deaths)}")
+    print(f"Municipios con geometría en la vista: {len(mun_deaths_mapa)}")
+    
+    fig = go.Figure(go.Choroplethmapbox(
+        geojson=municipios_geojson,
+        locations=mun_deaths_mapa['codigo'],
+        z=mun_deaths_mapa['TOTAL_MUERTES'],
+        customdata=mun_deaths_mapa['MUNICIPIO'].astype(str),
+        featureidkey="properties.codigo",
+        colorscale='Reds',
+        zmin=0,
+        zmax=zmax,
+        marker_opacity=0.7,
+        marker_line_width=0.5,
+        marker_line_color='white',
+        colorbar=dict(title="Total de Muertes"),
+        hovertemplate='<b>%{customdata} (%{location})</b><br>Muertes: %{z:,}<extra></extra>'
+    ))
+    
+    fig.update_layout(
+        uirevision='mapa',
+        mapbox_style="carto-positron",
+        mapbox_zoom=4.5,
+        mapbox_center={"lat": 4.5709, "lon": -74.2973},
+        height=700,
+        margin={"r":0,"t":50,"l":0,"b":0},
+        title_text=f'Mapa de Mortalidad por Municipio - Colombia {view.period()}',
+        title_x=0.5
+    )
+    
+    return fig
+
+@timed_figure
 def create_monthly_timeline(df):
     """Crea gráfico de líneas de muertes por mes"""
     
-    monthly_deaths = df.groupby('MES').size().reset_index(name='TOTAL_MUERTES')
+    view = _as_view(df)
+    monthly_deaths = view.totals(['MES'])
     
-    # Agregar nombres de meses
-    meses = {1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril', 5: 'Mayo', 6: 'Junio',
-             7: 'Julio', 8: 'Agosto', 9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'}
-    monthly_deaths['MES_NOMBRE'] = monthly_deaths['MES'].map(meses)
+    # Agregar nombres de meses (el mes faltante del almacén, -1, no tiene punto en la línea)
+    monthly_deaths = monthly_deaths[monthly_deaths['MES'].isin(list(MONTH_NAMES))].reset_index(drop=True)
+    monthly_deaths['MES_NOMBRE'] = monthly_deaths['MES'].map(MONTH_NAMES)
     
     print("Muertes por mes:")
     print(monthly_deaths)
@@ -112,7 +363,7 @@ def create_monthly_timeline(df):
         monthly_deaths, 
         x='MES_NOMBRE', 
         y='TOTAL_MUERTES',
-        title='Total de Muertes por Mes - Colombia 2019',
+        title=f'Total de Muertes por Mes - Colombia {view.period()}',
         labels={'TOTAL_MUERTES': 'Total de Muertes', 'MES_NOMBRE': 'Mes'},
         markers=True
     )
@@ -124,24 +375,22 @@ def create_monthly_timeline(df):
     
     return fig
 
-def create_violent_cities_chart(df):
-    """Crea gráfico de las 5 ciudades más violentas"""
+@timed_figure
+def create_violent_cities_chart(df, k=5, ties=DEFAULT_TIES):
+    """Crea gráfico de las `k` ciudades más violentas"""
     
-    # Filtrar homicidios (códigos X95 y relacionados)
-    homicides = df[df['COD_MUERTE'].str.contains('X95', na=False)]
+    # Homicidios por municipio (familia precalculada, códigos X85-Y09) sin copiar el cubo
+    view = _as_view(df)
+    city_violence = view.rank('MUNICIPIO', k, ties=ties, family='homicidio', name='HOMICIDIOS')
     
-    # Agrupar por municipio
-    city_violence = homicides.groupby('MUNICIPIO').size().reset_index(name='HOMICIDIOS')
-    city_violence = city_violence.sort_values('HOMICIDIOS', ascending=False).head(5)
-    
-    print("Top 5 ciudades más violentas:")
+    print(f"Top {k} ciudades más violentas:")
     print(city_violence)
     
     fig = px.bar(
         city_violence, 
         x='MUNICIPIO', 
         y='HOMICIDIOS',
-        title='5 Ciudades Más Violentas - Homicidios 2019',
+        title=f'{k} Ciudades Más Violentas - Homicidios {view.period()}',
         labels={'HOMICIDIOS': 'Número de Homicidios', 'MUNICIPIO': 'Ciudad'},
         color='HOMICIDIOS',
         color_continuous_scale='Reds'
@@ -154,70 +403,103 @@ def create_violent_cities_chart(df):
     
     return fig
 
-def create_safest_cities_chart(df):
-    """Crea gráfico circular de las 10 ciudades con menor mortalidad"""
-    
-    # Calcular mortalidad por ciudad (solo ciudades con al menos 100 casos para evitar sesgos)
-    city_deaths = df.groupby('MUNICIPIO').size().reset_index(name='TOTAL_MUERTES')
-    city_deaths = city_deaths[city_deaths['TOTAL_MUERTES'] >= 100]  # Filtrar ciudades pequeñas
-    safest_cities = city_deaths.sort_values('TOTAL_MUERTES', ascending=True).head(10)
-    
-    print("Top 10 ciudades con menor mortalidad (min 100 casos):")
+@timed_figure
+def create_safest_cities_chart(df, k=10, ties=DEFAULT_TIES):
+    """Crea gráfico de las `k` ciudades con menor mortalidad.
+    
+    Con la tabla de población (ver rates.py) ordena por tasa ajustada por
+    edad con su intervalo de confianza; sin ella, por conteo de defunciones.
+    """
+    # rates importa este módulo, por eso se importa aquí
+    from rates import MIN_RATE_DEATHS, load_rates_engine, lowest_rates
+    
+    view = _as_view(df)
+    engine = load_rates_engine()
+    if engine is not None:
+        safest_cities = lowest_rates(view.rates_cube(), engine, k, ties=ties, filters=view.filters,
+                                     years=view.data_years())
+        
+        print(f"Top {k} ciudades con menor tasa ajustada por edad (min {MIN_RATE_DEATHS} defunciones):")
+        print(safest_cities[['MUNICIPIO', 'MUERTES', 'TASA_AJUSTADA', 'TASA_AJUSTADA_INF', 'TASA_AJUSTADA_SUP']])
+        
+        fig = go.Figure(go.Bar(
+            x=safest_cities['TASA_AJUSTADA'],
+            y=safest_cities['MUNICIPIO'] + ' (' + safest_cities['DEPARTAMENTO'] + ')',
+            orientation='h',
+            marker_color='#2a9d8f',
+            error_x={
+                'type': 'data',
+                'array': safest_cities['TASA_AJUSTADA_SUP'] - safest_cities['TASA_AJUSTADA'],
+                'arrayminus': safest_cities['TASA_AJUSTADA'] - safest_cities['TASA_AJUSTADA_INF']
+            },
+            customdata=safest_cities[['MUERTES', 'TASA_CRUDA', 'TASA_AJUSTADA_INF', 'TASA_AJUSTADA_SUP']],
+            hovertemplate=(
+                '%{y}<br>Tasa ajustada: %{x:.1f} por 100.000 (IC 95%: %{customdata[2]:.1f}-%{customdata[3]:.1f})'
+                '<br>Tasa cruda: %{customdata[1]:.1f}<br>Defunciones: %{customdata[0]:,}<extra></extra>'
+            )
+        ))
+        fig.update_layout(
+            title=f'{k} Ciudades con Menor Tasa de Mortalidad Ajustada por Edad {view.period()}',
+            xaxis_title='Defunciones por 100.000 habitantes-año (población estándar OMS)',
+            yaxis={'autorange': 'reversed'},
+            height=400
+        )
+        return fig
+    
+    # Sin población: conteos, solo ciudades con al menos 100 casos para evitar sesgos
+    safest_cities = view.rank('MUNICIPIO', k, largest=False, ties=ties, min_total=100)
+    
+    print(f"Top {k} ciudades con menor mortalidad (min 100 casos):")
     print(safest_cities)
     
     fig = px.pie(
         safest_cities, 
         values='TOTAL_MUERTES', 
         names='MUNICIPIO',
-        title='10 Ciudades con Menor Índice de Mortalidad'
+        title=f'{k} Ciudades con Menor Índice de Mortalidad'
     )
     
     return fig
 
-def create_death_causes_table(df, death_codes):
-    """Crea tabla de las 10 principales causas de muerte"""
+@timed_figure
+def create_death_causes_table(df, death_codes, k=10, ties=DEFAULT_TIES):
+    """Crea tabla de las `k` principales causas de muerte"""
     
-    # Top 10 causas de muerte
-    top_causes = df['COD_MUERTE'].value_counts().head(10).reset_index()
+    # Top k causas de muerte (el ranking retorna los códigos como texto)
+    top_causes = _as_view(df).rank('COD_MUERTE', k, ties=ties)
     top_causes.columns = ['CODIGO', 'TOTAL_CASOS']
     
-    # Si tenemos los códigos de muerte, hacer merge para obtener descripciones
+    # Descripciones desde el índice CIE-10 (construido una vez por proceso)
     if not death_codes.empty:
         try:
-            # Crear diccionario de códigos
-            codes_dict = {}
-            for _, row in death_codes.iterrows():
-                if pd.notna(row.get('CODIGO_4')):
-                    codes_dict[row['CODIGO_4']] = row.get('DESCRIPCION_4', 'Sin descripción')
-            
-            top_causes['DESCRIPCION'] = top_causes['CODIGO'].map(codes_dict)
-            top_causes['DESCRIPCION'] = top_causes['DESCRIPCION'].fillna('Descripción no disponible')
-        except:
-            top_causes['DESCRIPCION'] = 'Descripción no disponible'
+            top_causes['DESCRIPCION'] = load_icd10_index(death_codes).describe(top_causes['CODIGO'])
+        except Exception as e:
+            print(f"Error buscando descripciones CIE-10: {e}")
+            top_causes['DESCRIPCION'] = SIN_DESCRIPCION
     else:
-        top_causes['DESCRIPCION'] = 'Descripción no disponible'
+        top_causes['DESCRIPCION'] = SIN_DESCRIPCION
     
-    print("Top 10 causas de muerte:")
+    print(f"Top {k} causas de muerte:")
     print(top_causes)
     
     return top_causes
 
-def create_gender_by_department_chart(df):
+@timed_figure
+def create_gender_by_department_chart(df, k=15, ties=DEFAULT_TIES):
     """Crea gráfico de barras apiladas de muertes por sexo y departamento"""
     
-    # Mapear sexos
-    sex_map = {1: 'Masculino', 2: 'Femenino', 3: 'Indeterminado'}
-    df_copy = df.copy()
-    df_copy['SEXO_NOMBRE'] = df_copy['SEXO'].map(sex_map)
+    view = _as_view(df)
     
-    # Agrupar por departamento y sexo
-    gender_dept = df_copy.groupby(['DEPARTAMENTO', 'SEXO_NOMBRE']).size().reset_index(name='TOTAL_MUERTES')
+    # Agrupar por departamento y sexo (se agrega antes de mapear para no copiar el cubo)
+    gender_dept = view.totals(['DEPARTAMENTO', 'SEXO'])
+    gender_dept['SEXO_NOMBRE'] = gender_dept['SEXO'].map(SEX_MAP)
+    gender_dept = gender_dept.groupby(['DEPARTAMENTO', 'SEXO_NOMBRE'], observed=True)['TOTAL_MUERTES'].sum().reset_index()
     
-    # Tomar solo los top 15 departamentos por total de muertes
-    top_depts = df_copy.groupby('DEPARTAMENTO').size().sort_values(ascending=False).head(15).index
+    # Tomar solo los top k departamentos por total de muertes
+    top_depts = view.rank('DEPARTAMENTO', k, ties=ties)['DEPARTAMENTO']
     gender_dept = gender_dept[gender_dept['DEPARTAMENTO'].isin(top_depts)]
     
-    print("Muertes por sexo y departamento (top 15 departamentos):")
+    print(f"Muertes por sexo y departamento (top {k} departamentos):")
     print(gender_dept.head(10))
     
     fig = px.bar(
@@ -225,7 +507,7 @@ def create_gender_by_department_chart(df):
         x='DEPARTAMENTO', 
         y='TOTAL_MUERTES',
         color='SEXO_NOMBRE',
-        title='Muertes por Sexo en cada Departamento (Top 15)',
+        title=f'Muertes por Sexo en cada Departamento (Top {k})',
         labels={'TOTAL_MUERTES': 'Total de Muertes', 'DEPARTAMENTO': 'Departamento', 'SEXO_NOMBRE': 'Sexo'}
     )
     
@@ -236,30 +518,16 @@ def create_gender_by_department_chart(df):
     
     return fig
 
+@timed_figure
 def create_age_groups_histogram(df):
     """Crea histograma de distribución por grupos de edad"""
     
-    # Mapear grupos de edad según la tabla de referencia
-    age_groups_map = {
-        0: 'Mortalidad neonatal (Cod 0-4)', 1: 'Mortalidad neonatal (Cod 0-4)', 2: 'Mortalidad neonatal (Cod 0-4)',
-        3: 'Mortalidad neonatal (Cod 0-4)', 4: 'Mortalidad neonatal (Cod 0-4)',
-        5: 'Mortalidad infantil (Cod 5-6)', 6: 'Mortalidad infantil (Cod 5-6)',
-        7: 'Primera infancia (Cod 7-8)', 8: 'Primera infancia (Cod 7-8)',
-        9: 'Ninez (Cod 9-10)', 10: 'Ninez (Cod 9-10)',
-        11: 'Adolescencia (Cod 11)',
-        12: 'Juventud (Cod 12-13)', 13: 'Juventud (Cod 12-13)',
-        14: 'Adultez temprana (Cod 14-16)', 15: 'Adultez temprana (Cod 14-16)', 16: 'Adultez temprana (Cod 14-16)',
-        17: 'Adultez intermedia (Cod 17-19)', 18: 'Adultez intermedia (Cod 17-19)', 19: 'Adultez intermedia (Cod 17-19)',
-        20: 'Vejez (Cod 20-24)', 21: 'Vejez (Cod 20-24)', 22: 'Vejez (Cod 20-24)', 23: 'Vejez (Cod 20-24)', 24: 'Vejez (Cod 20-24)',
-        25: 'Longevidad (Cod 25-28)', 26: 'Longevidad (Cod 25-28)', 27: 'Longevidad (Cod 25-28)', 28: 'Longevidad (Cod 25-28)',
-        29: 'Edad desconocida (Cod 29)'
-    }
-    
-    df_copy = df.copy()
-    df_copy['GRUPO_EDAD_NOMBRE'] = df_copy['GRUPO_EDAD1'].map(age_groups_map)
+    view = _as_view(df)
+    age_distribution = view.totals(['GRUPO_EDAD1'])
+    age_distribution['GRUPO_EDAD_NOMBRE'] = age_distribution['GRUPO_EDAD1'].map(AGE_GROUPS_MAP)
     
     # Agrupar por categorías de edad
-    age_distribution = df_copy.groupby('GRUPO_EDAD_NOMBRE').size().reset_index(name='TOTAL_MUERTES')
+    age_distribution = age_distribution.groupby('GRUPO_EDAD_NOMBRE')['TOTAL_MUERTES'].sum().reset_index()
     age_distribution = age_distribution.sort_values('TOTAL_MUERTES', ascending=False)
     
     print("Distribución por grupos de edad:")
@@ -269,7 +537,7 @@ def create_age_groups_histogram(df):
         age_distribution, 
         x='GRUPO_EDAD_NOMBRE', 
         y='TOTAL_MUERTES',
-        title='Distribución de Muertes por Grupos de Edad - Colombia 2019',
+        title=f'Distribución de Muertes por Grupos de Edad - Colombia {view.period()}',
         labels={'TOTAL_MUERTES': 'Total de Muertes', 'GRUPO_EDAD_NOMBRE': 'Grupo de Edad'},
         color='TOTAL_MUERTES',
         color_continuous_scale='Blues'
@@ -285,19 +553,21 @@ def create_age_groups_histogram(df):
 if __name__ == "__main__":
     # Cargar datos
     mortality_data, death_codes, divipola = load_and_process_data()
+    mortality_cube = build_mortality_cube(mortality_data, divipola)
+    del mortality_data
     
     print("\n" + "="*80)
     print("GENERANDO VISUALIZACIONES...")
     print("="*80 + "\n")
     
     # Generar todas las visualizaciones
-    map_fig = create_mortality_map(mortality_data)
-    timeline_fig = create_monthly_timeline(mortality_data)
-    violent_cities_fig = create_violent_cities_chart(mortality_data)
-    safest_cities_fig = create_safest_cities_chart(mortality_data)
-    death_causes_table = create_death_causes_table(mortality_data, death_codes)
-    gender_dept_fig = create_gender_by_department_chart(mortality_data)
-    age_groups_fig = create_age_groups_histogram(mortality_data)
+    map_fig = create_mortality_map(mortality_cube)
+    timeline_fig = create_monthly_timeline(mortality_cube)
+    violent_cities_fig = create_violent_cities_chart(mortality_cube)
+    safest_cities_fig = create_safest_cities_chart(mortality_cube)
+    death_causes_table = create_death_causes_table(mortality_cube, death_codes)
+    gender_dept_fig = create_gender_by_department_chart(mortality_cube)
+    age_groups_fig = create_age_groups_histogram(mortality_cube)
     
     print("\n" + "="*80)
     print("VISUALIZACIONES GENERADAS EXITOSAMENTE")
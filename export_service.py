@@ -0,0 +1,271 @@
+"""
+Exportaciones del dashboard: extractos filtrados (CSV, Parquet) e imágenes
+de los gráficos (PNG, SVG), generadas fuera de los callbacks.
+
+ExportService recibe cada pedido (qué exportar, formato y filtros) y lo
+resuelve en segundo plano:
+
+  * Los extractos salen del cubo de conteos filtrado (una fila por
+    combinación de dimensiones con su TOTAL_MUERTES). El CSV se escribe por
+    bloques de CSV_CHUNK_ROWS filas, así que la memoria no depende del
+    tamaño del extracto, y se descarga con send_file, que lo envía por
+    bloques.
+  * Las imágenes se dibujan con kaleido. Su proceso de Chromium se arranca
+    una vez (warm) y se reutiliza; como no admite renders concurrentes,
+    las imágenes tienen su propio pool de un hilo.
+  * Los datos usan un pool acotado (EXPORT_WORKERS, 2 por defecto) y una
+    cola de a lo sumo MAX_PENDING trabajos; si está llena submit() lo
+    informa en vez de encolar sin límite.
+
+Los resultados quedan en Data/cache/exportaciones/ con una clave derivada de
+la versión de datos, el contenido, el formato y los filtros normalizados:
+pedir la misma exportación otra vez (en cualquier worker) la sirve del
+disco sin calcular nada. El directorio se recorta a EXPORT_CACHE_MB.
+
+    GET /exportaciones/<clave>.<formato>   descarga un resultado listo
+
+Este módulo no importa pandas ni plotly a nivel de módulo: la ruta se
+registra al arrancar y el servicio se crea con el primer pedido.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import EXPORT_DURATION, EXPORT_SIZE, log_event
+
+# Misma ruta que data_cache.CACHE_DIR
+EXPORT_DIR = os.path.join('Data', 'cache', 'exportaciones')
+EXPORT_ROUTE = '/exportaciones'
+
+DATA_TARGET = 'datos'
+DATA_FORMATS = ['csv', 'parquet']
+IMAGE_FORMATS = ['png', 'svg']
+MIMETYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'png': 'image/png',
+    'svg': 'image/svg+xml'
+}
+
+CSV_CHUNK_ROWS = 100_000
+MAX_PENDING = 16
+IMAGE_WIDTH = 1200
+IMAGE_HEIGHT = 700
+IMAGE_SCALE = 2
+
+# Estados que ve el callback
+PENDING = 'pendiente'
+READY = 'listo'
+FAILED = 'error'
+REJECTED = 'rechazado'
+
+
+def export_path(key, fmt, directory=EXPORT_DIR):
+    return os.path.join(directory, f"{os.path.basename(key)}.{fmt}")
+
+
+def register_routes(server, directory=EXPORT_DIR):
+    """Ruta de descarga de los resultados en disco (de cualquier worker)"""
+    from flask import abort, send_file
+
+    @server.route(f"{EXPORT_ROUTE}/<key>.<fmt>")
+    def download_export(key, fmt):
+        path = export_path(key, fmt, directory)
+        if fmt not in MIMETYPES or not os.path.exists(path):
+            abort(404)
+        target = key.rsplit('-', 1)[0]
+        # send_file envía el archivo por bloques y responde Range / If-Modified-Since
+        return send_file(
+            os.path.abspath(path), mimetype=MIMETYPES[fmt], as_attachment=True,
+            download_name=f"mortalidad-{target}.{fmt}", max_age=3600, conditional=True
+        )
+
+    return server
+
+
+def export_workers():
+    return max(int(os.environ.get('EXPORT_WORKERS', 2)), 1)
+
+
+def export_cache_bytes():
+    return int(os.environ.get('EXPORT_CACHE_MB', 256)) * 1024 * 1024
+
+
+def export_key(version, target, fmt, filters, options=None):
+    """Clave del resultado: versión de datos, contenido, formato, filtros normalizados y opciones"""
+    from figure_cache import normalize_filters
+
+    spec = json.dumps([version, target, fmt, normalize_filters(filters), sorted((options or {}).items())], default=str)
+    return f"{target}-{hashlib.sha1(spec.encode('utf-8')).hexdigest()[:20]}"
+
+
+def write_csv(cube, path, chunk_rows=CSV_CHUNK_ROWS):
+    """CSV por bloques de filas: nunca se arma el texto completo en memoria"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for start in range(0, max(len(cube), 1), chunk_rows):
+            cube.iloc[start:start + chunk_rows].to_csv(f, header=start == 0, index=False)
+
+
+def write_parquet(cube, path):
+    # Las columnas categóricas del cubo se guardan como diccionarios de Arrow
+    cube.to_parquet(path, index=False)
+
+
+def render_image(figure, fmt):
+    """PNG o SVG de una figura con el proceso de kaleido del módulo"""
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    figure = go.Figure(figure)
+    # Sin teselas remotas: la imagen no depende del servidor de mapas
+    if figure.layout.mapbox.style is not None:
+        figure.update_layout(mapbox_style='white-bg')
+    return pio.to_image(figure, format=fmt, width=IMAGE_WIDTH, height=IMAGE_HEIGHT,
+                        scale=IMAGE_SCALE if fmt == 'png' else 1)
+
+
+def warm_kaleido():
+    """Arranca el proceso de kaleido con una figura vacía (el primer render tarda ~1 s)"""
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    pio.to_image(go.Figure(), format='png', width=10, height=10)
+
+
+class ExportService:
+    """Pools de exportación, registro de trabajos y caché de resultados en disco.
+
+    `cube_for(filters)` retorna el cubo filtrado y `figure_for(target,
+    filters, options)` la figura (dict o go.Figure) de un gráfico; ambos los
+    pone la aplicación. `options` son argumentos extra del gráfico (p. ej.
+    K del ranking) que también forman parte de la clave.
+    """
+
+    def __init__(self, cube_for, figure_for, version, targets=(), directory=EXPORT_DIR,
+                 workers=None, max_pending=MAX_PENDING, max_bytes=None):
+        self.cube_for = cube_for
+        self.figure_for = figure_for
+        self.version = version
+        self.targets = set(targets)
+        self.directory = directory
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes or export_cache_bytes()
+        self._data_pool = ThreadPoolExecutor(workers or export_workers(), thread_name_prefix='exportar-datos')
+        self._image_pool = ThreadPoolExecutor(1, thread_name_prefix='exportar-imagen')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._image_warm = False
+
+    def formats(self, target):
+        if target != DATA_TARGET:
+            return IMAGE_FORMATS
+        from data_cache import PARQUET_DISPONIBLE
+
+        return DATA_FORMATS if PARQUET_DISPONIBLE else ['csv']
+
+    def _path(self, key, fmt):
+        return export_path(key, fmt, self.directory)
+
+    def url(self, key, fmt):
+        return f"{EXPORT_ROUTE}/{key}.{fmt}"
+
+    def warm(self):
+        """Precalienta kaleido en el pool de imágenes (no bloquea)"""
+        if not self._image_warm:
+            self._image_warm = True
+            self._image_pool.submit(warm_kaleido)
+
+    def _produce(self, key, target, fmt, filters, options):
+        path = self._path(key, fmt)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        start = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            if target == DATA_TARGET:
+                cube = self.cube_for(filters)
+                if fmt == 'csv':
+                    write_csv(cube, tmp_path)
+                else:
+                    write_parquet(cube, tmp_path)
+            else:
+                with open(tmp_path, 'wb') as f:
+                    f.write(render_image(self.figure_for(target, filters, options), fmt))
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        # Corre en un hilo del pool: se informa por /metrics y el log JSON, no por stdout
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(path)
+        EXPORT_DURATION.observe(elapsed, target, fmt)
+        EXPORT_SIZE.observe(size, fmt)
+        log_event('exportacion', clave=key, objetivo=target, formato=fmt,
+                  duracion_ms=round(elapsed * 1000, 2), bytes=size)
+        self._prune()
+        return path
+
+    def _prune(self):
+        """Borra los resultados más antiguos si el directorio supera el límite"""
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.is_file() and not entry.name.endswith('.tmp')]
+        except OSError:
+            return
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            if total <= self.max_bytes:
+                break
+            try:
+                total -= entry.stat().st_size
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def submit(self, target, fmt, filters, options=None):
+        """Encola una exportación; retorna {'clave', 'formato', 'estado', 'url'?, 'error'?}"""
+        if target != DATA_TARGET and target not in self.targets:
+            raise ValueError(f"No se puede exportar {target!r}")
+        if fmt not in self.formats(target):
+            raise ValueError(f"Formato {fmt!r} no disponible para {target!r}")
+
+        key = export_key(self.version, target, fmt, filters, options)
+        if os.path.exists(self._path(key, fmt)):
+            return {'clave': key, 'formato': fmt, 'estado': READY, 'url': self.url(key, fmt)}
+
+        with self._lock:
+            future = self._jobs.get((key, fmt))
+            if future is None or (future.done() and future.exception() is not None):
+                pending = sum(1 for job in self._jobs.values() if not job.done())
+                if pending >= self.max_pending:
+                    return {'clave': key, 'formato': fmt, 'estado': REJECTED,
+                            'error': "Hay demasiadas exportaciones en curso, intente en unos segundos"}
+                if target == DATA_TARGET:
+                    pool = self._data_pool
+                else:
+                    pool = self._image_pool
+                    self.warm()
+                self._jobs[(key, fmt)] = pool.submit(self._produce, key, target, fmt, filters, options or {})
+                # Los terminados sin error ya están en disco; no hace falta recordarlos
+                for done_key in [job_key for job_key, job in self._jobs.items()
+                                 if job.done() and job.exception() is None]:
+                    del self._jobs[done_key]
+        return self.status(key, fmt)
+
+    def status(self, key, fmt):
+        """Estado de una exportación de este proceso (o de otro, si ya está en disco)"""
+        if os.path.exists(self._path(key, fmt)):
+            return {'clave': key, 'formato': fmt, 'estado': READY, 'url': self.url(key, fmt)}
+        with self._lock:
+            future = self._jobs.get((key, fmt))
+        if future is not None and future.done() and future.exception() is not None:
+            return {'clave': key, 'formato': fmt, 'estado': FAILED, 'error': str(future.exception())}
+        if future is None:
+            # Otro worker la está generando, o se perdió: el callback puede volver a pedirla
+            return {'clave': key, 'formato': fmt, 'estado': PENDING, 'local': False}
+        return {'clave': key, 'formato': fmt, 'estado': PENDING, 'local': True}
+
+    def shutdown(self):
+        self._data_pool.shutdown(wait=False, cancel_futures=True)
+        self._image_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,197 @@
+"""
+Paquete JSON precalculado con todas las figuras del dashboard.
+
+Los datos de 2019 no cambian entre arranques, así que las siete
+visualizaciones, la primera página de la tabla de causas, los indicadores y las opciones de los
+filtros se calculan una sola vez en el build:
+
+    python figure_bundle.py
+
+y se guardan en Data/cache/bundle.json, con una copia gzip y brotli de cada
+figura en Data/cache/estaticos/ para servirlas como archivos estáticos
+(ver http_cache.py). La aplicación lee ese archivo con
+load_bundle() sin importar pandas ni leer los datos. El paquete registra el
+tamaño y mtime de los archivos fuente; si alguno cambió se considera obsoleto.
+
+Este módulo no importa pandas a nivel de módulo: solo build_bundle_data() lo
+necesita.
+"""
+import json
+import os
+import time
+
+BUNDLE_FORMAT = 3
+BUNDLE_FILE = os.path.join('Data', 'cache', 'bundle.json')
+
+# Archivos fuente cuyo cambio invalida el paquete (mismas rutas que data_cache)
+SOURCE_FILES = [
+    os.path.join('Data', 'Anexo1.NoFetal2019_CE_15-03-23.xlsx'),
+    os.path.join('Data', 'Anexo2.CodigosDeMuerte_CE_15-03-23.xlsx'),
+    os.path.join('Data', 'Divipola_CE_.xlsx'),
+    os.path.join('Data', 'map.geojson'),
+    os.path.join('Data', 'cache', 'anios', 'manifest.json'),
+    os.path.join('Data', 'poblacion.csv'),
+    os.path.join('Data', 'poblacion.xlsx'),
+]
+
+# Identificadores de las figuras del paquete
+FIGURE_IDS = ['mapa', 'mensual', 'ciudades-violentas', 'ciudades-seguras', 'sexo-departamento', 'grupos-edad']
+
+
+def _source_signatures():
+    signatures = {}
+    for path in SOURCE_FILES:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signatures[path] = [stat.st_size, stat.st_mtime]
+    return signatures
+
+
+def summary_stats(cube):
+    """Indicadores generales (defunciones, departamentos, municipios, homicidios) de un cubo o una vista de analytics.py"""
+    from analytics import as_view
+
+    view = as_view(cube)
+    return [
+        f"{view.total():,}",
+        f"{len(view.totals(['DEPARTAMENTO']))}",
+        f"{len(view.totals(['MUNICIPIO']))}",
+        f"{view.total('homicidio')}"
+    ]
+
+
+def filter_options(cube, death_codes, divipola):
+    """Opciones de los desplegables de filtros, serializables a JSON"""
+    from data_processing import MONTH_NAMES, SEX_MAP, AGE_GROUPS_MAP, YEAR_COLUMN
+
+    present_depts = set(int(code) for code in cube['COD_DEPARTAMENTO'].unique())
+    present_muns = set(
+        int(dept) * 1000 + int(mun)
+        for dept, mun in cube[['COD_DEPARTAMENTO', 'COD_MUNICIPIO']].drop_duplicates().itertuples(index=False)
+    )
+
+    dept_names = divipola.drop_duplicates('COD_DEPARTAMENTO').set_index('COD_DEPARTAMENTO')['DEPARTAMENTO']
+    departments = [
+        {'label': dept_names.get(code, str(code)), 'value': code}
+        for code in sorted(present_depts)
+    ]
+
+    municipalities = []
+    for dept_code, mun_code, dept_name, mun_name in divipola[['COD_DEPARTAMENTO', 'COD_MUNICIPIO', 'DEPARTAMENTO', 'MUNICIPIO']].itertuples(index=False):
+        key = int(dept_code) * 1000 + int(mun_code)
+        if key in present_muns:
+            municipalities.append({'label': f"{mun_name} ({dept_name})", 'value': key, 'departamento': int(dept_code)})
+    municipalities.sort(key=lambda option: option['label'])
+
+    chapters = []
+    if not death_codes.empty:
+        unique_chapters = death_codes.dropna(subset=['CAPITULO']).drop_duplicates('CAPITULO')
+        chapters = [
+            {'label': f"{int(chapter)}. {name}", 'value': int(chapter)}
+            for chapter, name in unique_chapters[['CAPITULO', 'NOMBRE_CAPITULO']].itertuples(index=False)
+        ]
+
+    # Las opciones de edad agrupan varios códigos GRUPO_EDAD1 bajo un mismo nombre
+    age_group_codes = {}
+    for age_code, age_name in AGE_GROUPS_MAP.items():
+        age_group_codes.setdefault(age_name, []).append(age_code)
+
+    years = []
+    if YEAR_COLUMN in cube.columns:
+        years = [{'label': str(int(year)), 'value': int(year)} for year in sorted(cube[YEAR_COLUMN].dropna().unique())]
+
+    return {
+        'anio': years,
+        'departamento': departments,
+        'municipio': municipalities,
+        'mes': [{'label': name, 'value': month} for month, name in MONTH_NAMES.items()],
+        'sexo': [{'label': name, 'value': code} for code, name in SEX_MAP.items()],
+        'grupo_edad': [{'label': name, 'value': name} for name in age_group_codes],
+        'capitulo': chapters,
+        'grupo_edad_codigos': age_group_codes
+    }
+
+
+def build_bundle_data():
+    """Calcula todas las figuras, la tabla y los indicadores (importa pandas)"""
+    from plotly.utils import PlotlyJSONEncoder
+
+    from causes_table import cause_ranking, paginate
+    from data_cache import data_version
+    from icd10 import load_icd10_index
+    from shared_dataset import load_shared_cube
+    from data_processing import (
+        create_mortality_map,
+        create_monthly_timeline,
+        create_violent_cities_chart,
+        create_safest_cities_chart,
+        create_gender_by_department_chart,
+        create_age_groups_histogram
+    )
+
+    start = time.perf_counter()
+    mortality_cube, death_codes, divipola = load_shared_cube()
+
+    figures = {
+        'mapa': create_mortality_map(mortality_cube),
+        'mensual': create_monthly_timeline(mortality_cube),
+        'ciudades-violentas': create_violent_cities_chart(mortality_cube),
+        'ciudades-seguras': create_safest_cities_chart(mortality_cube),
+        'sexo-departamento': create_gender_by_department_chart(mortality_cube),
+        'grupos-edad': create_age_groups_histogram(mortality_cube)
+    }
+
+    # Primera página del ranking completo de causas; las demás las sirve causes_table.py
+    causes_page, causes_pages = paginate(cause_ranking(mortality_cube, load_icd10_index(death_codes)))
+
+    bundle = {
+        'bundle_format': BUNDLE_FORMAT,
+        'data_version': data_version(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'sources': _source_signatures(),
+        'figures': figures,
+        'death_causes': causes_page,
+        'death_causes_pages': causes_pages,
+        'stats': summary_stats(mortality_cube),
+        'options': filter_options(mortality_cube, death_codes, divipola)
+    }
+    print(f"Paquete de figuras calculado en {time.perf_counter() - start:.1f} s")
+
+    # Ida y vuelta por JSON para que el resultado sea idéntico al leído de disco
+    return json.loads(json.dumps(bundle, cls=PlotlyJSONEncoder))
+
+
+def write_bundle(bundle, path=BUNDLE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(bundle, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_bundle(path=BUNDLE_FILE):
+    """Lee el paquete precalculado; None si no existe o está obsoleto"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            bundle = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if bundle.get('bundle_format') != BUNDLE_FORMAT:
+        print("Paquete de figuras con formato anterior, se ignora")
+        return None
+    if bundle.get('sources') != _source_signatures():
+        print("Los datos cambiaron desde que se generó el paquete de figuras, se ignora")
+        return None
+
+    return bundle
+
+
+if __name__ == "__main__":
+    from http_cache import STATIC_DIR, precompress_figures
+
+    bundle_data = build_bundle_data()
+    write_bundle(bundle_data)
+    precompress_figures(bundle_data['figures'])
+    print(f"Paquete de figuras {bundle_data['data_version']} guardado en {BUNDLE_FILE} "
+          f"({os.path.getsize(BUNDLE_FILE) / 1024:,.0f} KB); figuras precomprimidas en {STATIC_DIR}")
@@ -0,0 +1,181 @@
+"""
+Caché LRU de figuras serializadas para las vistas filtradas del dashboard.
+
+Cada entrada es el JSON de una figura (o de los datos de una tabla) indexado
+por el identificador del gráfico y la tupla normalizada de filtros. La caché
+en memoria se limita por tamaño total en bytes y descarta primero las
+entradas usadas hace más tiempo. Opcionalmente hay un segundo nivel en disco,
+compartido por todos los workers de gunicorn que apunten al mismo directorio.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from plotly.utils import PlotlyJSONEncoder
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_DISK_BYTES = 512 * 1024 * 1024
+
+# Cada cuántas escrituras a disco se revisa el tamaño del directorio
+_DISK_PRUNE_EVERY = 50
+
+
+def normalize_filters(filters):
+    """Tupla ordenada y hashable de los filtros activos.
+
+    Se ignoran los filtros vacíos y el orden de los valores elegidos, de modo
+    que {'mes': [2, 1]} y {'mes': [1, 2], 'sexo': None} comparten entrada.
+    """
+    normalized = []
+    for name, selected in sorted((filters or {}).items()):
+        if selected is None or selected == [] or selected == ():
+            continue
+        if not isinstance(selected, (list, tuple, set)):
+            selected = [selected]
+        normalized.append((name, tuple(sorted(set(selected), key=str))))
+    return tuple(normalized)
+
+
+class FigureCache:
+    """Caché LRU de JSON de figuras con límite de tamaño y nivel opcional en disco"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, disk_dir=None,
+                 max_disk_bytes=DEFAULT_MAX_DISK_BYTES, namespace=''):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        # Se antepone a las claves (p. ej. la versión de datos) para no
+        # servir figuras de otra versión desde el disco compartido
+        self.namespace = namespace
+
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def make_key(self, chart_id, filters=None):
+        return (self.namespace, chart_id, normalize_filters(filters))
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.disk_dir, digest + '.json')
+
+    def get(self, key):
+        """JSON cacheado para la clave, o None si no está en ningún nivel"""
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return payload
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                    payload = f.read()
+            except OSError:
+                payload = None
+            if payload is not None:
+                self._store(key, payload)
+                with self._lock:
+                    self.disk_hits += 1
+                return payload
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _store(self, key, payload):
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = payload
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def put(self, key, payload):
+        """Guarda un JSON en memoria y, si hay directorio, también en disco"""
+        self._store(key, payload)
+        if not self.disk_dir:
+            return
+
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"No se pudo escribir la figura en disco: {e}")
+            return
+
+        self._disk_writes += 1
+        if self._disk_writes % _DISK_PRUNE_EVERY == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Borra los archivos más antiguos si el directorio excede max_disk_bytes"""
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def get_or_build(self, chart_id, filters, builder):
+        """Retorna la figura cacheada (como dict) o la construye con `builder`.
+
+        `builder` no recibe argumentos y retorna una figura de Plotly o
+        cualquier objeto serializable a JSON.
+        """
+        key = self.make_key(chart_id, filters)
+        payload = self.get(key)
+        if payload is None:
+            payload = json.dumps(builder(), cls=PlotlyJSONEncoder)
+            self.put(key, payload)
+        return json.loads(payload)
+
+    def stats(self):
+        """Contadores de aciertos, fallos y ocupación"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
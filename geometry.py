@@ -0,0 +1,326 @@
+"""
+Geometrías de departamentos y municipios simplificadas en varios niveles de
+resolución.
+
+Data/map.geojson se lee una sola vez por proceso. A partir de él se
+precalculan versiones simplificadas con Douglas-Peucker a distintas
+tolerancias y con coordenadas cuantizadas (redondeadas a una grilla), lo que
+reduce el tamaño del GeoJSON que viaja dentro de la figura del mapa. El mapa
+elige el nivel según el zoom de la vista. Las features quedan indexadas por
+`codigo` para no recorrer el GeoJSON en cada figura, y con un R-tree
+empaquetado (STR) sobre sus cajas envolventes para recortar a la vista y
+ubicar el polígono bajo un punto sin recorrer todas las geometrías.
+
+Las geometrías municipales no vienen en el repositorio: se leen de
+Data/municipios.geojson si existe (p. ej. el MGN del DANE exportado a
+GeoJSON en WGS84).
+"""
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+
+GEOJSON_FILE = os.path.join('Data', 'map.geojson')
+MUNICIPALITIES_GEOJSON_FILE = os.path.join('Data', 'municipios.geojson')
+
+# Propiedades que pueden traer el código DANE de cinco dígitos del municipio
+MUNICIPALITY_CODE_KEYS = ['MPIO_CDPMP', 'COD_DANE', 'codigo']
+MUNICIPALITY_NAME_KEY = 'MPIO_CNMBR'
+
+# Nivel -> (tolerancia de simplificación en grados, decimales de la grilla)
+LEVELS = {
+    'baja': (0.05, 2),
+    'media': (0.02, 3),
+    'alta': (0.0, 4)
+}
+
+# Zoom de mapbox a partir del cual se usa cada nivel
+ZOOM_LEVELS = [(7.0, 'alta'), (5.5, 'media'), (0.0, 'baja')]
+
+# Nivel de la vista inicial del mapa (zoom 4.5, todo el país)
+DEFAULT_LEVEL = 'baja'
+
+# Un anillo cerrado necesita al menos cuatro puntos
+_MIN_RING_POINTS = 4
+
+
+def level_for_zoom(zoom):
+    """Nivel de resolución adecuado para un zoom de mapbox"""
+    if zoom is None:
+        return DEFAULT_LEVEL
+    for min_zoom, level in ZOOM_LEVELS:
+        if zoom >= min_zoom:
+            return level
+    return ZOOM_LEVELS[-1][1]
+
+
+def _douglas_peucker(points, tolerance):
+    """Simplifica una polilínea conservando los puntos a más de `tolerance` del trazo"""
+    n = len(points)
+    if tolerance <= 0 or n <= _MIN_RING_POINTS:
+        return points
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end <= start + 1:
+            continue
+        segment = points[start + 1:end]
+        a, b = points[start], points[end]
+        direction = b - a
+        length = np.hypot(direction[0], direction[1])
+        if length == 0:
+            distances = np.hypot(segment[:, 0] - a[0], segment[:, 1] - a[1])
+        else:
+            distances = np.abs(
+                direction[0] * (segment[:, 1] - a[1]) - direction[1] * (segment[:, 0] - a[0])
+            ) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = start + 1 + farthest
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return points[keep]
+
+
+def _simplify_ring(ring, tolerance, decimals):
+    points = np.asarray(ring, dtype='float64')
+    simplified = _douglas_peucker(points, tolerance)
+    quantized = np.round(simplified, decimals)
+
+    # La cuantización puede dejar puntos consecutivos repetidos
+    changed = np.any(quantized[1:] != quantized[:-1], axis=1)
+    quantized = np.vstack([quantized[:1], quantized[1:][changed]])
+
+    if len(quantized) < _MIN_RING_POINTS:
+        # Anillo demasiado pequeño para este nivel: se toman puntos equiespaciados del original
+        picks = np.linspace(0, len(points) - 1, _MIN_RING_POINTS).astype(int)
+        quantized = np.round(points[picks], decimals)
+    return quantized.tolist()
+
+
+def _simplify_geometry(geometry, tolerance, decimals):
+    if geometry['type'] == 'Polygon':
+        coordinates = [_simplify_ring(ring, tolerance, decimals) for ring in geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        coordinates = [
+            [_simplify_ring(ring, tolerance, decimals) for ring in polygon]
+            for polygon in geometry['coordinates']
+        ]
+    else:
+        return geometry
+    return {'type': geometry['type'], 'coordinates': coordinates}
+
+
+def _rings(geometry):
+    if geometry['type'] == 'Polygon':
+        return geometry['coordinates']
+    if geometry['type'] == 'MultiPolygon':
+        return [ring for polygon in geometry['coordinates'] for ring in polygon]
+    return []
+
+
+def geometry_bbox(geometry):
+    """Caja envolvente (min_lon, min_lat, max_lon, max_lat) de una geometría"""
+    points = np.concatenate([np.asarray(ring, dtype='float64') for ring in _rings(geometry)])
+    return (
+        float(points[:, 0].min()), float(points[:, 1].min()),
+        float(points[:, 0].max()), float(points[:, 1].max())
+    )
+
+
+def _point_in_ring(lon, lat, ring):
+    """Prueba de rayo: True si el punto está dentro del anillo"""
+    points = np.asarray(ring, dtype='float64')
+    x0, y0 = points[:-1, 0], points[:-1, 1]
+    x1, y1 = points[1:, 0], points[1:, 1]
+    crosses = (y0 > lat) != (y1 > lat)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = x0 + (lat - y0) * (x1 - x0) / (y1 - y0)
+    return bool(np.count_nonzero(crosses & (lon < x_cross)) % 2)
+
+
+def point_in_geometry(lon, lat, geometry):
+    """True si el punto cae dentro del polígono (descontando sus huecos)"""
+    polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+    for polygon in polygons:
+        if _point_in_ring(lon, lat, polygon[0]) and not any(_point_in_ring(lon, lat, hole) for hole in polygon[1:]):
+            return True
+    return False
+
+
+class STRTree:
+    """R-tree estático empaquetado con Sort-Tile-Recursive sobre cajas envolventes
+
+    Las hojas agrupan `node_capacity` cajas vecinas; cada nivel superior
+    guarda la caja que envuelve a cada grupo del nivel inferior. Una consulta
+    desciende solo por los nodos que cruzan la caja buscada.
+    """
+
+    def __init__(self, bboxes, node_capacity=16):
+        boxes = np.asarray(bboxes, dtype='float64').reshape(-1, 4)
+        self.node_capacity = node_capacity
+        self.item_ids = self._str_order(boxes, node_capacity)
+
+        level_boxes = boxes[self.item_ids]
+        self._levels = [level_boxes]
+        while len(level_boxes) > node_capacity:
+            starts = np.arange(0, len(level_boxes), node_capacity)
+            level_boxes = np.column_stack([
+                np.minimum.reduceat(level_boxes[:, 0], starts),
+                np.minimum.reduceat(level_boxes[:, 1], starts),
+                np.maximum.reduceat(level_boxes[:, 2], starts),
+                np.maximum.reduceat(level_boxes[:, 3], starts)
+            ])
+            self._levels.append(level_boxes)
+
+    @staticmethod
+    def _str_order(boxes, node_capacity):
+        """Orden STR: franjas verticales por centro x, cada una ordenada por centro y"""
+        count = len(boxes)
+        if count == 0:
+            return np.empty(0, dtype=np.intp)
+        centers_x = (boxes[:, 0] + boxes[:, 2]) / 2
+        centers_y = (boxes[:, 1] + boxes[:, 3]) / 2
+        leaves = int(np.ceil(count / node_capacity))
+        slices = int(np.ceil(np.sqrt(leaves)))
+        slice_size = slices * node_capacity
+
+        by_x = np.argsort(centers_x, kind='stable')
+        order = [
+            chunk[np.argsort(centers_y[chunk], kind='stable')]
+            for chunk in (by_x[i:i + slice_size] for i in range(0, count, slice_size))
+        ]
+        return np.concatenate(order)
+
+    def query(self, bbox):
+        """Posiciones (en el orden original) de las cajas que cruzan `bbox`"""
+        if len(self.item_ids) == 0:
+            return np.empty(0, dtype=np.intp)
+        min_x, min_y, max_x, max_y = bbox
+        candidates = np.arange(len(self._levels[-1]))
+        for depth in range(len(self._levels) - 1, -1, -1):
+            boxes = self._levels[depth][candidates]
+            hits = candidates[
+                (boxes[:, 0] <= max_x) & (boxes[:, 2] >= min_x) &
+                (boxes[:, 1] <= max_y) & (boxes[:, 3] >= min_y)
+            ]
+            if depth == 0:
+                return np.sort(self.item_ids[hits])
+            children = (hits[:, None] * self.node_capacity + np.arange(self.node_capacity)).ravel()
+            candidates = children[children < len(self._levels[depth - 1])]
+        return np.empty(0, dtype=np.intp)
+
+
+@lru_cache(maxsize=None)
+def _load_source(path=GEOJSON_FILE):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class GeometryIndex:
+    """Features del GeoJSON indexadas por código, con sus niveles simplificados
+
+    `normalize` convierte el valor de la propiedad `key` al código con el que
+    se cruzan los datos; en las colecciones simplificadas queda en
+    `properties.codigo` y el nombre (propiedad `name_key`) en
+    `properties.nombre`.
+    """
+
+    def __init__(self, geojson, key='codigo', normalize=str, name_key='nombre'):
+        self.key = 'codigo'
+        self.name_key = name_key
+        self.features = {}
+        bboxes = []
+        for feature in geojson['features']:
+            code = normalize(feature['properties'][key])
+            self.features[code] = feature
+            bboxes.append(geometry_bbox(feature['geometry']))
+        self.codes = frozenset(self.features)
+        self._code_list = list(self.features)
+        self._tree = STRTree(bboxes)
+        self._levels = {}
+
+    def level(self, level=DEFAULT_LEVEL):
+        """FeatureCollection simplificada y cuantizada del nivel pedido"""
+        if level not in self._levels:
+            tolerance, decimals = LEVELS[level]
+            self._levels[level] = {
+                'type': 'FeatureCollection',
+                'features': [
+                    {
+                        'type': 'Feature',
+                        'properties': {self.key: code, 'nombre': feature['properties'].get(self.name_key)},
+                        'geometry': _simplify_geometry(feature['geometry'], tolerance, decimals)
+                    }
+                    for code, feature in self.features.items()
+                ]
+            }
+        return self._levels[level]
+
+    def collection(self, level=DEFAULT_LEVEL, codes=None):
+        """Nivel pedido, opcionalmente restringido a un subconjunto de códigos"""
+        geojson = self.level(level)
+        if codes is None:
+            return geojson
+        codes = set(codes)
+        return {
+            'type': 'FeatureCollection',
+            'features': [feature for feature in geojson['features'] if feature['properties'][self.key] in codes]
+        }
+
+    def codes_in_bbox(self, bbox):
+        """Códigos cuyas cajas envolventes cruzan la caja (min_lon, min_lat, max_lon, max_lat)"""
+        return [self._code_list[position] for position in self._tree.query(bbox)]
+
+    def code_at(self, lon, lat):
+        """Código del polígono que contiene el punto, o None"""
+        for position in self._tree.query((lon, lat, lon, lat)):
+            code = self._code_list[position]
+            if point_in_geometry(lon, lat, self.features[code]['geometry']):
+                return code
+        return None
+
+
+@lru_cache(maxsize=None)
+def department_geometries(path=GEOJSON_FILE):
+    """Índice de geometrías de departamentos, construido una vez por proceso"""
+    return GeometryIndex(_load_source(path))
+
+
+def _municipality_code(value):
+    """Código DANE de cinco dígitos con ceros a la izquierda ('05001')"""
+    return str(int(value)).zfill(5)
+
+
+@lru_cache(maxsize=None)
+def municipality_geometries(path=MUNICIPALITIES_GEOJSON_FILE):
+    """Índice de geometrías municipales, o None si el archivo no existe"""
+    if not os.path.exists(path):
+        return None
+    geojson = _load_source(path)
+    properties = geojson['features'][0]['properties'] if geojson['features'] else {}
+    key = next((candidate for candidate in MUNICIPALITY_CODE_KEYS if candidate in properties), None)
+    if key is None:
+        print(f"{path} no tiene ninguna de las propiedades de código {MUNICIPALITY_CODE_KEYS}")
+        return None
+    return GeometryIndex(geojson, key=key, normalize=_municipality_code, name_key=MUNICIPALITY_NAME_KEY)
+
+
+if __name__ == "__main__":
+    for name, path, index in [
+        ('departamentos', GEOJSON_FILE, department_geometries()),
+        ('municipios', MUNICIPALITIES_GEOJSON_FILE, municipality_geometries())
+    ]:
+        if index is None:
+            print(f"Sin geometrías de {name} ({path} no existe)")
+            continue
+        original = len(json.dumps(_load_source(path), separators=(',', ':')))
+        print(f"GeoJSON de {name}: {original / 1024:,.0f} KB, {len(index.codes)} features")
+        for level_name in LEVELS:
+            size = len(json.dumps(index.level(level_name), separators=(',', ':')))
+            print(f"  Nivel {level_name}: {size / 1024:,.0f} KB")
@@ -0,0 +1,58 @@
+"""
+Configuración de gunicorn (se carga automáticamente con `gunicorn app:server`).
+
+El proceso maestro construye el dataset compartido y el paquete de figuras
+antes de crear los workers; cada worker luego lo mapea en memoria desde
+Data/cache/shared/ y no vuelve a leer los Excel. Ver shared_dataset.py y
+figure_bundle.py.
+
+Tras `python ingest.py` con una corrección basta `kill -HUP` al maestro:
+on_reload actualiza el cubo releyendo solo las particiones que cambiaron y
+los workers nuevos arrancan con los datos corregidos.
+
+Cada worker empieza a aceptar conexiones solo cuando su precarga terminó
+(ver warmup.py), de modo que ninguna petición llega a un worker en frío.
+"""
+import os
+
+
+def on_starting(server):
+    """Se ejecuta una vez en el proceso maestro, antes de crear workers"""
+    from shared_dataset import ensure_shared_dataset
+    from figure_bundle import load_bundle, build_bundle_data, write_bundle
+    from http_cache import precompress_figures
+
+    try:
+        server.log.info("Dataset compartido en %s", ensure_shared_dataset())
+    except Exception as e:
+        # Los workers cargarán los datos por su cuenta
+        server.log.warning("No se pudo preparar el dataset compartido: %s", e)
+        return
+
+    # Si el build no generó el paquete de figuras se genera aquí una sola vez,
+    # con sus cuerpos gzip/brotli (precompress_figures salta los que ya existen)
+    try:
+        bundle = load_bundle()
+        if bundle is None:
+            bundle = build_bundle_data()
+            write_bundle(bundle)
+        precompress_figures(bundle['figures'])
+    except Exception as e:
+        server.log.warning("No se pudo generar el paquete de figuras: %s", e)
+
+
+def on_reload(server):
+    """SIGHUP: prepara la versión de datos actual antes de reemplazar los workers"""
+    on_starting(server)
+
+
+def post_fork(server, worker):
+    """Se ejecuta en cada worker recién creado"""
+    server.log.info("Worker %s (pid %s) mapeará el dataset compartido", worker.age, os.getpid())
+
+
+def post_worker_init(worker):
+    """Se ejecuta con la aplicación ya importada, antes de aceptar conexiones"""
+    from warmup import wait_for_worker
+
+    wait_for_worker(worker)
@@ -0,0 +1,267 @@
+"""
+Compresión y caché HTTP de las respuestas de la aplicación.
+
+install(server, version) agrega a `app.server`:
+
+  * Compresión gzip o brotli (si el paquete `brotli` está instalado) de
+    las respuestas JSON, HTML, CSS y JS de más de MIN_SIZE bytes, según
+    Accept-Encoding. Los cuerpos que se repiten (layout, dependencias,
+    figuras sin filtros) se comprimen una sola vez: se guardan por hash
+    del contenido en una LRU limitada por tamaño.
+  * ETag fuerte en /_dash-layout y /_dash-dependencies, derivado de la
+    versión de datos y del hash del cuerpo; si coincide con If-None-Match
+    se responde 304 sin cuerpo.
+
+StaticFigures publica las figuras del paquete en
+/figuras/<versión>/<gráfico>.json: la URL cambia con la versión de datos,
+así que el navegador y una CDN pueden guardarlas indefinidamente
+(`immutable`). Sus cuerpos comprimidos se generan en el build con
+precompress_figures (python figure_bundle.py) en Data/cache/estaticos/.
+
+Este módulo no importa Flask ni pandas a nivel de módulo.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+    BROTLI_DISPONIBLE = True
+except ImportError:
+    BROTLI_DISPONIBLE = False
+
+STATIC_DIR = os.path.join('Data', 'cache', 'estaticos')
+STATIC_ROUTE = '/figuras'
+
+# Respuestas más pequeñas no se comprimen: el ahorro no compensa
+MIN_SIZE = 1024
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/javascript', 'text/javascript', 'text/html',
+    'text/css', 'text/plain', 'image/svg+xml'
+}
+
+# Rutas de Dash cuyo cuerpo solo cambia con la versión de datos o el código
+ETAG_ROUTES = {'/_dash-layout', '/_dash-dependencies'}
+
+# Niveles para respuestas dinámicas (rápidos) y para las precomprimidas (máximos)
+DYNAMIC_LEVELS = {'br': 5, 'gzip': 6}
+STATIC_LEVELS = {'br': 11, 'gzip': 9}
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+_ETAG_SUFFIX = {'br': '-br', 'gzip': '-gz', None: ''}
+_EXTENSIONS = {'br': '.br', 'gzip': '.gz'}
+
+
+def supported_encodings():
+    return ['br', 'gzip'] if BROTLI_DISPONIBLE else ['gzip']
+
+
+def choose_encoding(accept_encoding):
+    """Codificación preferida según Accept-Encoding ('br', 'gzip' o None)"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    for encoding in supported_encodings():
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding, level=None):
+    if encoding == 'br':
+        return brotli.compress(body, quality=DYNAMIC_LEVELS['br'] if level is None else level)
+    if encoding == 'gzip':
+        # mtime=0: el mismo cuerpo siempre produce los mismos bytes
+        return gzip.compress(body, compresslevel=DYNAMIC_LEVELS['gzip'] if level is None else level, mtime=0)
+    return body
+
+
+def body_hash(body):
+    return hashlib.sha1(body).hexdigest()[:16]
+
+
+def strong_etag(version, digest, encoding=None):
+    """ETag fuerte; cada codificación es una representación distinta"""
+    return f'"{version}-{digest}{_ETAG_SUFFIX[encoding]}"'
+
+
+def etag_matches(if_none_match, etags):
+    """True si If-None-Match contiene alguna de las ETags (o '*')"""
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+    return '*' in candidates or bool(candidates & set(etags))
+
+
+class CompressedBodies:
+    """LRU de cuerpos comprimidos por (hash del cuerpo, codificación), limitada en bytes"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, body, encoding, digest=None):
+        key = (digest or body_hash(body), encoding)
+        with self._lock:
+            compressed = self._entries.get(key)
+            if compressed is not None:
+                self._entries.move_to_end(key)
+                return compressed
+
+        compressed = compress(body, encoding)
+        if len(compressed) > self.max_bytes:
+            return compressed
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = compressed
+                self._size += len(compressed)
+                while self._size > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._size -= len(evicted)
+        return compressed
+
+
+def _is_compressible(response):
+    return (
+        response.mimetype in COMPRESSIBLE_TYPES
+        and 200 <= response.status_code < 300
+        and 'Content-Encoding' not in response.headers
+        and not response.direct_passthrough
+    )
+
+
+def install(server, version, max_bytes=None):
+    """Registra compresión y ETags en el servidor Flask. Retorna la caché de cuerpos"""
+    from flask import request
+
+    bodies = CompressedBodies(max_bytes or int(os.environ.get('COMPRESSION_CACHE_MB', 32)) * 1024 * 1024)
+
+    @server.after_request
+    def compress_response(response):
+        if not _is_compressible(response):
+            return response
+        body = response.get_data()
+        digest = body_hash(body)
+        encoding = choose_encoding(request.headers.get('Accept-Encoding')) if len(body) >= MIN_SIZE else None
+
+        if request.method in ('GET', 'HEAD') and request.path in ETAG_ROUTES:
+            etag = strong_etag(version, digest, encoding)
+            response.headers['ETag'] = etag
+            response.headers['Cache-Control'] = 'no-cache'
+            if etag_matches(request.headers.get('If-None-Match'), [etag]):
+                response.status_code = 304
+                response.set_data(b'')
+                response.headers.pop('Content-Length', None)
+                response.vary.add('Accept-Encoding')
+                return response
+
+        if len(body) >= MIN_SIZE:
+            response.vary.add('Accept-Encoding')
+        if encoding is not None:
+            response.set_data(bodies.get(body, encoding, digest))
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    server.extensions['http_cache'] = bodies
+    return bodies
+
+
+def _static_paths(chart_id, digest, directory=STATIC_DIR):
+    base = os.path.join(directory, f"{chart_id}-{digest}.json")
+    return {encoding: base + extension for encoding, extension in _EXTENSIONS.items()}
+
+
+def figure_body(figure):
+    """Bytes JSON compactos de una figura del paquete"""
+    return json.dumps(figure, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def precompress_figures(figures, directory=STATIC_DIR):
+    """Escribe gzip y brotli (nivel máximo) de cada figura; borra los de versiones anteriores"""
+    os.makedirs(directory, exist_ok=True)
+    current = set()
+    for chart_id, figure in figures.items():
+        body = figure_body(figure)
+        for encoding, path in _static_paths(chart_id, body_hash(body), directory).items():
+            current.add(os.path.basename(path))
+            if encoding not in supported_encodings() or os.path.exists(path):
+                continue
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(compress(body, encoding, STATIC_LEVELS[encoding]))
+            os.replace(tmp_path, path)
+    for name in os.listdir(directory):
+        if name not in current:
+            os.remove(os.path.join(directory, name))
+
+
+class StaticFigures:
+    """Figuras del paquete servidas por GET con URL versionada, ETag y cuerpos precomprimidos"""
+
+    def __init__(self, figures, version, directory=STATIC_DIR):
+        self.version = version
+        self._payloads = {}
+        for chart_id, figure in figures.items():
+            body = figure_body(figure)
+            digest = body_hash(body)
+            encoded = {None: body}
+            for encoding, path in _static_paths(chart_id, digest, directory).items():
+                try:
+                    with open(path, 'rb') as f:
+                        encoded[encoding] = f.read()
+                except OSError:
+                    # Sin precompresión del build se comprime al primer pedido
+                    pass
+            self._payloads[chart_id] = (digest, encoded)
+        self._lock = threading.Lock()
+
+    def __contains__(self, chart_id):
+        return chart_id in self._payloads
+
+    def url(self, chart_id):
+        return f"{STATIC_ROUTE}/{self.version}/{chart_id}.json"
+
+    def _encoded(self, chart_id, encoding):
+        digest, encoded = self._payloads[chart_id]
+        if encoding not in encoded:
+            with self._lock:
+                if encoding not in encoded:
+                    encoded[encoding] = compress(encoded[None], encoding, STATIC_LEVELS[encoding])
+        return digest, encoded[encoding]
+
+    def register_routes(self, server):
+        from flask import Response, abort, request
+
+        @server.route(f"{STATIC_ROUTE}/<version>/<chart_id>.json")
+        def static_figure(version, chart_id):
+            if version != self.version or chart_id not in self._payloads:
+                abort(404)
+            encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+            digest, body = self._encoded(chart_id, encoding)
+            etag = strong_etag(self.version, digest, encoding)
+            headers = {
+                'ETag': etag,
+                'Cache-Control': 'public, max-age=31536000, immutable',
+                'Vary': 'Accept-Encoding'
+            }
+            if etag_matches(request.headers.get('If-None-Match'), [etag]):
+                return Response(status=304, headers=headers)
+            if encoding is not None:
+                headers['Content-Encoding'] = encoding
+            return Response(body, mimetype='application/json', headers=headers)
+
+        return self
@@ -0,0 +1,331 @@
+"""
+Índice CIE-10 precalculado sobre el catálogo de códigos de muerte (Anexo2).
+
+Reemplaza los recorridos fila a fila del catálogo: una tabla ordenada por
+código con una fila por cada código de cuatro caracteres (X954) y por cada
+código de tres (X95), con su descripción, capítulo y nombre de capítulo. Se
+guarda en Data/cache/ como Parquet, ligado al hash del Excel del catálogo, y
+se carga una sola vez por proceso con load_icd10_index().
+
+Las búsquedas sobre una columna completa (COD_MUERTE) se resuelven sobre los
+códigos distintos y se expanden con indexación de numpy. También admite
+consultas por prefijo, rango y capítulo:
+
+    python icd10.py "X93-X95" "capitulo XX"
+
+cause_families() clasifica los códigos en familias de causas externas
+(homicidio, suicidio, transporte, ...) definidas en CAUSE_FAMILIES; el cubo
+de mortalidad guarda el resultado en la columna FAMILIA_CAUSA.
+"""
+import os
+import re
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_cache import CACHE_DIR, DEATH_CODES_FILE, DEATH_CODES_READ_KWARGS, PARQUET_DISPONIBLE, read_excel_cached, source_hash
+
+INDEX_PREFIX = 'icd10_'
+INDEX_COLUMNS = ['CODIGO', 'CODIGO_3', 'DESCRIPCION', 'CAPITULO', 'NOMBRE_CAPITULO']
+
+SIN_DESCRIPCION = 'Descripción no disponible'
+
+ROMAN_CHAPTERS = [
+    'I', 'II', 'III', 'IV', 'V', 'VI', 'VII', 'VIII', 'IX', 'X', 'XI',
+    'XII', 'XIII', 'XIV', 'XV', 'XVI', 'XVII', 'XVIII', 'XIX', 'XX', 'XXI', 'XXII'
+]
+
+# Familias de causas por rangos de código de tres caracteres. Una causa cae
+# en la primera familia cuyo rango la contiene; el resto queda en OTHER_FAMILY.
+CAUSE_FAMILIES = {
+    'homicidio': 'X85-Y09',
+    'suicidio': 'X60-X84',
+    'transporte': 'V01-V99',
+    'intencion_no_determinada': 'Y10-Y34',
+    'intervencion_legal_guerra': 'Y35-Y36',
+    'otros_accidentes': 'W00-X59'
+}
+OTHER_FAMILY = 'otra'
+FAMILY_COLUMN = 'FAMILIA_CAUSA'
+
+_CHAPTER_PATTERN = re.compile(r'^(?:CAP[IÍ]TULO|CHAPTER|CAP\.?)\s*([IVXL]+|\d+)$')
+_RANGE_PATTERN = re.compile(r'^([A-Z]\d[0-9A-Z]*)\s*[-–—]\s*([A-Z]\d[0-9A-Z]*)$')
+
+_loaded_index = None
+_load_lock = threading.Lock()
+
+
+def _normalize_codes(codes):
+    """Códigos como texto en mayúsculas y sin espacios (NaN se conserva)"""
+    codes = pd.Series(codes, dtype=object)
+    return codes.where(codes.isna(), codes.astype(str).str.strip().str.upper())
+
+
+def chapter_number(chapter):
+    """Número de capítulo a partir de un entero, '20' o el romano 'XX'"""
+    if isinstance(chapter, (int, np.integer)):
+        return int(chapter)
+    chapter = str(chapter).strip().upper()
+    if chapter.isdigit():
+        return int(chapter)
+    if chapter in ROMAN_CHAPTERS:
+        return ROMAN_CHAPTERS.index(chapter) + 1
+    raise ValueError(f"Capítulo CIE-10 no válido: {chapter}")
+
+
+def _category_codes(codes):
+    """Códigos enteros por fila y valores distintos de una columna"""
+    if isinstance(codes, pd.Series) and isinstance(codes.dtype, pd.CategoricalDtype):
+        return codes.cat.codes.to_numpy(), codes.cat.categories
+    return pd.factorize(pd.Series(codes))
+
+
+def parse_expression(expression):
+    """Partes de una expresión: ('capitulo', n) o ('rango', inicio, fin)"""
+    parts = []
+    for part in str(expression).split(','):
+        part = part.strip().upper().rstrip('*')
+        if not part:
+            continue
+        chapter = _CHAPTER_PATTERN.match(part)
+        if chapter:
+            parts.append(('capitulo', chapter_number(chapter.group(1))))
+            continue
+        code_range = _RANGE_PATTERN.match(part)
+        if code_range:
+            parts.append(('rango', code_range.group(1), code_range.group(2)))
+        else:
+            parts.append(('rango', part, part))
+    return parts
+
+
+def _in_ranges(codes, parts):
+    """Máscara de los códigos (Series de texto) dentro de alguno de los rangos"""
+    matched = np.zeros(len(codes), dtype=bool)
+    for part in parts:
+        if part[0] != 'rango':
+            continue
+        start, end = part[1], part[2]
+        matched |= (codes >= start).to_numpy() & (codes.str[:len(end)] <= end).to_numpy() & (codes != '').to_numpy()
+    return matched
+
+
+def cause_families(codes):
+    """Familia de causa (CAUSE_FAMILIES) de cada código, como categórico
+
+    Se clasifica una vez cada código distinto y se expande a las filas, de
+    modo que agregar familias no cuesta nada por consulta.
+    """
+    row_codes, uniques = _category_codes(codes)
+    uniques = _normalize_codes(uniques).fillna('')
+    names = list(CAUSE_FAMILIES) + [OTHER_FAMILY]
+
+    families = np.full(len(uniques), len(CAUSE_FAMILIES), dtype='int8')
+    for position, expression in reversed(list(enumerate(CAUSE_FAMILIES.values()))):
+        families[_in_ranges(uniques, parse_expression(expression))] = position
+
+    families = np.append(families, np.int8(len(CAUSE_FAMILIES)))[row_codes]
+    return pd.Categorical.from_codes(families, categories=names)
+
+
+def build_index_table(death_codes):
+    """Tabla ordenada por código con una fila por código de cuatro y de tres caracteres"""
+    catalogue = death_codes.dropna(subset=['CODIGO_3'])
+    code_3 = _normalize_codes(catalogue['CODIGO_3']).to_numpy()
+
+    by_code_4 = pd.DataFrame({
+        'CODIGO': _normalize_codes(catalogue['CODIGO_4']).to_numpy(),
+        'CODIGO_3': code_3,
+        'DESCRIPCION': catalogue['DESCRIPCION_4'].to_numpy(),
+        'CAPITULO': catalogue['CAPITULO'].to_numpy(),
+        'NOMBRE_CAPITULO': catalogue['NOMBRE_CAPITULO'].to_numpy()
+    }).dropna(subset=['CODIGO'])
+    by_code_3 = pd.DataFrame({
+        'CODIGO': code_3,
+        'CODIGO_3': code_3,
+        'DESCRIPCION': catalogue['DESCRIPCION_3'].to_numpy(),
+        'CAPITULO': catalogue['CAPITULO'].to_numpy(),
+        'NOMBRE_CAPITULO': catalogue['NOMBRE_CAPITULO'].to_numpy()
+    })
+
+    table = pd.concat([by_code_4, by_code_3], ignore_index=True)
+    table = table.drop_duplicates('CODIGO').sort_values('CODIGO', ignore_index=True)
+    table['CAPITULO'] = table['CAPITULO'].astype('Int8')
+    return table[INDEX_COLUMNS]
+
+
+class ICD10Index:
+    """Búsquedas vectorizadas de descripción y capítulo por código CIE-10"""
+
+    def __init__(self, table):
+        self.table = table.reset_index(drop=True)
+        self.codes = self.table['CODIGO'].to_numpy(dtype=object)
+        self._positions = pd.Index(self.codes)
+        self._chapters = self.table['CAPITULO'].to_numpy(dtype='float64', na_value=np.nan)
+
+    @classmethod
+    def from_death_codes(cls, death_codes):
+        return cls(build_index_table(death_codes))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def positions(self, codes):
+        """Fila del índice para cada código (-1 si no está)
+
+        Se busca el código completo y, si no aparece, sus tres primeros
+        caracteres (p. ej. C61X -> C61).
+        """
+        codes = _normalize_codes(codes)
+        positions = self._positions.get_indexer(codes)
+        missing = positions < 0
+        if missing.any():
+            positions[missing] = self._positions.get_indexer(codes[missing].str[:3])
+        return positions
+
+    def _map(self, codes, values, default):
+        """Valor del índice para cada código, resuelto sobre los códigos distintos"""
+        if isinstance(codes, pd.Series):
+            index = codes.index
+        else:
+            index = None
+            codes = pd.Series(codes)
+        row_codes, uniques = _category_codes(codes)
+
+        positions = self.positions(uniques)
+        by_unique = np.where(positions >= 0, values[positions], default)
+        # El código -1 (NaN) toma el valor por defecto agregado al final
+        result = np.append(by_unique, np.array([default], dtype=by_unique.dtype))[row_codes]
+        return pd.Series(result, index=index if index is not None else pd.RangeIndex(len(result)))
+
+    def describe(self, codes, default=SIN_DESCRIPCION):
+        """Descripción de cada código de una columna"""
+        return self._map(codes, self.table['DESCRIPCION'].to_numpy(dtype=object), default)
+
+    def chapter(self, codes):
+        """Capítulo de cada código (NaN si no está en el catálogo)"""
+        return self._map(codes, self._chapters, np.nan)
+
+    def chapter_name(self, codes, default=SIN_DESCRIPCION):
+        """Nombre del capítulo de cada código"""
+        return self._map(codes, self.table['NOMBRE_CAPITULO'].to_numpy(dtype=object), default)
+
+    def codes_in_range(self, start, end):
+        """Códigos del catálogo entre `start` y `end`, incluidas sus subcategorías
+
+        codes_in_range('X93', 'X95') incluye X930 ... X959.
+        """
+        start, end = start.strip().upper(), end.strip().upper()
+        low = np.searchsorted(self.codes, start, side='left')
+        high = np.searchsorted(self.codes, end + '\uffff', side='left')
+        return self.codes[low:high]
+
+    def codes_with_prefix(self, prefix):
+        return self.codes_in_range(prefix, prefix)
+
+    def chapter_codes(self, chapter):
+        """Códigos del catálogo de un capítulo (número o romano)"""
+        return self.codes[self._chapters == chapter_number(chapter)]
+
+    def query(self, expression):
+        """Códigos del catálogo que cumplen la expresión.
+
+        Acepta prefijos ("X95", "X9*"), rangos ("X93-X95", "X85–Y09"),
+        capítulos ("capitulo XX", "chapter 20") y combinaciones separadas por
+        comas.
+        """
+        selected = []
+        for part in parse_expression(expression):
+            if part[0] == 'capitulo':
+                selected.append(self.chapter_codes(part[1]))
+            else:
+                selected.append(self.codes_in_range(part[1], part[2]))
+        if not selected:
+            return np.empty(0, dtype=object)
+        return np.unique(np.concatenate(selected))
+
+    def matches(self, codes, expression):
+        """Máscara booleana de los códigos de una columna que cumplen la expresión
+
+        Los rangos se comparan sobre el propio código, de modo que también se
+        reconocen códigos ausentes del catálogo.
+        """
+        parts = parse_expression(expression)
+        row_codes, uniques = _category_codes(codes)
+
+        uniques = _normalize_codes(uniques).fillna('')
+        matched = _in_ranges(uniques, parts)
+        chapters = [part[1] for part in parts if part[0] == 'capitulo']
+        if chapters:
+            matched |= np.isin(self.chapter(uniques).to_numpy(), chapters)
+        return np.append(matched, False)[row_codes]
+
+
+def _index_path(catalogue_hash):
+    return os.path.join(CACHE_DIR, f"{INDEX_PREFIX}{catalogue_hash[:12]}.parquet")
+
+
+def _write_index(index, path):
+    """Guarda la tabla del índice y borra las de versiones anteriores del catálogo"""
+    tmp_path = path + '.tmp'
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        index.table.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"No se pudo guardar el índice CIE-10: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    for name in os.listdir(CACHE_DIR):
+        stale = os.path.join(CACHE_DIR, name)
+        if name.startswith(INDEX_PREFIX) and name.endswith('.parquet') and stale != path:
+            os.remove(stale)
+
+
+def load_icd10_index(death_codes=None):
+    """Índice CIE-10 del proceso, leído de Data/cache/ o construido una vez.
+
+    Si el Excel del catálogo no está disponible se construye con
+    `death_codes` (el catálogo ya cargado) sin guardarlo.
+    """
+    global _loaded_index
+    if _loaded_index is not None:
+        return _loaded_index
+
+    with _load_lock:
+        if _loaded_index is not None:
+            return _loaded_index
+
+        if not os.path.exists(DEATH_CODES_FILE):
+            if death_codes is None:
+                raise FileNotFoundError(DEATH_CODES_FILE)
+            _loaded_index = ICD10Index.from_death_codes(death_codes)
+            return _loaded_index
+
+        path = _index_path(source_hash(DEATH_CODES_FILE, DEATH_CODES_READ_KWARGS))
+        if PARQUET_DISPONIBLE and os.path.exists(path):
+            try:
+                _loaded_index = ICD10Index(pd.read_parquet(path))
+                return _loaded_index
+            except Exception as e:
+                print(f"Índice CIE-10 inválido, se reconstruye: {e}")
+
+        if death_codes is None:
+            death_codes = read_excel_cached(DEATH_CODES_FILE, **DEATH_CODES_READ_KWARGS)
+        index = ICD10Index.from_death_codes(death_codes)
+        if PARQUET_DISPONIBLE:
+            _write_index(index, path)
+        _loaded_index = index
+        return _loaded_index
+
+
+if __name__ == "__main__":
+    icd10 = load_icd10_index()
+    print(f"Índice CIE-10: {len(icd10):,} códigos")
+    for expression in sys.argv[1:]:
+        codes = icd10.query(expression)
+        print(f"\n{expression}: {len(codes)} códigos")
+        print(icd10.table[icd10.table['CODIGO'].isin(codes)][['CODIGO', 'DESCRIPCION']].head(20).to_string(index=False))
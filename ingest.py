@@ -0,0 +1,479 @@
+"""
+Ingesta por streaming de varios años de defunciones no fetales (EEVV DANE).
+
+Cada archivo anual (Excel de anexos o CSV de microdatos) se lee por bloques
+de filas, con openpyxl en modo solo lectura o con pd.read_csv(chunksize),
+se normaliza al esquema de Anexo1 y se escribe en un almacén Parquet
+particionado por año y departamento:
+
+    Data/cache/anios/anio=2019/departamento=05/parte.parquet
+    Data/cache/anios/manifest.json
+
+La memoria usada depende del tamaño del bloque y no del volumen total. Un año
+solo se vuelve a ingerir si su archivo fuente cambió. El manifiesto guarda
+filas y una firma de contenido de cada partición (independiente del orden de
+las filas), con la que shared_dataset actualiza el cubo solo en las
+particiones que cambiaron (ver update_store_cube).
+
+    python ingest.py [--chunk-rows N] [--years 2015-2023] [--jobs N] [--force] [--no-cube]
+
+Los archivos se buscan en Data/ y Data/defunciones/ por nombre (NoFetal2019,
+nofetal2020.csv, ...). build_store_cube() arma el cubo de conteos de un rango
+de años leyendo partición por partición.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from data_cache import DATA_DIR, STORE_DIR, STORE_MANIFEST_FILE, excel_workers, file_hash
+
+# 2: firma de contenido por partición
+STORE_FORMAT = 3
+DEFAULT_CHUNK_ROWS = 50_000
+
+SOURCE_DIRS = [DATA_DIR, os.path.join(DATA_DIR, 'defunciones')]
+_SOURCE_PATTERN = re.compile(r'nofetal[\s_-]*(\d{4}).*\.(xlsx|csv)$', re.IGNORECASE)
+
+# Esquema normalizado del almacén (mismo nombre de columnas que Anexo1)
+STORE_COLUMNS = ['AÑO', 'COD_DEPARTAMENTO', 'COD_MUNICIPIO', 'MES', 'SEXO', 'GRUPO_EDAD1', 'COD_MUERTE']
+INT_COLUMNS = {
+    'AÑO': 'int16',
+    'COD_DEPARTAMENTO': 'int8',
+    'COD_MUNICIPIO': 'int16',
+    'MES': 'int8',
+    'SEXO': 'int8',
+    'GRUPO_EDAD1': 'int8'
+}
+
+# Código de los valores faltantes: el almacén y el cubo solo tienen enteros
+# simples (un pd.NA no se puede mapear en memoria ni ordenar en los índices).
+# GRUPO_EDAD1 usa el código 29 del DANE (edad desconocida); el año faltante
+# se toma del archivo y las filas sin departamento se descartan.
+MISSING_CODE = -1
+MISSING_CODES = {
+    'COD_MUNICIPIO': MISSING_CODE,
+    'MES': MISSING_CODE,
+    'SEXO': MISSING_CODE,
+    'GRUPO_EDAD1': 29
+}
+
+# Nombres alternativos de columnas (microdatos EEVV del DANE y variantes)
+COLUMN_ALIASES = {
+    'ANO': 'AÑO',
+    'ANIO': 'AÑO',
+    'COD_DPTO': 'COD_DEPARTAMENTO',
+    'COD_MUNIC': 'COD_MUNICIPIO',
+    'GRU_ED1': 'GRUPO_EDAD1',
+    'C_BAS1': 'COD_MUERTE',
+    'CAUSA_BASICA': 'COD_MUERTE'
+}
+
+
+def discover_sources(source_dirs=None):
+    """Archivos anuales encontrados: {año: ruta}. Si un año tiene Excel y CSV gana el Excel"""
+    sources = {}
+    for directory in source_dirs or SOURCE_DIRS:
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            match = _SOURCE_PATTERN.search(name)
+            if not match:
+                continue
+            year = int(match.group(1))
+            path = os.path.join(directory, name)
+            if year not in sources or path.lower().endswith('.xlsx'):
+                sources[year] = path
+    return dict(sorted(sources.items()))
+
+
+def iter_excel_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Bloques de filas de la primera hoja, leída con openpyxl en modo solo lectura"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(value).strip() if value is not None else '' for value in next(rows)]
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+
+def iter_csv_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS, **read_kwargs):
+    """Bloques de filas de un CSV; las columnas se leen como texto y se tipan al normalizar"""
+    read_kwargs.setdefault('dtype', str)
+    read_kwargs.setdefault('encoding', 'latin-1')
+    yield from pd.read_csv(path, chunksize=chunk_rows, **read_kwargs)
+
+
+def iter_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    if path.lower().endswith('.csv'):
+        return iter_csv_chunks(path, chunk_rows)
+    return iter_excel_chunks(path, chunk_rows)
+
+
+def normalize_chunk(chunk, year):
+    """Lleva un bloque al esquema STORE_COLUMNS con enteros pequeños.
+
+    Las columnas se reconocen sin importar mayúsculas ni los alias de
+    COLUMN_ALIASES. Sin columna (o sin valor) de año se usa el del nombre del
+    archivo y los demás códigos faltantes toman su valor de MISSING_CODES. Se
+    descartan las filas sin departamento (no se pueden particionar).
+    Retorna (bloque normalizado, filas descartadas).
+    """
+    renamed = {}
+    for column in chunk.columns:
+        key = str(column).strip().upper()
+        renamed[column] = COLUMN_ALIASES.get(key, key)
+    chunk = chunk.rename(columns=renamed)
+
+    missing = [column for column in STORE_COLUMNS if column not in chunk.columns and column != 'AÑO']
+    if missing:
+        raise ValueError(f"Columnas faltantes: {missing}")
+
+    normalized = pd.DataFrame(index=chunk.index)
+    for column, dtype in INT_COLUMNS.items():
+        if column == 'AÑO' and column not in chunk.columns:
+            normalized[column] = np.full(len(chunk), year, dtype=dtype)
+            continue
+        values = pd.to_numeric(chunk[column], errors='coerce')
+        if column == 'AÑO':
+            values = values.fillna(year)
+        elif column in MISSING_CODES:
+            values = values.fillna(MISSING_CODES[column])
+        normalized[column] = values.astype(dtype.capitalize())
+    cause = chunk['COD_MUERTE'].astype('string').str.strip().str.upper()
+    normalized['COD_MUERTE'] = cause.mask(cause == '')
+
+    valid = normalized['COD_DEPARTAMENTO'].notna().to_numpy()
+    normalized = normalized[valid].astype(INT_COLUMNS).reset_index(drop=True)
+    return normalized, int((~valid).sum())
+
+
+def content_signature(frame):
+    """Suma (módulo 2**64) de los hashes de fila: no depende del orden ni del
+    tamaño de bloque, así que se puede acumular bloque a bloque"""
+    hashes = pd.util.hash_pandas_object(frame[STORE_COLUMNS], index=False).to_numpy()
+    return int(hashes.sum(dtype=np.uint64))
+
+
+def _arrow_table(frame):
+    import pyarrow as pa
+
+    return pa.Table.from_pandas(frame[STORE_COLUMNS], preserve_index=False)
+
+
+def _load_manifest():
+    try:
+        with open(STORE_MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {'format': STORE_FORMAT, 'years': {}}
+    if manifest.get('format') != STORE_FORMAT:
+        return {'format': STORE_FORMAT, 'years': {}}
+    return manifest
+
+
+def _save_manifest(manifest):
+    os.makedirs(STORE_DIR, exist_ok=True)
+    tmp_path = STORE_MANIFEST_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, STORE_MANIFEST_FILE)
+
+
+def _year_dir(year):
+    return os.path.join(STORE_DIR, f"anio={year}")
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return {'source': path, 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def is_year_fresh(year, path, manifest=None):
+    """True si el año ya está en el almacén a partir del mismo archivo fuente"""
+    manifest = manifest or _load_manifest()
+    entry = manifest['years'].get(str(year))
+    if entry is None or not os.path.isdir(_year_dir(year)):
+        return False
+    signature = _source_signature(path)
+    if all(entry.get(key) == value for key, value in signature.items()):
+        return True
+    # mtime distinto pero mismo contenido (p. ej. archivo copiado de nuevo)
+    return entry.get('size') == signature['size'] and entry.get('sha256') == file_hash(path)
+
+
+def ingest_year(year, path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Escribe las particiones de un año leyendo el archivo por bloques.
+
+    Se mantiene abierto un ParquetWriter por departamento y cada bloque se
+    agrega como un row group, así que en memoria solo vive un bloque. El año
+    se escribe en un directorio temporal y se reemplaza al final.
+    """
+    import pyarrow.parquet as pq
+
+    os.makedirs(STORE_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".anio={year}-", dir=STORE_DIR)
+    writers = {}
+    signatures = {}
+    rows = discarded = 0
+    try:
+        for chunk in iter_chunks(path, chunk_rows):
+            normalized, dropped = normalize_chunk(chunk, year)
+            discarded += dropped
+            rows += len(normalized)
+            for department, part in normalized.groupby('COD_DEPARTAMENTO', observed=True, sort=False):
+                department = int(department)
+                table = _arrow_table(part)
+                if department not in writers:
+                    part_dir = os.path.join(tmp_dir, f"departamento={department:02d}")
+                    os.makedirs(part_dir)
+                    writers[department] = pq.ParquetWriter(os.path.join(part_dir, 'parte.parquet'), table.schema)
+                writers[department].write_table(table)
+                signatures[department] = (signatures.get(department, 0) + content_signature(part)) % 2**64
+            print(f"  {year}: {rows:,} filas")
+    except Exception:
+        for writer in writers.values():
+            writer.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    partitions = {}
+    for department, writer in sorted(writers.items()):
+        writer.close()
+        relative = os.path.join(f"anio={year}", f"departamento={department:02d}", 'parte.parquet')
+        part_path = os.path.join(tmp_dir, f"departamento={department:02d}", 'parte.parquet')
+        partitions[str(department)] = {
+            'file': relative,
+            'rows': int(pq.ParquetFile(part_path).metadata.num_rows),
+            'sha256': file_hash(part_path),
+            'content': f"{signatures[department]:016x}"
+        }
+
+    final_dir = _year_dir(year)
+    if os.path.isdir(final_dir):
+        shutil.rmtree(final_dir)
+    os.rename(tmp_dir, final_dir)
+
+    entry = _source_signature(path)
+    entry.update({'sha256': file_hash(path), 'rows': rows, 'discarded': discarded, 'partitions': partitions})
+    return entry
+
+
+def ingest_all(years=None, chunk_rows=DEFAULT_CHUNK_ROWS, force=False, source_dirs=None, jobs=1):
+    """Ingiere los años encontrados (o los de `years`) que no estén al día.
+
+    Con jobs > 1 cada año se ingiere en su propio proceso; la memoria
+    crece a jobs bloques, y el manifiesto lo escribe solo este proceso.
+    """
+    sources = discover_sources(source_dirs)
+    if years is not None:
+        sources = {year: path for year, path in sources.items() if year in years}
+    if not sources:
+        print("No se encontraron archivos anuales de defunciones")
+        return _load_manifest()
+
+    manifest = _load_manifest()
+    stale = {}
+    for year, path in sources.items():
+        if not force and is_year_fresh(year, path, manifest):
+            print(f"Año {year} al día: {path}")
+        else:
+            stale[year] = path
+
+    def record(year, entry):
+        previous = partition_signatures(manifest, years={year})
+        manifest['years'][str(year)] = entry
+        # Se guarda por año: si el proceso se interrumpe lo ya escrito queda registrado
+        _save_manifest(manifest)
+        changed, removed = diff_partitions(previous, partition_signatures(manifest, years={year}))
+        print(f"Año {year}: {entry['rows']:,} filas, {len(entry['partitions'])} departamentos "
+              f"({len(changed)} particiones nuevas o cambiadas, {len(removed)} eliminadas)")
+
+    jobs = max(1, min(jobs, len(stale)))
+    if jobs == 1:
+        for year, path in stale.items():
+            print(f"Ingiriendo {year} desde {path}...")
+            record(year, ingest_year(year, path, chunk_rows))
+        return manifest
+
+    print(f"Ingiriendo {len(stale)} años en {jobs} procesos...")
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(ingest_year, year, path, chunk_rows): year for year, path in stale.items()}
+        for future in as_completed(futures):
+            record(futures[future], future.result())
+    return manifest
+
+
+def partition_signatures(manifest=None, years=None):
+    """Firma de contenido de cada partición: {(año, departamento): firma}"""
+    manifest = manifest or _load_manifest()
+    return {
+        (int(year), int(department)): partition['content']
+        for year, entry in manifest['years'].items()
+        if years is None or int(year) in years
+        for department, partition in entry['partitions'].items()
+    }
+
+
+def diff_partitions(previous, current):
+    """Particiones nuevas o con otro contenido, y particiones que desaparecieron"""
+    changed = {key for key, signature in current.items() if previous.get(key) != signature}
+    removed = set(previous) - set(current)
+    return changed, removed
+
+
+def store_years():
+    """Años disponibles en el almacén"""
+    return sorted(int(year) for year in _load_manifest()['years'])
+
+
+def iter_partitions(start=None, end=None, departments=None):
+    """(año, departamento, ruta) de las particiones dentro del rango"""
+    manifest = _load_manifest()
+    for year, entry in sorted(manifest['years'].items(), key=lambda item: int(item[0])):
+        year = int(year)
+        if (start is not None and year < start) or (end is not None and year > end):
+            continue
+        for department, partition in sorted(entry['partitions'].items(), key=lambda item: int(item[0])):
+            if departments is not None and int(department) not in departments:
+                continue
+            yield year, int(department), os.path.join(STORE_DIR, partition['file'])
+
+
+def load_years(start=None, end=None, columns=None, departments=None):
+    """Registros de un rango de años (cuidado: carga todas las filas en memoria)"""
+    frames = [pd.read_parquet(path, columns=columns) for _, _, path in iter_partitions(start, end, departments)]
+    if not frames:
+        return pd.DataFrame(columns=columns or STORE_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def partition_cube(path):
+    """Conteos de una partición sobre las dimensiones del cubo (AÑO incluido)"""
+    from data_processing import YEAR_COLUMN, CUBE_DIMENSIONS
+
+    dimensions = [YEAR_COLUMN] + CUBE_DIMENSIONS
+    records = pd.read_parquet(path, columns=dimensions)
+    return records.groupby(dimensions, dropna=False, observed=True).size().reset_index(name='TOTAL_MUERTES')
+
+
+def build_store_cube(start=None, end=None, divipola=None):
+    """Cubo de conteos de un rango de años, agregado partición por partición.
+
+    Cada partición es un (año, departamento) distinto, de modo que los
+    cubos parciales no se solapan y basta concatenarlos; en memoria solo
+    vive una partición de registros a la vez.
+    """
+    from data_processing import finish_mortality_cube
+
+    parts = []
+    records = 0
+    for _, _, path in iter_partitions(start, end):
+        part = partition_cube(path)
+        records += int(part['TOTAL_MUERTES'].sum())
+        parts.append(part)
+    if not parts:
+        raise FileNotFoundError(f"El almacén {STORE_DIR} no tiene años en el rango pedido")
+
+    cube = pd.concat(parts, ignore_index=True).astype(INT_COLUMNS)
+    cube['COD_MUERTE'] = cube['COD_MUERTE'].astype(object).astype('category')
+    cube = finish_mortality_cube(cube, divipola)
+    print(f"Cubo multianual: {len(cube):,} celdas a partir de {records:,} registros")
+    return cube
+
+
+def update_store_cube(cube, previous, current, divipola=None):
+    """Aplica a un cubo ya construido solo los cambios entre dos versiones del almacén.
+
+    `previous` y `current` son firmas de partition_signatures. Como cada
+    partición es un (año, departamento) distinto, las celdas del cubo de las
+    particiones cambiadas o eliminadas se descartan y se agregan las de las
+    particiones nuevas; el resto del cubo se conserva tal cual. Retorna el
+    cubo actualizado y el número de particiones leídas.
+    """
+    from data_processing import YEAR_COLUMN, finish_mortality_cube
+
+    changed, removed = diff_partitions(previous, current)
+    stale = changed | removed
+    if not stale:
+        return cube, 0
+
+    cube_keys = cube[YEAR_COLUMN].to_numpy().astype('int64') * 100 + cube['COD_DEPARTAMENTO'].to_numpy()
+    stale_keys = np.array([year * 100 + department for year, department in stale], dtype='int64')
+    kept = cube[~np.isin(cube_keys, stale_keys)]
+
+    manifest = _load_manifest()
+    parts = []
+    for year, department in sorted(changed):
+        partition = manifest['years'][str(year)]['partitions'][str(department)]
+        parts.append(partition_cube(os.path.join(STORE_DIR, partition['file'])))
+
+    if parts:
+        added = pd.concat(parts, ignore_index=True)
+        added['COD_MUERTE'] = added['COD_MUERTE'].astype(object).astype('category')
+        added = finish_mortality_cube(added, divipola)
+        updated = pd.concat([kept, added[kept.columns]], ignore_index=True)
+    else:
+        updated = kept.reset_index(drop=True)
+
+    # Las categorías de las partes difieren; concat deja texto y se vuelve a categorizar
+    for column in cube.columns:
+        if isinstance(cube[column].dtype, pd.CategoricalDtype) and not isinstance(updated[column].dtype, pd.CategoricalDtype):
+            updated[column] = updated[column].astype('category')
+        elif updated[column].dtype != cube[column].dtype and not updated[column].isna().any():
+            updated[column] = updated[column].astype(cube[column].dtype)
+    print(f"Cubo actualizado: {len(changed)} particiones leídas, {len(removed)} eliminadas, "
+          f"{len(updated):,} celdas")
+    return updated, len(changed)
+
+
+def store_version():
+    """Hash corto del manifiesto del almacén (None si no existe)"""
+    if not os.path.exists(STORE_MANIFEST_FILE):
+        return None
+    return hashlib.sha1(file_hash(STORE_MANIFEST_FILE).encode('ascii')).hexdigest()[:12]
+
+
+def _parse_years(value):
+    if '-' in value:
+        first, last = value.split('-', 1)
+        return set(range(int(first), int(last) + 1))
+    return {int(year) for year in value.split(',')}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingesta multianual de defunciones no fetales")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help="Filas por bloque de lectura")
+    parser.add_argument('--years', type=_parse_years, default=None, help="Años a ingerir, p. ej. 2015-2023 o 2019,2020")
+    parser.add_argument('--force', action='store_true', help="Reingerir aunque el archivo no haya cambiado")
+    parser.add_argument('--jobs', type=int, default=None, help="Años ingeridos en paralelo (por defecto, los núcleos disponibles)")
+    parser.add_argument('--no-cube', action='store_true', help="No actualizar el cubo compartido al terminar")
+    args = parser.parse_args()
+
+    before = partition_signatures()
+    jobs = args.jobs or excel_workers(len(discover_sources()))
+    result = ingest_all(years=args.years, chunk_rows=args.chunk_rows, force=args.force, jobs=jobs)
+    total = sum(entry['rows'] for entry in result['years'].values())
+    print(f"Almacén {STORE_DIR}: {len(result['years'])} años, {total:,} filas")
+
+    if not args.no_cube and partition_signatures(result) != before:
+        # Solo se releen las particiones que cambiaron (ver update_store_cube)
+        from shared_dataset import ensure_shared_dataset
+        ensure_shared_dataset()
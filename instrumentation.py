@@ -0,0 +1,341 @@
+"""
+Métricas, logs estructurados y perfilado por petición de la aplicación.
+
+instrument(server) agrega a `app.server`:
+
+    /metrics   métricas en formato de texto de Prometheus
+
+y registra por cada petición:
+
+    mortalidad_http_duracion_segundos{ruta, metodo, estado}   histograma
+    mortalidad_http_respuesta_bytes{ruta}                     histograma
+    mortalidad_callback_duracion_segundos{callback}          histograma
+    mortalidad_callback_respuesta_bytes{callback}            histograma
+
+El callback de Dash se identifica por su salida ('grafico-mensual.figure').
+Las funciones create_* de data_processing se miden con @timed_figure en
+mortalidad_figura_duracion_segundos{funcion}; las que arman varias figuras
+de una vez (create_visualizations de app_optimized) se miden aparte con
+@timed_figure_batch en mortalidad_lote_figuras_duracion_segundos{funcion},
+para no mezclar un lote con figuras sueltas. Las exportaciones de
+export_service.py quedan en mortalidad_exportacion_duracion_segundos{objetivo,
+formato} y mortalidad_exportacion_bytes{formato}. Cada aplicación puede
+registrar colectores adicionales (p. ej. los aciertos de la caché de
+figuras) con add_collector.
+
+Cada petición también se escribe como una línea JSON en el logger
+'mortalidad.peticiones' (REQUEST_LOG=0 lo desactiva).
+
+Con PROFILING=1, una petición con el encabezado `X-Perfil: 1` o el parámetro
+`?perfil=1` se perfila con un muestreador de pilas: el resultado, en formato
+de pilas colapsadas (compatible con flamegraph.pl y speedscope), queda en
+Data/cache/perfiles/ y su nombre en el encabezado `X-Perfil` de la respuesta.
+
+Las métricas son de cada proceso: con varios workers de gunicorn cada uno
+responde /metrics con lo suyo (identificado por mortalidad_proceso_info).
+"""
+import bisect
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+METRICS_PREFIX = 'mortalidad_'
+PROFILE_DIR = os.path.join('Data', 'cache', 'perfiles')
+PROFILE_INTERVAL = 0.001
+
+DASH_CALLBACK_ROUTE = '/_dash-update-component'
+
+logger = logging.getLogger('mortalidad.peticiones')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """Histograma acumulado por combinación de etiquetas"""
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = METRICS_PREFIX + name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+            for label_values, (counts, total, count) in series:
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    labels = _format_labels(self.labels, label_values, [('le', le)])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Histogramas y colectores que se exponen en /metrics"""
+
+    def __init__(self):
+        self.histograms = []
+        self.collectors = []
+
+    def histogram(self, *args, **kwargs):
+        histogram = Histogram(*args, **kwargs)
+        self.histograms.append(histogram)
+        return histogram
+
+    def add_collector(self, collector):
+        """`collector()` retorna tuplas (nombre, tipo, descripción, {etiquetas: valor})"""
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = [
+            f"# HELP {METRICS_PREFIX}proceso_info Proceso que responde estas métricas",
+            f"# TYPE {METRICS_PREFIX}proceso_info gauge",
+            f'{METRICS_PREFIX}proceso_info{{pid="{os.getpid()}"}} 1'
+        ]
+        for histogram in self.histograms:
+            lines.extend(histogram.render())
+        for collector in self.collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                logger.warning("Colector de métricas falló: %s", e)
+                continue
+            for name, kind, description, values in samples:
+                name = METRICS_PREFIX + name
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in values.items():
+                    lines.append(f"{name}{_format_labels([k for k, _ in labels], [v for _, v in labels])} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.histogram(
+    'http_duracion_segundos', "Duración de las peticiones HTTP", ('ruta', 'metodo', 'estado'))
+RESPONSE_SIZE = registry.histogram(
+    'http_respuesta_bytes', "Tamaño del cuerpo de las respuestas HTTP", ('ruta',), SIZE_BUCKETS)
+CALLBACK_DURATION = registry.histogram(
+    'callback_duracion_segundos', "Duración de los callbacks de Dash", ('callback',))
+CALLBACK_SIZE = registry.histogram(
+    'callback_respuesta_bytes', "Tamaño de la respuesta de los callbacks de Dash", ('callback',), SIZE_BUCKETS)
+FIGURE_DURATION = registry.histogram(
+    'figura_duracion_segundos', "Tiempo de construcción de cada figura create_*", ('funcion',))
+FIGURE_BATCH_DURATION = registry.histogram(
+    'lote_figuras_duracion_segundos', "Tiempo de construcción de un lote de figuras", ('funcion',))
+EXPORT_DURATION = registry.histogram(
+    'exportacion_duracion_segundos', "Tiempo de generación de las exportaciones", ('objetivo', 'formato'))
+EXPORT_SIZE = registry.histogram(
+    'exportacion_bytes', "Tamaño de los archivos exportados", ('formato',), SIZE_BUCKETS)
+
+
+def add_collector(collector):
+    registry.add_collector(collector)
+
+
+def request_log_enabled():
+    return os.environ.get('REQUEST_LOG', '1') != '0'
+
+
+def profiling_enabled():
+    return os.environ.get('PROFILING') == '1'
+
+
+def log_event(event, **fields):
+    """Línea JSON en el logger de peticiones"""
+    if request_log_enabled():
+        logger.info(json.dumps({'evento': event, **fields}, ensure_ascii=False, default=str))
+
+
+def _timed(function, histogram, event):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            histogram.observe(elapsed, function.__name__)
+            log_event(event, funcion=function.__name__, duracion_ms=round(elapsed * 1000, 2))
+
+    return wrapper
+
+
+def timed_figure(function):
+    """Decorador: registra el tiempo de construcción de una figura create_*"""
+    return _timed(function, FIGURE_DURATION, 'figura')
+
+
+def timed_figure_batch(function):
+    """Decorador: registra el tiempo de una función que arma varias figuras de una vez"""
+    return _timed(function, FIGURE_BATCH_DURATION, 'lote_figuras')
+
+
+class SamplingProfiler:
+    """Muestrea la pila de un hilo cada `interval` segundos.
+
+    Cuenta pilas colapsadas ('modulo:funcion;modulo:funcion ...') como las
+    que consumen flamegraph.pl y speedscope.
+    """
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='perfilador', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def collapsed(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + '\n'
+
+    def save(self, name):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.collapsed())
+        return path
+
+
+def _wants_profile(request):
+    return profiling_enabled() and (
+        request.headers.get('X-Perfil') == '1' or request.args.get('perfil') == '1'
+    )
+
+
+def instrument(server):
+    """Registra las métricas por petición, /metrics y el perfilado en el servidor Flask"""
+    from flask import Response, g, request
+
+    @server.before_request
+    def start_timer():
+        g.instrumentation_start = time.perf_counter()
+        g.instrumentation_callback = None
+        if request.path == DASH_CALLBACK_ROUTE:
+            body = request.get_json(silent=True) or {}
+            g.instrumentation_callback = body.get('output')
+        if _wants_profile(request):
+            g.instrumentation_profiler = SamplingProfiler().start()
+
+    @server.after_request
+    def record_request(response):
+        start = g.pop('instrumentation_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule is not None else 'sin_ruta'
+        size = None if response.direct_passthrough else response.calculate_content_length()
+
+        REQUEST_DURATION.observe(elapsed, route, request.method, response.status_code)
+        if size is not None:
+            RESPONSE_SIZE.observe(size, route)
+        callback = g.pop('instrumentation_callback', None)
+        if callback:
+            CALLBACK_DURATION.observe(elapsed, callback)
+            if size is not None:
+                CALLBACK_SIZE.observe(size, callback)
+
+        profile_path = None
+        profiler = g.pop('instrumentation_profiler', None)
+        if profiler is not None:
+            profiler.stop()
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{(callback or route).strip('/').replace('/', '_')[:60] or 'raiz'}.txt"
+            profile_path = profiler.save(name)
+            response.headers['X-Perfil'] = os.path.basename(profile_path)
+
+        log_event(
+            'peticion', ruta=route, metodo=request.method, estado=response.status_code,
+            duracion_ms=round(elapsed * 1000, 2), bytes=size, callback=callback, perfil=profile_path
+        )
+        return response
+
+    @server.route('/metrics')
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    if request_log_enabled() and not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    return server
+
+
+def figure_cache_collector(get_cache):
+    """Colector de aciertos y ocupación de una FigureCache (None si aún no existe)"""
+
+    def collect():
+        cache = get_cache()
+        if cache is None:
+            return []
+        stats = cache.stats()
+        return [
+            ('cache_figuras_consultas_total', 'counter', "Consultas a la caché de figuras por resultado", {
+                (('resultado', 'acierto_memoria'),): stats['hits'],
+                (('resultado', 'acierto_disco'),): stats['disk_hits'],
+                (('resultado', 'fallo'),): stats['misses']
+            }),
+            ('cache_figuras_tasa_aciertos', 'gauge', "Fracción de consultas servidas desde la caché", {(): stats['hit_rate']}),
+            ('cache_figuras_bytes', 'gauge', "Bytes ocupados en memoria por la caché de figuras", {(): stats['bytes']}),
+            ('cache_figuras_entradas', 'gauge', "Figuras guardadas en memoria", {(): stats['entries']}),
+            ('cache_figuras_descartes_total', 'counter', "Entradas descartadas por límite de tamaño", {(): stats['evictions']})
+        ]
+
+    return collect
@@ -0,0 +1,140 @@
+"""
+Motor de consultas indexado sobre el cubo de conteos de mortalidad.
+
+Para cada dimensión filtrable se precalcula un arreglo ordenado de posiciones
+de fila por valor (un índice invertido). Un filtro se resuelve uniendo las
+listas de posiciones de los valores elegidos y cruzando las dimensiones con
+intersecciones de arreglos ordenados, sin recorrer el cubo completo con
+máscaras booleanas. El resultado es un subconjunto del cubo que las
+funciones create_* de data_processing consumen directamente.
+"""
+import numpy as np
+import pandas as pd
+
+from data_processing import YEAR_COLUMN
+from icd10 import load_icd10_index
+
+# Filtro -> descripción; las claves son las que reciben las consultas
+FILTERS = {
+    'anio': 'Año de la defunción (solo con el almacén multianual de ingest.py)',
+    'departamento': 'Código de departamento (COD_DEPARTAMENTO)',
+    'municipio': 'Código DANE del municipio (departamento * 1000 + municipio)',
+    'mes': 'Mes de la defunción (1-12)',
+    'sexo': 'Sexo (1, 2, 3)',
+    'grupo_edad': 'Código GRUPO_EDAD1 (0-29)',
+    'capitulo': 'Capítulo CIE-10 (1-22)'
+}
+
+
+def _category_codes(series):
+    """Códigos enteros y categorías de una columna, sin copiar si ya es categórica"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.cat.categories
+    codes, categories = pd.factorize(series)
+    return codes, pd.Index(categories)
+
+
+def cause_chapters(cause_codes, death_codes):
+    """Capítulo CIE-10 de cada código de causa (NaN si no está en el catálogo)
+
+    Se busca primero por código de cuatro caracteres y luego por los tres
+    primeros caracteres (ver icd10.ICD10Index).
+    """
+    cause_codes = pd.Series(cause_codes, dtype=object)
+    if death_codes is None or death_codes.empty:
+        return pd.Series(np.nan, index=cause_codes.index)
+    return load_icd10_index(death_codes).chapter(cause_codes)
+
+
+class MortalityQueryEngine:
+    """Índices invertidos por dimensión sobre un cubo de conteos"""
+
+    def __init__(self, cube, death_codes=None):
+        self.cube = cube
+        self.counts = cube['TOTAL_MUERTES'].to_numpy()
+        self._indexes = {'anio': {}}
+
+        if YEAR_COLUMN in cube.columns:
+            self._add_index('anio', cube[YEAR_COLUMN].to_numpy())
+        dept = cube['COD_DEPARTAMENTO'].to_numpy()
+        mun = cube['COD_MUNICIPIO'].to_numpy()
+        self._add_index('departamento', dept)
+        self._add_index('municipio', dept.astype('int64') * 1000 + mun)
+        self._add_index('mes', cube['MES'].to_numpy())
+        self._add_index('sexo', cube['SEXO'].to_numpy())
+        self._add_index('grupo_edad', cube['GRUPO_EDAD1'].to_numpy())
+
+        # El capítulo se resuelve una vez por código distinto, no por fila
+        cause_codes, causes = _category_codes(cube['COD_MUERTE'])
+        chapter_by_cause = cause_chapters(causes, death_codes).to_numpy(dtype='float64')
+        row_chapters = np.append(chapter_by_cause, np.nan)[cause_codes]
+        self._add_index('capitulo', row_chapters)
+
+    def _add_index(self, name, keys):
+        """Ordena las posiciones por clave y guarda el rango de cada valor"""
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        valid = ~pd.isna(sorted_keys)
+        values, starts = np.unique(sorted_keys[valid], return_index=True)
+        ends = np.append(starts[1:], valid.sum())
+        # Con orden estable las posiciones de cada valor quedan ordenadas
+        self._indexes[name] = {
+            value.item(): order[start:end]
+            for value, start, end in zip(values, starts, ends)
+        }
+
+    def values(self, name):
+        """Valores presentes en el cubo para una dimensión"""
+        return sorted(self._indexes[name])
+
+    def _positions_for(self, name, selected):
+        index = self._indexes[name]
+        parts = [index[value] for value in set(selected) if value in index]
+        if not parts:
+            return np.empty(0, dtype=np.intp)
+        if len(parts) == 1:
+            return parts[0]
+        # Los valores de una dimensión son disjuntos, basta ordenar la unión
+        return np.sort(np.concatenate(parts))
+
+    def row_positions(self, filters):
+        """Posiciones de fila del cubo que cumplen todos los filtros.
+
+        `filters` es un dict {filtro: valor o lista de valores}; los filtros
+        vacíos o None se ignoran. Retorna None si no hay filtros activos.
+        """
+        candidates = []
+        for name, selected in (filters or {}).items():
+            if name not in FILTERS:
+                raise ValueError(f"Filtro desconocido: {name}")
+            if selected is None or selected == []:
+                continue
+            if not isinstance(selected, (list, tuple, set)):
+                selected = [selected]
+            candidates.append(self._positions_for(name, selected))
+
+        if not candidates:
+            return None
+
+        # Se intersecta empezando por la lista más corta
+        candidates.sort(key=len)
+        positions = candidates[0]
+        for other in candidates[1:]:
+            if len(positions) == 0:
+                break
+            positions = np.intersect1d(positions, other, assume_unique=True)
+        return positions
+
+    def filtered_cube(self, filters):
+        """Subconjunto del cubo para los filtros dados"""
+        positions = self.row_positions(filters)
+        if positions is None:
+            return self.cube
+        return self.cube.iloc[positions]
+
+    def count(self, filters):
+        """Total de defunciones que cumplen los filtros"""
+        positions = self.row_positions(filters)
+        if positions is None:
+            return int(self.counts.sum())
+        return int(self.counts[positions].sum())
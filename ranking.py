@@ -0,0 +1,105 @@
+"""
+Rankings top-K de municipios, departamentos y causas sobre el cubo de conteos.
+
+Reemplaza el patrón groupby(...).sum().sort_values().head(k) de las
+funciones create_*: los totales por grupo salen de un np.bincount sobre los
+códigos de la columna (categórica o factorizada) y los K primeros se eligen
+con np.argpartition, en O(n) sobre los grupos, ordenando solo los K
+elegidos. El costo no crece con el orden completo de miles de causas cada
+vez que un filtro o un rango de años cambia el subconjunto.
+
+Los empates en el puesto K se resuelven según `ties`:
+
+    'orden'  exactamente K filas; entre empatados gana el primero en el
+             orden de la columna (determinista)
+    'todos'  se incluyen todos los grupos empatados con el puesto K
+
+Los callbacks pasan K y el modo de empates a las funciones create_* (ver
+ranking_options en app.py).
+"""
+import numpy as np
+import pandas as pd
+
+TIE_MODES = ('orden', 'todos')
+DEFAULT_TIES = 'orden'
+
+
+def group_codes(column):
+    """Códigos enteros (-1 para nulos) y etiquetas de una columna del cubo"""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy(), column.cat.categories
+    return pd.factorize(column)
+
+
+def group_totals(column, weights, mask=None):
+    """Etiquetas y total de `weights` por grupo de `column` (solo celdas con `mask`)"""
+    codes, labels = group_codes(column)
+    weights = np.asarray(weights)
+    # Se filtra antes de convertir tipos: los subconjuntos suelen ser pequeños
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+        codes, weights = codes[mask], weights[mask]
+    if codes.size and codes.min() < 0:
+        valid = codes >= 0
+        codes, weights = codes[valid], weights[valid]
+    totals = np.bincount(codes.astype(np.intp, copy=False), weights=weights.astype('float64', copy=False),
+                         minlength=len(labels))
+    return labels, totals
+
+
+def top_k_indices(values, k, largest=True, ties=DEFAULT_TIES, eligible=None):
+    """Posiciones de los K mayores (o menores) valores, ordenadas.
+
+    Solo se consideran las posiciones con `eligible` verdadero. Con
+    `ties='orden'` el desempate es por posición; con 'todos' se agregan
+    los empatados con el puesto K.
+    """
+    if ties not in TIE_MODES:
+        raise ValueError(f"Modo de empates desconocido: {ties!r} (use {TIE_MODES})")
+    values = np.asarray(values)
+    candidates = np.arange(len(values)) if eligible is None else np.flatnonzero(eligible)
+    if k <= 0 or len(candidates) == 0:
+        return candidates[:0]
+
+    keys = values[candidates]
+    # Se selecciona siempre por "menor clave": los mayores se niegan
+    keys = -keys if largest else keys
+    if k < len(candidates):
+        threshold = keys[np.argpartition(keys, k - 1)[k - 1]]
+        better = np.flatnonzero(keys < threshold)
+        tied = np.flatnonzero(keys == threshold)
+        if ties == 'orden':
+            tied = tied[:k - len(better)]
+        selected = np.concatenate([better, tied])
+    else:
+        selected = np.arange(len(candidates))
+
+    # Orden final solo de los elegidos: por valor y luego por posición
+    selected = selected[np.lexsort((candidates[selected], keys[selected]))]
+    return candidates[selected]
+
+
+def rank_groups(cube, by, k, largest=True, ties=DEFAULT_TIES, value='TOTAL_MUERTES', mask=None,
+                min_total=None, name=None):
+    """DataFrame [by, name] con los K grupos de `by` de mayor (o menor) total.
+
+    `mask` restringe las celdas del cubo (p. ej. solo homicidios) sin
+    copiarlo; `min_total` excluye los grupos con menos de ese total. Como
+    toda celda del cubo tiene al menos una defunción, los grupos con total
+    cero son los ausentes del subconjunto y no entran (como observed=True).
+    """
+    labels, totals = group_totals(cube[by], cube[value], mask)
+    eligible = totals > 0
+    if min_total is not None:
+        eligible &= totals >= min_total
+    positions = top_k_indices(totals, k, largest, ties, eligible)
+    return pd.DataFrame({
+        by: np.asarray(labels, dtype=object)[positions],
+        name or value: totals[positions].astype('int64')
+    })
+
+
+def top_k_rows(frame, column, k, largest=True, ties=DEFAULT_TIES, eligible=None):
+    """Las K filas de `frame` con mayor (o menor) `column`, en orden"""
+    positions = top_k_indices(frame[column].to_numpy(), k, largest, ties, eligible)
+    return frame.iloc[positions].reset_index(drop=True)
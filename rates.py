@@ -0,0 +1,318 @@
+"""
+Tasas de mortalidad crudas y ajustadas por edad sobre el cubo de conteos.
+
+Los conteos absolutos favorecen a los municipios pequeños: siempre parecen
+"seguros". Con una tabla local de población por municipio, sexo y edad
+(proyecciones del DANE) este módulo calcula, para cualquier subconjunto
+filtrado del cubo:
+
+  * tasa cruda por 100.000 habitantes-año, con intervalo de Poisson
+    (aproximación de Byar);
+  * tasa ajustada por edad (método directo, población estándar OMS
+    2000-2025), con intervalo de Dobson.
+
+La tabla se busca en Data/poblacion.csv o Data/poblacion.xlsx con columnas
+
+    COD_DEPARTAMENTO, COD_MUNICIPIO, SEXO (1/2), EDAD, POBLACION [, AÑO]
+
+EDAD es la edad simple o el límite inferior del grupo quinquenal; todo se
+lleva a grupos de cinco años con 80 y más como último. Sin columna AÑO la
+población se usa para cada año del cubo.
+
+La población se guarda en un arreglo denso [año, municipio, sexo, grupo] y
+los conteos del cubo se acumulan con np.bincount, así que recalcular las
+tasas para otros filtros cuesta una pasada vectorizada sobre el cubo:
+
+    python rates.py [--por departamento]
+"""
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_cache import POPULATION_FILES, read_excel_cached
+from data_processing import DEFAULT_PERIOD, YEAR_COLUMN
+from ranking import DEFAULT_TIES, top_k_rows
+
+# Grupos quinquenales 0-4, 5-9, ..., 75-79 y 80 y más
+AGE_BANDS = [f"{5 * band}-{5 * band + 4}" for band in range(16)] + ['80+']
+N_BANDS = len(AGE_BANDS)
+
+# Grupo quinquenal de cada código GRUPO_EDAD1 del DANE (-1: edad desconocida).
+# 0-8 son menores de 5 años (horas, días, meses, 1 año, 2-4 años), 9-23 son
+# quinquenios de 5-9 a 75-79 y 24-28 son 80 años y más.
+AGE_CODE_BANDS = np.array([0] * 9 + list(range(1, 16)) + [16] * 5 + [-1], dtype='int64')
+
+# Población estándar mundial OMS 2000-2025 por 100.000 (80+ suma 80-84 ... 100+)
+WHO_STANDARD = np.array([
+    8860, 8690, 8600, 8470, 8220, 7930, 7610, 7150, 6590, 6040, 5370, 4550, 3720, 2960, 2210, 1520, 1545
+], dtype='float64')
+
+POPULATION_SEXES = (1, 2)
+PER = 100_000
+Z_95 = 1.959963984540054
+
+# Mínimo de defunciones para publicar una tasa (criterio del NCHS: con menos
+# de 20 el error estándar relativo supera el 23 %)
+MIN_RATE_DEATHS = 20
+
+POPULATION_ALIASES = {
+    'ANO': 'AÑO',
+    'ANIO': 'AÑO',
+    'COD_DPTO': 'COD_DEPARTAMENTO',
+    'COD_MPIO': 'COD_MUNICIPIO',
+    'EDAD_INICIO': 'EDAD',
+    'GRUPO_EDAD': 'EDAD',
+    'TOTAL': 'POBLACION',
+    'POBLACIÓN': 'POBLACION'
+}
+POPULATION_COLUMNS = ['COD_DEPARTAMENTO', 'COD_MUNICIPIO', 'SEXO', 'EDAD', 'POBLACION']
+
+# Códigos DANE de municipio (departamento * 1000 + municipio) caben en 5 dígitos
+_MAX_PLACE_CODE = 100_000
+
+_loaded_engine = None
+_load_lock = threading.Lock()
+
+
+def population_file():
+    """Primer archivo de población presente en Data/, o None"""
+    for path in POPULATION_FILES:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def read_population(path):
+    """Tabla de población normalizada (columnas POPULATION_COLUMNS y AÑO si existe)"""
+    if path.endswith('.csv'):
+        population = pd.read_csv(path)
+    else:
+        population = read_excel_cached(path)
+
+    population = population.rename(columns={
+        column: POPULATION_ALIASES.get(str(column).strip().upper(), str(column).strip().upper())
+        for column in population.columns
+    })
+    missing = [column for column in POPULATION_COLUMNS if column not in population.columns]
+    if missing:
+        raise ValueError(f"Columnas faltantes en {path}: {missing}")
+
+    columns = POPULATION_COLUMNS + ([YEAR_COLUMN] if YEAR_COLUMN in population.columns else [])
+    population = population[columns].apply(pd.to_numeric, errors='coerce').dropna()
+    return population[population['SEXO'].isin(POPULATION_SEXES)]
+
+
+def age_code_bands(codes):
+    """Grupo quinquenal de cada código GRUPO_EDAD1; -1 si falta o no es un código conocido"""
+    codes = pd.to_numeric(pd.Series(codes), errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    known = (codes >= 0) & (codes < len(AGE_CODE_BANDS))
+    bands = np.full(len(codes), -1, dtype='int64')
+    bands[known] = AGE_CODE_BANDS[codes[known].astype('int64')]
+    return bands
+
+
+def _selected(filters, name):
+    """Valores elegidos de un filtro como lista; None si no se filtra por él"""
+    values = (filters or {}).get(name)
+    if values is None or values == []:
+        return None
+    return list(values) if isinstance(values, (list, tuple, set)) else [values]
+
+
+def _poisson_limits(counts, z=Z_95):
+    """Límites del intervalo de Poisson para `counts` (aproximación de Byar)"""
+    counts = np.asarray(counts, dtype='float64')
+    upper_base = counts + 1
+    upper = upper_base * (1 - 1 / (9 * upper_base) + z / (3 * np.sqrt(upper_base))) ** 3
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lower = counts * (1 - 1 / (9 * counts) - z / (3 * np.sqrt(counts))) ** 3
+    return np.where(counts > 0, lower, 0.0), upper
+
+
+class RatesEngine:
+    """Población densa por [año, municipio, sexo, grupo quinquenal] y cálculo de tasas"""
+
+    def __init__(self, population):
+        codes = (population['COD_DEPARTAMENTO'].astype('int64') * 1000
+                 + population['COD_MUNICIPIO'].astype('int64')).to_numpy()
+        self.place_codes = np.unique(codes)
+        self.place_lookup = np.full(_MAX_PLACE_CODE, -1, dtype='int64')
+        self.place_lookup[self.place_codes] = np.arange(len(self.place_codes))
+        self.place_departments = self.place_codes // 1000
+        self.department_codes, self.place_department_index = np.unique(self.place_departments, return_inverse=True)
+
+        if YEAR_COLUMN in population.columns:
+            self.years = np.unique(population[YEAR_COLUMN].astype('int64').to_numpy())
+            year_index = np.searchsorted(self.years, population[YEAR_COLUMN].astype('int64').to_numpy())
+        else:
+            self.years = None
+            year_index = np.zeros(len(population), dtype='int64')
+
+        bands = np.minimum(population['EDAD'].astype('int64').to_numpy() // 5, N_BANDS - 1)
+        sexes = population['SEXO'].astype('int64').to_numpy() - 1
+        places = self.place_lookup[codes]
+
+        shape = (1 if self.years is None else len(self.years), len(self.place_codes), len(POPULATION_SEXES), N_BANDS)
+        flat = np.ravel_multi_index((year_index, places, sexes, bands), shape)
+        self.population = np.bincount(
+            flat, weights=population['POBLACION'].to_numpy(dtype='float64'), minlength=int(np.prod(shape))
+        ).reshape(shape)
+
+    def _year_weights(self, years):
+        """Cuántas veces entra cada año de la tabla en los habitantes-año de los años `years`"""
+        requested = np.unique(np.asarray(years, dtype='int64'))
+        if self.years is None:
+            return np.array([float(max(len(requested), 1))])
+        # Años sin proyección: se usa el más cercano disponible
+        nearest = np.abs(self.years[None, :] - requested[:, None]).argmin(axis=1)
+        return np.bincount(nearest, minlength=len(self.years)).astype('float64')
+
+    def person_years(self, filters=None, years=None):
+        """Habitantes-año [municipio, grupo] de los años, sexos, edades y meses elegidos.
+
+        La población en riesgo sale de los filtros (los de query_engine.FILTERS),
+        no de las defunciones del subconjunto: un grupo de edad sin muertes
+        sigue en el denominador y su tasa es cero. Sin filtro de año se usan
+        `years`, los años de los datos; sin filtro de sexo o edad, todos.
+        """
+        sexes = _selected(filters, 'sexo') or POPULATION_SEXES
+        age_codes = _selected(filters, 'grupo_edad') or range(len(AGE_CODE_BANDS))
+        years = _selected(filters, 'anio') or years or [int(DEFAULT_PERIOD)]
+        months = _selected(filters, 'mes')
+
+        sex_mask = np.isin(np.array(POPULATION_SEXES), np.asarray(sexes, dtype='int64'))
+        bands = age_code_bands(age_codes)
+        band_mask = np.zeros(N_BANDS, dtype=bool)
+        band_mask[bands[bands >= 0]] = True
+
+        population = np.tensordot(self._year_weights(years), self.population, axes=(0, 0))
+        person_years = population[:, sex_mask, :].sum(axis=1) * band_mask
+        if months:
+            # Con filtro de mes solo está en riesgo la fracción del año elegida
+            person_years = person_years * (len(set(months)) / 12)
+        return person_years, band_mask
+
+    def rates(self, cube, by='municipio', filters=None, years=None, z=Z_95):
+        """Defunciones, habitantes-año y tasas (por 100.000) por municipio o departamento.
+
+        `cube` es el subconjunto ya filtrado con `filters`, que definen la
+        población en riesgo (ver person_years); `years` son los años de los
+        datos, por defecto los presentes en el cubo. Las defunciones de
+        municipios ausentes de la tabla de población no entran; las de edad
+        desconocida solo cuentan en la tasa cruda.
+        """
+        if years is None and YEAR_COLUMN in cube.columns:
+            years = cube[YEAR_COLUMN].dropna().astype('int64').unique().tolist()
+        person_years, band_mask = self.person_years(filters, years)
+        codes = (cube['COD_DEPARTAMENTO'].to_numpy(dtype='int64') * 1000
+                 + cube['COD_MUNICIPIO'].to_numpy(dtype='int64'))
+        places = self.place_lookup[np.clip(codes, 0, _MAX_PLACE_CODE - 1)]
+        bands = age_code_bands(cube['GRUPO_EDAD1'])
+        deaths = cube['TOTAL_MUERTES'].to_numpy(dtype='float64')
+
+        if by == 'departamento':
+            groups = np.append(self.place_department_index, -1)[places]
+            n_groups = len(self.department_codes)
+            person_years = np.stack([
+                np.bincount(self.place_department_index, weights=person_years[:, band], minlength=n_groups)
+                for band in range(N_BANDS)
+            ], axis=1)
+        else:
+            groups = places
+            n_groups = len(self.place_codes)
+
+        known = groups >= 0
+        total_deaths = np.bincount(groups[known], weights=deaths[known], minlength=n_groups)
+        aged = known & (bands >= 0)
+        band_deaths = np.bincount(
+            groups[aged] * N_BANDS + bands[aged], weights=deaths[aged], minlength=n_groups * N_BANDS
+        ).reshape(n_groups, N_BANDS)
+
+        total_population = person_years.sum(axis=1)
+        weights = np.where(band_mask, WHO_STANDARD, 0.0)
+        weights = weights / weights.sum() if weights.sum() > 0 else weights
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crude = total_deaths / total_population
+            crude_lower, crude_upper = _poisson_limits(total_deaths, z)
+            crude_lower, crude_upper = crude_lower / total_population, crude_upper / total_population
+
+            band_rates = np.where(person_years > 0, band_deaths / person_years, 0.0)
+            adjusted = band_rates @ weights
+            variance = np.where(person_years > 0, band_deaths / person_years ** 2, 0.0) @ (weights ** 2)
+            # Dobson et al. (1991): el intervalo de Poisson del total escalado a la tasa ajustada
+            standardized_deaths = band_deaths.sum(axis=1)
+            lower, upper = _poisson_limits(standardized_deaths, z)
+            scale = np.sqrt(variance / standardized_deaths)
+            adjusted_lower = adjusted + scale * (lower - standardized_deaths)
+            adjusted_upper = adjusted + scale * (upper - standardized_deaths)
+
+        result = pd.DataFrame({
+            'MUERTES': total_deaths.astype('int64'),
+            'HABITANTES_ANIO': total_population,
+            'TASA_CRUDA': crude * PER,
+            'TASA_CRUDA_INF': crude_lower * PER,
+            'TASA_CRUDA_SUP': crude_upper * PER,
+            'TASA_AJUSTADA': adjusted * PER,
+            'TASA_AJUSTADA_INF': np.maximum(adjusted_lower, 0.0) * PER,
+            'TASA_AJUSTADA_SUP': adjusted_upper * PER
+        })
+        if by == 'departamento':
+            result.insert(0, 'COD_DEPARTAMENTO', self.department_codes)
+        else:
+            result.insert(0, 'COD_DEPARTAMENTO', self.place_departments)
+            result.insert(1, 'COD_MUNICIPIO', self.place_codes % 1000)
+        return result[total_population > 0].reset_index(drop=True)
+
+
+def lowest_rates(cube, engine, n=10, min_deaths=MIN_RATE_DEATHS, ties=DEFAULT_TIES, filters=None, years=None):
+    """Los `n` municipios con menor tasa ajustada entre los que tienen al menos `min_deaths` defunciones"""
+    rates = engine.rates(cube, filters=filters, years=years)
+    rates = top_k_rows(rates, 'TASA_AJUSTADA', n, largest=False, ties=ties, eligible=(rates['MUERTES'] >= min_deaths).to_numpy())
+    names = cube[['COD_DEPARTAMENTO', 'COD_MUNICIPIO', 'DEPARTAMENTO', 'MUNICIPIO']].drop_duplicates(
+        ['COD_DEPARTAMENTO', 'COD_MUNICIPIO'])
+    names = names.astype({'COD_DEPARTAMENTO': 'int64', 'COD_MUNICIPIO': 'int64',
+                          'DEPARTAMENTO': object, 'MUNICIPIO': object})
+    return rates.merge(names, on=['COD_DEPARTAMENTO', 'COD_MUNICIPIO'], how='left')
+
+
+def load_rates_engine():
+    """Motor de tasas del proceso; None si no hay tabla de población en Data/"""
+    global _loaded_engine
+    if _loaded_engine is not None:
+        return _loaded_engine
+
+    with _load_lock:
+        if _loaded_engine is not None:
+            return _loaded_engine
+        path = population_file()
+        if path is None:
+            return None
+        try:
+            _loaded_engine = RatesEngine(read_population(path))
+        except Exception as e:
+            print(f"Tabla de población inválida ({path}): {e}")
+            return None
+        return _loaded_engine
+
+
+if __name__ == "__main__":
+    from shared_dataset import load_shared_cube
+
+    parser = argparse.ArgumentParser(description="Tasas crudas y ajustadas por edad por municipio o departamento")
+    parser.add_argument('--por', choices=['municipio', 'departamento'], default='municipio')
+    args = parser.parse_args()
+
+    engine = load_rates_engine()
+    if engine is None:
+        raise SystemExit(f"No se encontró la tabla de población ({', '.join(POPULATION_FILES)})")
+    mortality_cube = load_shared_cube()[0]
+
+    start = time.perf_counter()
+    table = engine.rates(mortality_cube, by=args.por)
+    print(f"Tasas de {len(table):,} unidades en {1000 * (time.perf_counter() - start):.1f} ms")
+    print(table.sort_values('TASA_AJUSTADA').to_string(index=False, max_rows=40))
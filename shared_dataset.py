@@ -0,0 +1,222 @@
+"""
+Dataset procesado compartido entre workers de gunicorn mediante memory-map.
+
+El DataFrame compacto de registros y el cubo de conteos se guardan como un
+archivo NumPy .npy por columna (los categóricos como códigos + categorías en
+meta.json) dentro de Data/cache/shared/<versión de datos>/. Cada worker los
+abre con np.load(mmap_mode='r'): las páginas viven en la caché del sistema
+operativo y N workers comparten una sola copia física.
+
+gunicorn.conf.py construye el almacén en el proceso maestro antes de crear
+los workers; ver ensure_shared_dataset.
+
+Si existe el almacén multianual de ingest.py, el cubo (con la dimensión AÑO)
+se arma desde sus particiones y no se guardan registros. Junto al cubo se
+guardan las firmas de las particiones usadas; cuando llega una corrección,
+el cubo nuevo se obtiene del anterior releyendo solo las particiones que
+cambiaron (ingest.update_store_cube).
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from data_cache import (
+    CACHE_DIR,
+    DEATH_CODES_FILE,
+    DEATH_CODES_READ_KWARGS,
+    DIVIPOLA_FILE,
+    data_version,
+    read_excel_cached,
+    source_hash
+)
+from data_processing import load_and_process_data, build_mortality_cube
+from ingest import build_store_cube, partition_signatures, store_years, update_store_cube
+
+SHARED_DIR = os.path.join(CACHE_DIR, 'shared')
+META_FILE = 'meta.json'
+
+RECORDS_NAME = 'registros'
+CUBE_NAME = 'cubo'
+PARTITIONS_FILE = 'particiones.json'
+
+# Se incrementa cuando cambian las columnas del almacén (2: FAMILIA_CAUSA, 3: AÑO)
+SHARED_FORMAT = 3
+
+
+def shared_path(version=None):
+    """Directorio del almacén para una versión de datos"""
+    return os.path.join(SHARED_DIR, f"{version or data_version()}-f{SHARED_FORMAT}")
+
+
+def write_frame(df, directory):
+    """Guarda un DataFrame como un archivo .npy por columna.
+
+    Las columnas de texto se convierten a categóricas para que todas queden
+    como arreglos de tamaño fijo que se pueden mapear en memoria.
+    """
+    os.makedirs(directory, exist_ok=True)
+    meta = {'rows': int(len(df)), 'columns': []}
+
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        if series.dtype == object:
+            series = series.astype('category')
+
+        file_name = f"{i:03d}.npy"
+        column_meta = {'name': col, 'file': file_name}
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(directory, file_name), series.cat.codes.to_numpy())
+            column_meta['categories'] = series.cat.categories.tolist()
+        else:
+            np.save(os.path.join(directory, file_name), series.to_numpy())
+        meta['columns'].append(column_meta)
+
+    with open(os.path.join(directory, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, default=str)
+
+
+def map_frame(directory):
+    """Abre un DataFrame guardado con write_frame sin copiar los datos"""
+    with open(os.path.join(directory, META_FILE), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+
+    columns = {}
+    for column_meta in meta['columns']:
+        values = np.load(os.path.join(directory, column_meta['file']), mmap_mode='r')
+        if 'categories' in column_meta:
+            values = pd.Categorical.from_codes(values, column_meta['categories'])
+        columns[column_meta['name']] = values
+
+    # copy=False evita que pandas consolide las columnas en un bloque propio
+    return pd.DataFrame(columns, copy=False)
+
+
+def _is_complete(directory):
+    # Los registros solo existen cuando el cubo sale de Anexo1; el cubo se escribe último
+    return os.path.exists(os.path.join(directory, CUBE_NAME, META_FILE))
+
+
+def _read_partitions(directory):
+    """Firmas de partición con que se armó un almacén ({(año, depto): firma} o None).
+
+    Si divipola cambió desde entonces los nombres del cubo ya no sirven y
+    también se retorna None.
+    """
+    try:
+        with open(os.path.join(directory, PARTITIONS_FILE), 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entries.get('divipola') != source_hash(DIVIPOLA_FILE):
+        return None
+    return {(year, department): signature for year, department, signature in entries['particiones']}
+
+
+def _write_partitions(directory, signatures):
+    entries = {
+        'divipola': source_hash(DIVIPOLA_FILE),
+        'particiones': [[year, department, signature] for (year, department), signature in sorted(signatures.items())]
+    }
+    with open(os.path.join(directory, PARTITIONS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(entries, f)
+
+
+def _previous_store_cube(current_directory):
+    """Cubo y firmas de otro almacén completo armado desde el almacén multianual"""
+    if not os.path.isdir(SHARED_DIR):
+        return None, None
+    for name in os.listdir(SHARED_DIR):
+        directory = os.path.join(SHARED_DIR, name)
+        if name.startswith('.') or directory == current_directory or not name.endswith(f"-f{SHARED_FORMAT}"):
+            continue
+        signatures = _read_partitions(directory)
+        if signatures is not None and _is_complete(directory):
+            return map_frame(os.path.join(directory, CUBE_NAME)), signatures
+    return None, None
+
+
+def build_cube_and_records(directory=None):
+    """Cubo de conteos y registros compactos (None si el cubo sale del almacén multianual)"""
+    if store_years():
+        divipola = read_excel_cached(DIVIPOLA_FILE)
+        previous_cube, previous = _previous_store_cube(directory)
+        if previous_cube is not None:
+            cube, _ = update_store_cube(previous_cube, previous, partition_signatures(), divipola)
+            return cube, None
+        return build_store_cube(divipola=divipola), None
+    mortality_data, death_codes, divipola = load_and_process_data(compact=True)
+    return build_mortality_cube(mortality_data, divipola), mortality_data
+
+
+def ensure_shared_dataset(version=None):
+    """Construye el almacén compartido de la versión actual si no existe.
+
+    Se escribe en un directorio temporal y se renombra al final, de modo que
+    otro proceso nunca ve un almacén a medio escribir. Retorna la ruta.
+    """
+    version = version or data_version()
+    directory = shared_path(version)
+    if _is_complete(directory):
+        return directory
+
+    print(f"Construyendo dataset compartido {version}...")
+    mortality_cube, mortality_data = build_cube_and_records(directory)
+
+    os.makedirs(SHARED_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{version}-", dir=SHARED_DIR)
+    try:
+        if mortality_data is not None:
+            write_frame(mortality_data, os.path.join(tmp_dir, RECORDS_NAME))
+        else:
+            _write_partitions(tmp_dir, partition_signatures())
+        write_frame(mortality_cube, os.path.join(tmp_dir, CUBE_NAME))
+        os.rename(tmp_dir, directory)
+    except OSError:
+        # Otro proceso terminó primero; se usa su almacén
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not _is_complete(directory):
+            raise
+
+    _remove_old_versions(os.path.basename(directory))
+    print(f"Dataset compartido listo en {directory}")
+    return directory
+
+
+def _remove_old_versions(current_version):
+    for name in os.listdir(SHARED_DIR):
+        if name != current_version and not name.startswith('.'):
+            shutil.rmtree(os.path.join(SHARED_DIR, name), ignore_errors=True)
+
+
+def load_shared_records(version=None):
+    """Registros compactos mapeados en memoria"""
+    directory = os.path.join(ensure_shared_dataset(version), RECORDS_NAME)
+    if not os.path.exists(os.path.join(directory, META_FILE)):
+        raise FileNotFoundError("El dataset compartido se armó desde el almacén multianual y no tiene registros")
+    return map_frame(directory)
+
+
+def load_shared_cube():
+    """Carga el cubo de conteos compartido junto con códigos de muerte y divipola.
+
+    Si el almacén no se puede escribir (p. ej. sistema de archivos de solo
+    lectura) se construye el cubo en memoria como antes.
+    """
+    try:
+        mortality_cube = map_frame(os.path.join(ensure_shared_dataset(), CUBE_NAME))
+    except OSError as e:
+        print(f"Dataset compartido no disponible ({e}), cargando en memoria")
+        mortality_cube, _ = build_cube_and_records()
+    else:
+        print(f"Cubo compartido mapeado: {len(mortality_cube):,} celdas")
+
+    try:
+        death_codes = read_excel_cached(DEATH_CODES_FILE, **DEATH_CODES_READ_KWARGS)
+    except Exception:
+        death_codes = pd.DataFrame()
+    divipola = read_excel_cached(DIVIPOLA_FILE)
+    return mortality_cube, death_codes, divipola
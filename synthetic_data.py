@@ -0,0 +1,213 @@
+"""
+Generador de registros sintéticos de defunciones con el esquema de Anexo1.
+
+Los valores salen de los catálogos reales: municipios de Divipola y códigos
+CIE-10 de Anexo2, con sesgos parecidos a los de las estadísticas vitales
+(capitales con más defunciones, predominio de causas circulatorias y
+tumores, mayoría de adultos mayores, algo más de hombres). Sirve para
+probar carga y escalamiento sin el archivo real, hasta decenas de millones
+de filas: se genera por bloques y cada bloque se agrega al archivo de salida.
+
+    python synthetic_data.py --rows 1000000 [--year 2019] [--seed 0]
+                             [--formats parquet csv xlsx] [--output Data/sintetico/nofetal2019]
+
+Con `--output Data/defunciones/nofetal2018` el archivo queda donde lo busca
+ingest.py.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_cache import DATA_DIR, DEATH_CODES_FILE, DEATH_CODES_READ_KWARGS, DIVIPOLA_FILE, read_excel_cached
+
+# Columnas en el orden de Anexo1
+COLUMNS = ['COD_DEPARTAMENTO', 'COD_MUNICIPIO', 'AÑO', 'MES', 'SEXO', 'GRUPO_EDAD1', 'COD_MUERTE']
+
+# Filas del Anexo1 real de 2019 (escala 1 del benchmark)
+ANEXO1_ROWS = 244_355
+
+DEFAULT_OUTPUT = os.path.join(DATA_DIR, 'sintetico', 'nofetal2019')
+DEFAULT_BLOCK_ROWS = 1_000_000
+FORMATS = ['parquet', 'csv', 'xlsx']
+
+# Una hoja de Excel admite 1.048.576 filas, incluido el encabezado
+EXCEL_MAX_ROWS = 1_048_575
+
+# Peso relativo de cada capítulo CIE-10 en el total de defunciones
+CHAPTER_WEIGHTS = {
+    1: 3.0, 2: 20.0, 3: 0.5, 4: 5.5, 5: 0.7, 6: 2.5, 7: 0.01, 8: 0.02, 9: 30.0, 10: 10.0, 11: 5.0,
+    12: 0.4, 13: 0.5, 14: 3.0, 15: 0.2, 16: 2.0, 17: 1.0, 18: 2.0, 19: 0.1, 20: 13.0, 21: 0.1, 22: 0.5
+}
+
+# Capítulo de afecciones perinatales: solo edades neonatales e infantiles
+PERINATAL_CHAPTER = 16
+PERINATAL_AGE_CODES = list(range(0, 7))
+
+# Peso de cada grupo de códigos GRUPO_EDAD1, repartido por igual entre sus códigos
+AGE_GROUP_WEIGHTS = [
+    (range(0, 5), 3.0), (range(5, 7), 1.0), (range(7, 9), 0.5), (range(9, 11), 0.5), (range(11, 12), 0.5),
+    (range(12, 14), 3.0), (range(14, 17), 6.0), (range(17, 20), 10.0), (range(20, 25), 35.0),
+    (range(25, 29), 40.0), (range(29, 30), 0.5)
+]
+
+SEX_WEIGHTS = {1: 0.55, 2: 0.449, 3: 0.001}
+
+# Las capitales (código de municipio 1) concentran las defunciones, y las
+# mayores ciudades tienen un peso fijo (Bogotá ronda el 15 % del total)
+CAPITAL_WEIGHT = 40.0
+MAJOR_CITY_WEIGHTS = {11001: 700.0, 5001: 250.0, 76001: 200.0, 8001: 120.0, 13001: 80.0}
+
+# Exponente de la ley de Zipf entre los códigos de un mismo capítulo
+CAUSE_ZIPF_EXPONENT = 1.2
+
+
+def _normalized(weights):
+    weights = np.asarray(weights, dtype='float64')
+    return weights / weights.sum()
+
+
+class SyntheticMortality:
+    """Distribuciones de cada columna, armadas una vez a partir de los catálogos"""
+
+    def __init__(self, divipola=None, death_codes=None, year=2019, seed=0):
+        if divipola is None:
+            divipola = read_excel_cached(DIVIPOLA_FILE)
+        if death_codes is None:
+            death_codes = read_excel_cached(DEATH_CODES_FILE, **DEATH_CODES_READ_KWARGS)
+        self.year = year
+        self.rng = np.random.default_rng(seed)
+
+        # Municipios: capitales con más peso y el resto con un sesgo lognormal
+        municipalities = divipola[['COD_DEPARTAMENTO', 'COD_MUNICIPIO']].dropna().drop_duplicates()
+        self.departments = municipalities['COD_DEPARTAMENTO'].to_numpy(dtype='int64')
+        self.municipalities = municipalities['COD_MUNICIPIO'].to_numpy(dtype='int64')
+        weights = self.rng.lognormal(0.0, 1.0, len(municipalities))
+        weights[self.municipalities == 1] *= CAPITAL_WEIGHT
+        dane_codes = self.departments * 1000 + self.municipalities
+        for code, weight in MAJOR_CITY_WEIGHTS.items():
+            weights[dane_codes == code] = weight
+        self.municipality_p = _normalized(weights)
+
+        # Causas: peso del capítulo repartido según Zipf entre sus códigos
+        catalogue = death_codes.dropna(subset=['CAPITULO', 'CODIGO_4']).drop_duplicates('CODIGO_4')
+        codes = catalogue['CODIGO_4'].astype(str).str.strip().str.upper().to_numpy()
+        chapters = catalogue['CAPITULO'].astype('int64').to_numpy()
+        cause_weights = np.zeros(len(codes))
+        for chapter in np.unique(chapters):
+            positions = np.flatnonzero(chapters == chapter)
+            ranks = self.rng.permutation(len(positions)) + 1
+            zipf = 1.0 / ranks ** CAUSE_ZIPF_EXPONENT
+            cause_weights[positions] = CHAPTER_WEIGHTS.get(int(chapter), 0.1) * zipf / zipf.sum()
+        self.causes = codes
+        self.cause_p = _normalized(cause_weights)
+        self.perinatal = chapters == PERINATAL_CHAPTER
+
+        age_weights = np.zeros(30)
+        for codes_range, weight in AGE_GROUP_WEIGHTS:
+            age_weights[list(codes_range)] = weight / len(codes_range)
+        self.age_p = _normalized(age_weights)
+
+        # Meses: leve estacionalidad alrededor de un reparto uniforme
+        months = np.arange(1, 13)
+        self.month_p = _normalized(1.0 + 0.05 * np.cos(2 * np.pi * (months - 1) / 12))
+
+    def block(self, rows):
+        """Un bloque de `rows` registros"""
+        rng = self.rng
+        place = rng.choice(len(self.municipalities), size=rows, p=self.municipality_p)
+        cause = rng.choice(len(self.causes), size=rows, p=self.cause_p)
+        ages = rng.choice(30, size=rows, p=self.age_p)
+        perinatal = self.perinatal[cause]
+        ages[perinatal] = rng.choice(PERINATAL_AGE_CODES, size=int(perinatal.sum()))
+
+        return pd.DataFrame({
+            'COD_DEPARTAMENTO': self.departments[place],
+            'COD_MUNICIPIO': self.municipalities[place],
+            'AÑO': np.full(rows, self.year, dtype='int64'),
+            'MES': rng.choice(np.arange(1, 13), size=rows, p=self.month_p),
+            'SEXO': rng.choice(list(SEX_WEIGHTS), size=rows, p=list(SEX_WEIGHTS.values())),
+            'GRUPO_EDAD1': ages,
+            'COD_MUERTE': self.causes[cause]
+        }, columns=COLUMNS)
+
+    def blocks(self, rows, block_rows=DEFAULT_BLOCK_ROWS):
+        """Bloques que suman `rows` registros"""
+        remaining = rows
+        while remaining > 0:
+            size = min(block_rows, remaining)
+            remaining -= size
+            yield self.block(size)
+
+
+def generate_records(rows, year=2019, seed=0, divipola=None, death_codes=None):
+    """DataFrame de `rows` registros sintéticos (en memoria)"""
+    generator = SyntheticMortality(divipola, death_codes, year, seed)
+    return pd.concat(generator.blocks(rows), ignore_index=True)
+
+
+def write_synthetic(rows, output=DEFAULT_OUTPUT, formats=('parquet',), year=2019, seed=0,
+                    block_rows=DEFAULT_BLOCK_ROWS):
+    """Escribe `rows` registros en cada formato pedido (`output` sin extensión).
+
+    Los bloques se agregan al archivo a medida que se generan, así que la
+    memoria no depende del total de filas. Retorna las rutas escritas.
+    """
+    formats = list(formats)
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError(f"Formatos desconocidos: {sorted(unknown)}")
+    if 'xlsx' in formats and rows > EXCEL_MAX_ROWS:
+        raise ValueError(f"Excel admite hasta {EXCEL_MAX_ROWS:,} filas por hoja; use csv o parquet")
+
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    paths = {fmt: f"{output}.{fmt}" for fmt in formats}
+    parquet_writer = None
+    workbook = sheet = None
+    if 'xlsx' in paths:
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(COLUMNS)
+
+    written = 0
+    generator = SyntheticMortality(year=year, seed=seed)
+    try:
+        for block in generator.blocks(rows, block_rows):
+            if 'parquet' in paths:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                table = pa.Table.from_pandas(block, preserve_index=False)
+                if parquet_writer is None:
+                    parquet_writer = pq.ParquetWriter(paths['parquet'], table.schema)
+                parquet_writer.write_table(table)
+            if 'csv' in paths:
+                block.to_csv(paths['csv'], mode='w' if written == 0 else 'a', header=written == 0, index=False)
+            if sheet is not None:
+                for row in block.itertuples(index=False):
+                    sheet.append([value.item() if hasattr(value, 'item') else value for value in row])
+            written += len(block)
+            print(f"  {written:,} / {rows:,} filas")
+    finally:
+        if parquet_writer is not None:
+            parquet_writer.close()
+    if workbook is not None:
+        workbook.save(paths['xlsx'])
+    return list(paths.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera defunciones sintéticas con el esquema de Anexo1")
+    parser.add_argument('--rows', type=int, default=ANEXO1_ROWS, help="Número de registros")
+    parser.add_argument('--year', type=int, default=2019, help="Valor de la columna AÑO")
+    parser.add_argument('--seed', type=int, default=0, help="Semilla aleatoria")
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=['parquet'], help="Formatos de salida")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="Ruta de salida sin extensión")
+    parser.add_argument('--block-rows', type=int, default=DEFAULT_BLOCK_ROWS, help="Filas generadas por bloque")
+    args = parser.parse_args()
+
+    for path in write_synthetic(args.rows, args.output, args.formats, args.year, args.seed, args.block_rows):
+        print(f"Escrito {path} ({os.path.getsize(path) / 2**20:.1f} MB)")
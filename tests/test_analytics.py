@@ -0,0 +1,95 @@
+"""Paridad entre el backend pandas y el backend DuckDB sobre datos sintéticos"""
+import os
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('duckdb')
+
+import analytics
+import icd10
+from analytics import DuckDBBackend, PandasBackend, check_parity
+from data_cache import DEATH_CODES_COLUMNS
+from ingest import build_store_cube, ingest_all
+from query_engine import MortalityQueryEngine
+from shared_dataset import map_frame, write_frame
+from synthetic_data import SyntheticMortality
+
+YEARS = [2019, 2020]
+ROWS_PER_YEAR = 20_000
+
+# (capítulo, letra, primer y último código de 3 caracteres)
+CHAPTERS = [(2, 'C', 15, 26), (9, 'I', 20, 25), (10, 'J', 12, 18), (16, 'P', 5, 9), (20, 'X', 85, 99),
+            (20, 'Y', 0, 9)]
+
+
+def _death_codes():
+    rows = []
+    for chapter, letter, first, last in CHAPTERS:
+        for number in range(first, last + 1):
+            code_3 = f"{letter}{number:02d}"
+            for digit in range(3):
+                rows.append([chapter, f"Capítulo {chapter}", code_3, f"Causa {code_3}", f"{code_3}{digit}",
+                             f"Causa {code_3}.{digit}"])
+    return pd.DataFrame(rows, columns=DEATH_CODES_COLUMNS)
+
+
+def _divipola():
+    # Municipios con el mismo nombre en departamentos distintos, como en el catálogo real
+    rows = []
+    for department in (5, 8, 11, 25, 76):
+        for municipality in (1, 2, 45, 100, 250):
+            rows.append([department, f"Departamento {department}", municipality, f"Municipio {municipality}"])
+    return pd.DataFrame(rows, columns=['COD_DEPARTAMENTO', 'DEPARTAMENTO', 'COD_MUNICIPIO', 'MUNICIPIO'])
+
+
+@pytest.fixture(scope='module')
+def backends(tmp_path_factory):
+    """Almacén multianual de registros sintéticos y los dos backends armados sobre él"""
+    root = tmp_path_factory.mktemp('analytics')
+    death_codes, divipola = _death_codes(), _divipola()
+    with pytest.MonkeyPatch.context() as patch:
+        # Las rutas de Data/ son relativas: todo queda dentro del directorio temporal
+        patch.chdir(root)
+        patch.setattr(icd10, '_loaded_index', None)
+        os.makedirs(os.path.join('Data', 'defunciones'))
+        for year in YEARS:
+            records = SyntheticMortality(divipola, death_codes, year=year, seed=year).block(ROWS_PER_YEAR)
+            records.to_csv(os.path.join('Data', 'defunciones', f"nofetal{year}.csv"), index=False)
+        ingest_all()
+
+        write_frame(build_store_cube(divipola=divipola), os.path.join('Data', 'cubo'))
+        cube = map_frame(os.path.join('Data', 'cubo'))
+        pandas_backend = PandasBackend(MortalityQueryEngine(cube, death_codes))
+        duckdb_backend = DuckDBBackend(death_codes, divipola)
+        yield pandas_backend, duckdb_backend, cube
+
+
+def test_duckdb_reads_every_partition(backends):
+    _, duckdb_backend, cube = backends
+    assert duckdb_backend.has_year
+    assert len(duckdb_backend.files) == len(YEARS) * 5
+    assert duckdb_backend.total({}) == int(cube['TOTAL_MUERTES'].sum()) == len(YEARS) * ROWS_PER_YEAR
+
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'anio': [2020]},
+    {'departamento': [5]},
+    {'departamento': [8, 76], 'sexo': [2]},
+    {'municipio': [11001, 25045]},
+    {'capitulo': [20]},
+    {'grupo_edad': list(range(0, 9)), 'anio': [2019]},
+    {'departamento': [99]},
+])
+def test_backends_match(backends, filters):
+    pandas_backend, duckdb_backend, _ = backends
+    differences, _ = check_parity(pandas_backend, duckdb_backend, filters, figures=False)
+    assert differences == []
+
+
+def test_default_check_filters_match(backends):
+    pandas_backend, duckdb_backend, cube = backends
+    for filters in analytics.default_check_filters(cube):
+        differences, _ = check_parity(pandas_backend, duckdb_backend, filters, figures=False)
+        assert differences == [], filters
@@ -0,0 +1,42 @@
+"""Lectura de varios Excel con caché Parquet"""
+import os
+
+import pandas as pd
+import pytest
+
+from data_cache import read_excel_many
+
+
+@pytest.fixture
+def workbooks(tmp_path, monkeypatch):
+    # Las rutas de Data/cache/ son relativas: la caché queda en el directorio temporal
+    monkeypatch.chdir(tmp_path)
+    paths = []
+    for name, rows in (('uno.xlsx', 3), ('dos.xlsx', 5)):
+        path = os.path.join(str(tmp_path), name)
+        pd.DataFrame({'A': range(rows), 'B': [f"fila {i}" for i in range(rows)]}).to_excel(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def test_missing_file_with_fresh_cache_is_returned_in_its_slot(workbooks):
+    first, second = workbooks
+    assert [len(df) for df in read_excel_many([(first, None), (second, None)])] == [3, 5]
+
+    # La caché de `first` sigue en el manifiesto, pero el Excel ya no existe
+    os.remove(first)
+    missing = os.path.join(os.path.dirname(first), 'nunca.xlsx')
+    results = read_excel_many([(first, None), (second, None), (missing, None)], return_exceptions=True)
+
+    assert isinstance(results[0], FileNotFoundError)
+    assert len(results[1]) == 5
+    assert isinstance(results[2], FileNotFoundError)
+
+
+def test_missing_file_raises_without_return_exceptions(workbooks):
+    first, second = workbooks
+    read_excel_many([(first, None)])
+    os.remove(first)
+
+    with pytest.raises(FileNotFoundError):
+        read_excel_many([(first, None), (second, None)])
@@ -0,0 +1,65 @@
+"""Ingesta al almacén multianual con códigos faltantes"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import icd10
+from data_cache import DEATH_CODES_COLUMNS
+from ingest import MISSING_CODE, build_store_cube, ingest_all, normalize_chunk
+from query_engine import MortalityQueryEngine
+from shared_dataset import map_frame, write_frame
+
+RECORDS = pd.DataFrame({
+    'COD_DEPARTAMENTO': [5, 5, 5, 11, 11, None],
+    'COD_MUNICIPIO': [1, 1, None, 1, 1, 1],
+    'AÑO': [2020, None, 2020, 2020, 2020, 2020],
+    'MES': [1, None, 3, 4, 5, 6],
+    'SEXO': [1, 2, None, 2, 1, 1],
+    'GRUPO_EDAD1': [10, 12, 14, None, 16, 18],
+    'COD_MUERTE': ['X950', 'I219', 'C169', '', 'J189', 'X950']
+})
+
+
+def test_normalize_chunk_fills_missing_codes():
+    normalized, dropped = normalize_chunk(RECORDS, 2020)
+
+    assert dropped == 1
+    assert all(not isinstance(dtype, pd.api.extensions.ExtensionDtype) for dtype in normalized.dtypes.drop('COD_MUERTE'))
+    assert normalized['AÑO'].tolist() == [2020] * 5
+    assert normalized['COD_MUNICIPIO'].tolist() == [1, 1, MISSING_CODE, 1, 1]
+    assert normalized['MES'].tolist() == [1, MISSING_CODE, 3, 4, 5]
+    assert normalized['SEXO'].tolist() == [1, 2, MISSING_CODE, 2, 1]
+    # 29 es el código del DANE para edad desconocida
+    assert normalized['GRUPO_EDAD1'].tolist() == [10, 12, 14, 29, 16]
+
+
+def test_store_cube_with_missing_codes_maps_and_indexes(tmp_path):
+    death_codes = pd.DataFrame(
+        [[20, 'Capítulo 20', 'X95', 'Agresión', 'X950', 'Agresión'],
+         [9, 'Capítulo 9', 'I21', 'Infarto', 'I219', 'Infarto'],
+         [2, 'Capítulo 2', 'C16', 'Tumor', 'C169', 'Tumor'],
+         [10, 'Capítulo 10', 'J18', 'Neumonía', 'J189', 'Neumonía']],
+        columns=DEATH_CODES_COLUMNS)
+    with pytest.MonkeyPatch.context() as patch:
+        # Las rutas de Data/ son relativas: todo queda dentro del directorio temporal
+        patch.chdir(tmp_path)
+        patch.setattr(icd10, '_loaded_index', None)
+        os.makedirs(os.path.join('Data', 'defunciones'))
+        RECORDS.to_csv(os.path.join('Data', 'defunciones', 'nofetal2020.csv'), index=False)
+        ingest_all()
+        cube = build_store_cube()
+
+        assert all(not isinstance(cube[column].dtype, pd.api.extensions.ExtensionDtype)
+                   for column in ['AÑO', 'COD_DEPARTAMENTO', 'COD_MUNICIPIO', 'MES', 'SEXO', 'GRUPO_EDAD1'])
+        assert int(cube['TOTAL_MUERTES'].sum()) == 5
+
+        write_frame(cube, os.path.join('Data', 'cubo'))
+        mapped = map_frame(os.path.join('Data', 'cubo'))
+        engine = MortalityQueryEngine(mapped, death_codes)
+
+    assert np.array_equal(mapped['SEXO'].to_numpy(), cube['SEXO'].to_numpy())
+    assert int(engine.filtered_cube({'sexo': [2]})['TOTAL_MUERTES'].sum()) == 2
+    assert int(engine.filtered_cube({'grupo_edad': [29]})['TOTAL_MUERTES'].sum()) == 1
+    assert int(engine.filtered_cube({'mes': [1, 3]})['TOTAL_MUERTES'].sum()) == 2
@@ -0,0 +1,70 @@
+"""Tasas crudas y ajustadas: edades desconocidas y población en riesgo según los filtros"""
+import numpy as np
+import pandas as pd
+
+from rates import PER, WHO_STANDARD, RatesEngine, age_code_bands
+
+
+def _population():
+    rows = [
+        [5, 1, sex, age, 1000]
+        for sex in (1, 2)
+        for age in range(0, 85, 5)
+    ]
+    return pd.DataFrame(rows, columns=['COD_DEPARTAMENTO', 'COD_MUNICIPIO', 'SEXO', 'EDAD', 'POBLACION'])
+
+
+def _cube(ages, deaths):
+    return pd.DataFrame({
+        'COD_DEPARTAMENTO': [5] * len(ages),
+        'COD_MUNICIPIO': [1] * len(ages),
+        'SEXO': [1] * len(ages),
+        'GRUPO_EDAD1': pd.array(ages, dtype='Float64'),
+        'TOTAL_MUERTES': deaths
+    })
+
+
+def test_age_code_bands_marks_unknown_codes():
+    bands = age_code_bands(pd.Series([0, 8, 9, 23, 24, 28, 29, None, 30, -3], dtype='Int16'))
+    assert bands.tolist() == [0, 0, 1, 15, 16, 16, -1, -1, -1, -1]
+
+
+def test_unknown_ages_count_only_in_crude_rate():
+    engine = RatesEngine(_population())
+    known = engine.rates(_cube([10, 24], [4, 6]))
+    with_unknown = engine.rates(_cube([10, 24, 29, None, 45], [4, 6, 3, 2, 5]))
+
+    assert with_unknown['MUERTES'].tolist() == [20]
+    assert with_unknown['HABITANTES_ANIO'].tolist() == known['HABITANTES_ANIO'].tolist()
+    assert np.isclose(with_unknown['TASA_CRUDA'].iloc[0], 2 * known['TASA_CRUDA'].iloc[0])
+    assert np.isclose(with_unknown['TASA_AJUSTADA'].iloc[0], known['TASA_AJUSTADA'].iloc[0])
+
+
+def test_bands_without_deaths_stay_in_denominator():
+    engine = RatesEngine(_population())
+    # Todas las defunciones en el grupo 10-14 (código 10); los demás grupos no tienen muertes
+    rates = engine.rates(_cube([10], [8]))
+
+    assert rates['HABITANTES_ANIO'].tolist() == [2 * 17 * 1000]
+    assert np.isclose(rates['TASA_CRUDA'].iloc[0], 8 / 34_000 * PER)
+    assert np.isclose(rates['TASA_AJUSTADA'].iloc[0], 8 / 2000 * WHO_STANDARD[2] / WHO_STANDARD.sum() * PER)
+
+
+def test_filters_define_population_at_risk():
+    engine = RatesEngine(_population())
+    # Mujeres de 10-19 años (códigos 10 y 11) en el primer trimestre; solo hay muertes de 10-14
+    filters = {'sexo': [2], 'grupo_edad': [10, 11], 'mes': [1, 2, 3]}
+    rates = engine.rates(_cube([10], [8]), filters=filters)
+
+    assert rates['HABITANTES_ANIO'].tolist() == [2 * 1000 / 4]
+    weights = WHO_STANDARD[[2, 3]] / WHO_STANDARD[[2, 3]].sum()
+    assert np.isclose(rates['TASA_AJUSTADA'].iloc[0], 8 / 250 * weights[0] * PER)
+
+
+def test_years_of_the_data_not_of_the_deaths():
+    engine = RatesEngine(_population())
+    cube = _cube([10], [8]).assign(**{'AÑO': 2020})
+
+    assert engine.rates(cube)['HABITANTES_ANIO'].tolist() == [34_000]
+    assert engine.rates(cube, years=[2019, 2020])['HABITANTES_ANIO'].tolist() == [68_000]
+    assert engine.rates(cube, filters={'anio': [2020]}, years=[2019, 2020])['HABITANTES_ANIO'].tolist() == [34_000]
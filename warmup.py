@@ -0,0 +1,148 @@
+"""
+Precarga en segundo plano y rutas de salud de la aplicación.
+
+Cada worker arranca un hilo que ejecuta los pasos de carga (leer el cubo,
+construir índices, precalcular figuras) mientras el servidor ya responde.
+El estado queda disponible en dos rutas de `app.server`:
+
+    /healthz  200 mientras el proceso esté vivo (500 si la precarga falló)
+    /readyz   200 solo cuando la precarga terminó; 503 mientras tanto
+
+Ambas responden JSON con la fase actual, los tiempos de cada paso y la
+versión de datos. gunicorn.conf.py además espera a que el worker esté listo
+antes de que acepte conexiones (ver wait_for_worker).
+"""
+import os
+import threading
+import time
+import traceback
+
+from flask import jsonify
+
+PHASE_PENDING = 'pendiente'
+PHASE_READY = 'listo'
+PHASE_ERROR = 'error'
+
+# Segundos que un worker de gunicorn espera la precarga antes de aceptar conexiones
+DEFAULT_WAIT_TIMEOUT = 120
+
+
+class Warmup:
+    """Ejecuta pasos de carga en un hilo y registra fase, tiempos y errores
+
+    `steps` es una lista de (nombre, función sin argumentos). Un paso puede
+    fijar `warmup.data_version` cuando la conozca.
+    """
+
+    def __init__(self, steps, data_version=None):
+        self.steps = steps
+        self.data_version = data_version
+        self.phase = PHASE_PENDING
+        self.timings = {}
+        self.error = None
+        self.started_at = time.time()
+        self._ready = threading.Event()
+        self._finished = threading.Event()
+        self._started = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Inicia el hilo de precarga (una sola vez)"""
+        with self._lock:
+            if self._thread is None:
+                self._started.set()
+                self._thread = threading.Thread(target=self.run, name='precarga', daemon=True)
+                self._thread.start()
+        return self
+
+    def run(self):
+        """Ejecuta los pasos en el hilo actual"""
+        self._started.set()
+        total_start = time.perf_counter()
+        for name, step in self.steps:
+            self.phase = name
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                self.timings[name] = round(time.perf_counter() - start, 3)
+                self.error = f"{type(e).__name__}: {e}"
+                self.phase = PHASE_ERROR
+                print(f"Error en la precarga ({name}): {self.error}")
+                traceback.print_exc()
+                self._finished.set()
+                return
+            self.timings[name] = round(time.perf_counter() - start, 3)
+
+        self.timings['total'] = round(time.perf_counter() - total_start, 3)
+        self.phase = PHASE_READY
+        print(f"Precarga completa en {self.timings['total']:.1f} s")
+        self._ready.set()
+        self._finished.set()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    @property
+    def started(self):
+        return self._started.is_set()
+
+    @property
+    def failed(self):
+        return self.phase == PHASE_ERROR
+
+    def wait(self, timeout=None):
+        """Espera a que la precarga termine (bien o mal); True si quedó lista"""
+        self._finished.wait(timeout)
+        return self.ready
+
+    def status(self):
+        return {
+            'fase': self.phase,
+            'listo': self.ready,
+            'error': self.error,
+            'version_datos': self.data_version,
+            'tiempos_s': dict(self.timings),
+            'activo_s': round(time.time() - self.started_at, 1),
+            'pid': os.getpid()
+        }
+
+    def register_routes(self, server):
+        """Agrega /healthz y /readyz al servidor Flask y registra la precarga en él"""
+        server.extensions['warmup'] = self
+
+        @server.route('/healthz')
+        def healthz():
+            return jsonify(self.status()), 500 if self.failed else 200
+
+        @server.route('/readyz')
+        def readyz():
+            return jsonify(self.status()), 200 if self.ready else 503
+
+        return self
+
+
+def warmup_enabled():
+    """La precarga se desactiva con WARMUP=0 (p. ej. al importar en scripts)"""
+    return os.environ.get('WARMUP', '1') != '0'
+
+
+def wait_for_worker(worker, timeout=None):
+    """Bloquea un worker de gunicorn hasta que su precarga termine.
+
+    Se llama desde post_worker_init: el worker no acepta conexiones hasta
+    retornar, así el balanceo solo llega a workers listos. Se notifica al
+    árbitro cada segundo para que no lo mate por timeout durante la espera.
+    """
+    warmup = getattr(worker.wsgi, 'extensions', {}).get('warmup')
+    if warmup is None or not warmup.started:
+        return
+    timeout = timeout if timeout is not None else float(os.environ.get('WARMUP_TIMEOUT', DEFAULT_WAIT_TIMEOUT))
+    deadline = time.monotonic() + timeout
+    while not warmup.wait(1):
+        worker.notify()
+        if warmup.failed or time.monotonic() > deadline:
+            break
+    worker.log.info("Worker %s: precarga %s %s", os.getpid(), warmup.phase, warmup.timings)